@@ -60,3 +60,62 @@ Create the name of the service account to use
 {{- default "default" .Values.serviceAccount.name }}
 {{- end }}
 {{- end }}
+
+{{/*
+Environment variables shared by the operator and the batch mode CronJob
+*/}}
+{{- define "uptimerobot-operator.env" -}}
+- name: UPTIMEROBOT_API_KEY
+  value: {{ required "uptimeRobotApiKey has not been provided!" .Values.uptimeRobotApiKey | quote }}
+- name: URO_EXCLUDED_DOMAINS
+  value: {{ .Values.excludedDomains | quote }}
+- name: URO_DEFAULT_HEADERS
+  value: {{ .Values.defaultHeaders | quote }}
+- name: URO_DEFAULT_MONITOR_TYPE
+  value: {{ .Values.defaultMonitorType | quote }}
+- name: URO_DISABLE_INGRESS_HANDLING
+  value: {{ .Values.disableIngressHandling | quote }}
+- name: URO_INGRESS_DIRECT_MODE
+  value: {{ .Values.ingressDirectMode | quote }}
+- name: URO_DEDUPLICATE_MONITORS
+  value: {{ .Values.deduplicateMonitors | quote }}
+- name: URO_TEARDOWN_CONCURRENCY
+  value: {{ .Values.teardownConcurrency | quote }}
+- name: URO_EVENTS_PER_OBJECT
+  value: {{ .Values.events.perObject | quote }}
+- name: URO_EVENTS_TOTAL
+  value: {{ .Values.events.total | quote }}
+- name: URO_EVENTS_WINDOW
+  value: {{ .Values.events.window | quote }}
+- name: URO_SKIP_CRD_REGISTRATION
+  value: {{ .Values.crds.install | quote }}
+{{- if .Values.journal.enabled }}
+- name: URO_JOURNAL_PATH
+  value: /var/lib/uptimerobot-operator/journal.db
+{{- end }}
+{{- if .Values.inventorySnapshot.enabled }}
+- name: URO_SNAPSHOT_CONFIGMAP
+  value: {{ printf "%s/%s-inventory" .Release.Namespace (include "uptimerobot-operator.fullname" .) | quote }}
+{{- end }}
+{{- if .Values.admissionWebhook.enabled }}
+- name: URO_ADMISSION_WEBHOOK_HOST
+  value: {{ printf "%s.%s.svc" (include "uptimerobot-operator.fullname" .) .Release.Namespace | quote }}
+- name: URO_ADMISSION_WEBHOOK_PORT
+  value: {{ .Values.admissionWebhook.port | quote }}
+- name: URO_ADMISSION_WEBHOOK_CERT
+  value: /etc/uptimerobot-operator/webhook/tls.crt
+- name: URO_ADMISSION_WEBHOOK_KEY
+  value: /etc/uptimerobot-operator/webhook/tls.key
+{{- end }}
+{{- end }}
+
+{{/*
+Name of the Secret holding the token of the alert webhook
+*/}}
+{{- define "uptimerobot-operator.alertWebhookSecret" -}}
+{{- if .Values.alertWebhook.existingSecret }}
+{{- .Values.alertWebhook.existingSecret }}
+{{- else }}
+{{- printf "%s-alert-webhook" (include "uptimerobot-operator.fullname" .) | trunc 63 | trimSuffix "-" }}
+{{- end }}
+{{- end }}
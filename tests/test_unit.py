@@ -1,10 +1,60 @@
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../ur_operator')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tools')))
 
-import pytest 
+import hashlib
+import json
+import logging
+import subprocess
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import kopf
+import pytest
+import requests
+import yaml
+from kubernetes.client.rest import ApiException
 
 import ur_operator.handlers as handlers
+from config import Config
+from api.rate_limiter import RateLimiter
+from api.circuit_breaker import CircuitBreaker, BreakerState
+from api import UptimeRobotPool
+from api.journal import Journal, CREATE, DELETE
+from api.inventory import Inventory, MONITOR, ALERT_CONTACT, MWINDOW
+from api.records import FIELDS, MonitorRecord, Record
+from api.batcher import Batcher
+from api.debouncer import Debouncer
+from api.snapshot import InventorySnapshot
+from crds import MonitorV1Beta1, AlertContactV1Beta1
+from handlers.common.handler_base import spec_hash
+from handlers.common.references import indexed_refs, resolve_refs
+from handlers.common.selectors import matches_selector
+from handlers.ingress import ingress_monitor_specs
+from import_uptimerobot import ManifestWriter, manifest, monitor_spec
+from handlers.admission import AdmissionHandler, validate_properties
+from handlers.common.planner import EDIT, RECREATE, changed_fields, edit_request, plan_update
+from reconcile import bounded_map, spec_diff
+from server import AlertReceiver, AlertServer, MonitorQuery, QueryServer
+from handlers.common.dedup import DEDUP_KEY, dedup_key, normalize_url
+from handlers.monitors import MonitorHandler, indexed_record
+from handlers.ingress import IngressHandler, MONITORS_ANNOTATION, direct_monitors
+from handlers.ingress import only_monitors_annotation_changed
+from handlers.public_status_page import SELECTED_ANNOTATION, selection_changed
+import handlers.common.handler_base as handler_base
+from api.event_budget import EventBudget
+from handlers.common.teardown import BulkTeardown
+from api.deadline import DEADLINE, DeadlineExceeded, Hedger, call_timeout, within_deadline
+from api.slo import SloReporter, downtime
+from api.json_stream import JsonStream, project
+import api.readiness as readiness
+import api.uptimerobot as uptimerobot_api
+import api.k8s as k8s_api
+from crds import ALL_CRDS, CRD_HASHES, SPEC_HASH_ANNOTATION, make_manifest
+from generate_crd_manifests import HASHES_PATH, TEMPLATE_PATH, render_hashes, render_template
 
 def test_monitor_type_changed_changed_type():
     assert handlers.type_changed([['change', ['spec', 'type']]])
@@ -41,4 +91,1177 @@ def test_get_identifier_missing():
     status = {}
 
     with pytest.raises(KeyError):
-        handlers.get_identifier(status)
\ No newline at end of file
+        handlers.get_identifier(status)
+
+def test_rate_limiter_allows_burst_up_to_capacity():
+    limiter = RateLimiter(600)
+    started = time.monotonic()
+    for _ in range(600):
+        limiter.acquire()
+
+    assert time.monotonic() - started < 1
+
+
+def test_rate_limiter_blocks_when_exhausted():
+    limiter = RateLimiter(600)
+    for _ in range(600):
+        limiter.acquire()
+    started = time.monotonic()
+    limiter.acquire()
+
+    assert time.monotonic() - started >= 0.05
+
+
+def make_breaker(**overrides):
+    config = SimpleNamespace(BREAKER_ERROR_RATE=0.5, BREAKER_LATENCY=10., BREAKER_COOLDOWN=0.05,
+                             BREAKER_HALF_OPEN_PROBES=1, BREAKER_MAX_PARK=1.,
+                             BREAKER_RELEASE_RATE=6000.)
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return CircuitBreaker(config, RateLimiter(6000))
+
+
+def failing_call():
+    raise requests.ConnectionError()
+
+
+def test_circuit_breaker_opens_on_error_rate():
+    breaker = make_breaker()
+    for _ in range(5):
+        with pytest.raises(requests.ConnectionError):
+            breaker.call(failing_call)
+
+    assert breaker.state == BreakerState.OPEN
+    with pytest.raises(kopf.TemporaryError):
+        breaker.call(lambda: 'ok', mutation=False)
+
+
+def test_circuit_breaker_parks_mutations_until_recovered():
+    breaker = make_breaker()
+    for _ in range(5):
+        with pytest.raises(requests.ConnectionError):
+            breaker.call(failing_call)
+
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_circuit_breaker_gives_up_parking_after_max_park():
+    breaker = make_breaker(BREAKER_COOLDOWN=10., BREAKER_MAX_PARK=0.05)
+    for _ in range(5):
+        with pytest.raises(requests.ConnectionError):
+            breaker.call(failing_call)
+
+    with pytest.raises(kopf.TemporaryError):
+        breaker.call(lambda: 'ok')
+
+
+def test_journal_keeps_completed_create_across_restarts(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = Journal(path)
+    entry_id = journal.intend('monitor', 'default', 'foo', CREATE)
+    journal.complete(entry_id, 123)
+
+    assert Journal(path).unconfirmed_create('monitor', 'default', 'foo') == (entry_id, '123', True)
+
+
+def test_journal_confirm_drops_create():
+    journal = Journal()
+    journal.complete(journal.intend('monitor', 'default', 'foo', CREATE), 123)
+    journal.confirm('monitor', 'default', 'foo', '123')
+
+    assert journal.unconfirmed_create('monitor', 'default', 'foo') is None
+
+
+def test_journal_pending_deletes():
+    journal = Journal()
+    pending = journal.intend('psp', 'default', 'foo', DELETE, 1)
+    journal.complete(journal.intend('psp', 'default', 'bar', DELETE, 2), 2)
+
+    assert journal.pending_deletes() == [(pending, 'psp', 'default', 'foo', '1')]
+
+
+def test_journal_replay_deletes_creates_of_resources_that_are_gone():
+    journal = Journal()
+    for name, uid in (('gone', 1), ('alive', 2), ('web/gone', 3)):
+        journal.complete(journal.intend('monitor', 'default', name, CREATE), uid)
+    journal.intend('monitor', 'default', 'interrupted', CREATE)
+    deleted = []
+    pool = SimpleNamespace(journal=journal, for_namespace=lambda namespace: SimpleNamespace(
+        delete=lambda kind, logger, uid: deleted.append(uid)))
+    logger = SimpleNamespace(info=lambda msg: None, warning=lambda msg: None)
+
+    UptimeRobotPool.replay_journal(pool, logger, lambda kind, namespace, name: 'gone' in name)
+    assert deleted == ['1', '3']
+    assert journal.unconfirmed_create('monitor', 'default', 'gone') is None
+    assert journal.unconfirmed_create('monitor', 'default', 'alive') is not None
+    # without the ID of an interrupted create there is nothing to delete
+    assert journal.unconfirmed_create('monitor', 'default', 'interrupted') is not None
+
+
+def test_spec_hash_ignores_fields_not_returned_by_uptimerobot():
+    request = {'friendly_name': 'foo', 'url': 'https://foo.com', 'type': 1, 'interval': 600}
+    listed = {'friendly_name': 'foo', 'url': 'https://foo.com', 'type': '1', 'interval': 600}
+
+    assert spec_hash(MonitorV1Beta1, {**request, 'http_password': 'secret'}) == \
+        spec_hash(MonitorV1Beta1, listed)
+
+
+def test_spec_hash_changes_with_url():
+    request = {'friendly_name': 'foo', 'url': 'https://foo.com', 'type': 1}
+
+    assert spec_hash(MonitorV1Beta1, request) != \
+        spec_hash(MonitorV1Beta1, {**request, 'url': 'https://bar.com'})
+
+
+def test_inventory_drops_credentials():
+    inventory = Inventory()
+    inventory.replace(MONITOR, [(1, {'friendly_name': 'foo', 'http_password': 'secret'})])
+
+    assert inventory.get(MONITOR, '1') == {'friendly_name': 'foo'}
+
+
+def test_inventory_records_are_compact():
+    responses = [{'id': uid, 'friendly_name': f'monitor-{uid}', 'url': f'https://{uid}.example.com',
+                  'type': 1, 'sub_type': '', 'port': '', 'keyword_value': '', 'interval': 300,
+                  'status': 2} for uid in range(10_000)]
+
+    def allocated(build):
+        tracemalloc.start()
+        objects = [build(props) for props in responses]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(objects) == len(responses)
+        return size / len(responses)
+
+    as_dict = allocated(lambda props: {k: v for k, v in props.items() if k in FIELDS})
+    as_record = allocated(Record)
+    # bytes per object, the values themselves are shared with the responses
+    assert as_record < as_dict / 2
+
+    record = Record(responses[0])
+    assert record.get('url') == 'https://0.example.com'
+    assert record.get('duration') is None and record.get('id', 'missing') == 'missing'
+    record.update({'status': 9})
+    assert record.to_dict()['status'] == 9
+
+
+def test_monitor_records_are_compact():
+    meta = {'ownerReferences': [{'kind': 'Ingress', 'name': 'web'}]}
+    status = {'on_create_mon': {'monitor_id': 42, 'spec_hash': 'abc'}, 'alert': {'state': 'DOWN'}}
+    events = ('on_create_mon', 'on_update_mon')
+    record = indexed_record('default', 'foo', meta, {'url': 'https://foo.com'}, status, events)
+    assert record == MonitorRecord('default', 'foo', 'web', '42', 'abc', 'https://foo.com', 'DOWN')
+    assert record.key == ('default', 'foo')
+    assert indexed_record('default', 'bar', {}, {}, {}, events).uid is None
+
+    bodies = [{'metadata': {'namespace': 'default', 'name': f'web-{uid}', **meta},
+               'spec': {'url': f'https://{uid}.example.com', 'type': 'HTTPS'},
+               'status': {'on_create_mon': {'monitor_id': uid, 'spec_hash': f'{uid:016x}'}}}
+              for uid in range(10_000)]
+
+    def allocated(build):
+        tracemalloc.start()
+        objects = [build(body) for body in bodies]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(objects) == len(bodies)
+        return size / len(bodies)
+
+    as_dict = allocated(lambda body: {'metadata': dict(body['metadata']), 'spec': dict(body['spec']),
+                                      'status': {k: dict(v) for k, v in body['status'].items()}})
+    as_record = allocated(lambda body: indexed_record(
+        body['metadata']['namespace'], body['metadata']['name'], body['metadata'], body['spec'],
+        body['status'], events))
+    # bytes per monitor, only the ID is converted, all other values are shared with the body
+    assert as_record < as_dict / 4
+
+
+def make_snapshot(path):
+    return InventorySnapshot(SimpleNamespace(SNAPSHOT_PATH=path, SNAPSHOT_CONFIGMAP=None,
+                                             SNAPSHOT_INTERVAL=300., SNAPSHOT_MAX_AGE=60.))
+
+
+def test_inventory_snapshot_round_trip(tmp_path):
+    inventory = Inventory()
+    inventory.replace(MONITOR, [(1, {'friendly_name': 'foo', 'url': 'https://foo.com'})])
+    client = SimpleNamespace(fingerprint='abc', inventory=inventory)
+    make_snapshot(str(tmp_path / 'snapshot')).save([client])
+
+    assert make_snapshot(str(tmp_path / 'snapshot')).restore('abc', MONITOR) == \
+        {'1': {'friendly_name': 'foo', 'url': 'https://foo.com'}}
+
+
+def test_inventory_snapshot_does_not_overwrite_with_restored_objects(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    inventory = Inventory()
+    inventory.restore(MONITOR, {'1': {'friendly_name': 'foo'}})
+    make_snapshot(path).save([SimpleNamespace(fingerprint='abc', inventory=inventory)])
+
+    assert make_snapshot(path).restore('abc', MONITOR) is None
+
+
+def test_batcher_coalesces_concurrent_lookups():
+    calls = []
+
+    def fetch(keys):
+        calls.append(keys)
+        return {key: key.upper() for key in keys if key != 'missing'}
+
+    batcher = Batcher(fetch, window=0.1)
+    results = {}
+    threads = [threading.Thread(target=lambda key=key: results.update({key: batcher.get(key)}))
+               for key in ['a', 'b', 'missing']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {'a': 'A', 'b': 'B', 'missing': None}
+    assert len(calls) == 1
+
+
+def test_resolve_refs_appends_ids_to_explicit_ones():
+    ids = {ALERT_CONTACT: {('default', 'team'): ['123']}, MWINDOW: {('default', 'nightly'): ['7']}}
+    request = {'alert_contacts': '1_0_0', 'alert_contact_refs': 'team_5_0', 'mwindow_refs': 'nightly'}
+
+    assert resolve_refs('default', request, ids) == {'alert_contact/team': '123', 'mwindow/nightly': '7'}
+    assert request == {'alert_contacts': '1_0_0-123_5_0', 'mwindows': '7'}
+
+
+def test_resolve_refs_waits_for_missing_reference():
+    with pytest.raises(kopf.TemporaryError):
+        resolve_refs('default', {'alert_contact_refs': 'team'}, {ALERT_CONTACT: {}, MWINDOW: {}})
+
+
+def test_indexed_refs_contains_resolved_ids():
+    status = {'on_create_mon': {'monitor_id': 1, 'refs': {'alert_contact/team': '123'}}}
+
+    assert indexed_refs('default', 'foo', {'alertContactRefs': 'team_0_0,ops'}, status,
+                        ('on_create_mon', 'on_update_mon')) == {
+        ('default', ALERT_CONTACT, 'team'): ('foo', '123'),
+        ('default', ALERT_CONTACT, 'ops'): ('foo', None)
+    }
+
+
+def test_matches_selector():
+    selector = {'matchLabels': {'team': 'a'},
+                'matchExpressions': [{'key': 'env', 'operator': 'In', 'values': ['prod', 'staging']},
+                                     {'key': 'legacy', 'operator': 'DoesNotExist'}]}
+
+    assert matches_selector(selector, {'team': 'a', 'env': 'prod'})
+    assert not matches_selector(selector, {'team': 'b', 'env': 'prod'})
+    assert not matches_selector(selector, {'team': 'a', 'env': 'dev'})
+    assert not matches_selector(selector, {'team': 'a', 'env': 'prod', 'legacy': 'true'})
+
+
+def test_debouncer_collapses_triggers():
+    calls = []
+    debouncer = Debouncer(calls.append, 0.1)
+    for _ in range(5):
+        debouncer.trigger('page')
+    debouncer.trigger('other')
+    time.sleep(0.3)
+
+    assert sorted(calls) == ['other', 'page']
+
+
+def plan_ac(spec, diff):
+    request = AlertContactV1Beta1.spec_to_request_dict('foo', spec)
+    return plan_update(AlertContactV1Beta1, request,
+                       changed_fields(AlertContactV1Beta1, 'foo', spec, diff))
+
+
+def test_planner_edits_alert_contact_name_in_place():
+    spec = {'type': 'EMAIL', 'value': 'foo@bar.com', 'friendlyName': 'bar'}
+
+    assert plan_ac(spec, [('change', ('spec', 'friendlyName'), 'foo', 'bar')]) == EDIT
+    assert edit_request(AlertContactV1Beta1, AlertContactV1Beta1.spec_to_request_dict('foo', spec)) == \
+        {'friendly_name': 'bar'}
+
+
+def test_planner_recreates_alert_contact_on_value_change_unless_web_hook():
+    diff = [('change', ('spec', 'value'), 'old', 'new')]
+
+    assert plan_ac({'type': 'EMAIL', 'value': 'new'}, diff) == RECREATE
+    assert plan_ac({'type': 'WEB_HOOK', 'value': 'new'}, diff) == EDIT
+
+
+def test_planner_edits_monitor_switched_from_http_to_https():
+    spec = {'type': 'HTTPS', 'url': 'https://foo.com'}
+    diff = [('change', ('spec', 'type'), 'HTTP', 'HTTPS'),
+            ('change', ('spec', 'url'), 'http://foo.com', 'https://foo.com')]
+    changed = changed_fields(MonitorV1Beta1, 'foo', spec, diff)
+
+    assert changed == {'url'}
+    assert plan_update(MonitorV1Beta1, MonitorV1Beta1.spec_to_request_dict('foo', spec), changed) == EDIT
+
+
+def test_validate_properties():
+    assert validate_properties(MonitorV1Beta1, {'url': 'foo.com', 'type': 'HTTPS', 'interval': 300}) == []
+    assert validate_properties(MonitorV1Beta1, {'type': 'HTTP', 'interval': 90, 'foo': 'bar'}) == [
+        'url is required', 'interval must be a multiple of 60', 'unknown property foo']
+    assert validate_properties(MonitorV1Beta1, {'url': 'foo.com', 'type': 'SMTP'}) == [
+        'type must be one of: HTTP,HTTPS,KEYWORD,PING,PORT,HEARTBEAT']
+
+
+def make_admission_handler(account, monitors):
+    inventory = Inventory()
+    inventory.replace(MONITOR, [(uid, {}) for uid in range(monitors)])
+    client = SimpleNamespace(inventory=inventory, account_details=lambda: account)
+    return AdmissionHandler(SimpleNamespace(for_namespace=lambda namespace: client))
+
+
+def test_admission_rejects_monitors_past_account_limits():
+    handler = make_admission_handler({'monitor_limit': '50', 'monitor_interval': '5'}, 50)
+
+    with pytest.raises(kopf.AdmissionError, match='monitor limit of 50') as error:
+        handler.validate(MonitorV1Beta1, 'default', {'url': 'foo.com', 'interval': 60}, 'CREATE', None)
+    assert 'interval must be at least 300 seconds' in str(error.value)
+
+
+def test_admission_ignores_unchanged_specs():
+    handler = make_admission_handler({'monitor_limit': '50', 'monitor_interval': '5'}, 0)
+    spec = {'url': 'foo.com', 'interval': 60}
+
+    handler.validate(MonitorV1Beta1, 'default', spec, 'UPDATE', {'spec': spec})
+
+
+def test_ingress_monitor_specs_per_host():
+    config = SimpleNamespace(DEFAULT_MONITOR_TYPE='HTTPS', EXCLUDED_DOMAINS=('default.local',))
+    spec = {'rules': [{'host': 'foo.com'}, {'host': 'bar.com'}, {'host': '*.foo.com'},
+                      {'host': 'baz.default.local'}]}
+    annotations = {'uptimerobot.twinhats.com/monitor.interval': '600'}
+
+    specs = ingress_monitor_specs(config, 'my-ingress', annotations, spec,
+                                  SimpleNamespace(info=print, debug=print))
+
+    assert sorted(s['url'] for s in specs.values()) == ['https://bar.com', 'https://foo.com']
+    assert all(s['interval'] == 600 for s in specs.values())
+
+
+def test_import_monitor_spec_reverses_enums_and_references():
+    obj = {'id': 42, 'friendly_name': 'Foo', 'url': 'https://foo.com', 'type': 1, 'sub_type': '',
+           'keyword_type': None, 'interval': 300,
+           'alert_contacts': [{'id': '7', 'threshold': 0, 'recurrence': 0},
+                              {'id': '8', 'threshold': 5, 'recurrence': 1}],
+           'mwindows': [{'id': 3}]}
+
+    imported = manifest(MonitorV1Beta1, 'default', 'foo-42', obj,
+                        monitor_spec(obj, {'7': 'team-7'}, {'3': 'nightly-3'}))
+
+    assert imported['spec'] == {'url': 'https://foo.com', 'type': 'HTTPS', 'friendlyName': 'Foo',
+                                'interval': 300, 'alertContactRefs': 'team-7_0_0',
+                                'alertContacts': '8_5_1', 'mwindowRefs': 'nightly-3'}
+    assert imported['status'] == {'on_create_mon': {'monitor_id': '42'}}
+
+
+def test_manifest_writer_chunks(tmp_path):
+    writer = ManifestWriter(str(tmp_path), 'monitors', 2)
+    for uid in range(5):
+        writer.write({'metadata': {'name': f'm{uid}'}})
+    writer.close()
+
+    assert sorted(os.listdir(tmp_path)) == ['monitors-0000.yaml', 'monitors-0001.yaml',
+                                            'monitors-0002.yaml']
+    with open(tmp_path / 'monitors-0001.yaml', encoding='utf-8') as chunk:
+        assert [doc['metadata']['name'] for doc in yaml.safe_load_all(chunk)] == ['m2', 'm3']
+
+
+def test_bounded_map_limits_concurrency():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return item * 2
+
+    consumed = []
+    items = (consumed.append(i) or i for i in range(20))
+
+    results = bounded_map(work, items, 3)
+    first = next(results)
+    # items are pulled from the listing as calls complete, not all at once
+    assert len(consumed) <= 4
+
+    assert sorted([first, *results]) == [i * 2 for i in range(20)]
+    assert peak[0] <= 3
+
+
+def test_spec_diff_feeds_planner():
+    old = {'url': 'http://foo.com', 'type': 'HTTP', 'interval': 300}
+    new = {'url': 'https://foo.com', 'type': 'HTTPS', 'friendlyName': 'Foo'}
+
+    diff = spec_diff(old, new)
+
+    assert diff == [('add', ('spec', 'friendlyName'), None, 'Foo'),
+                    ('remove', ('spec', 'interval'), 300, None),
+                    ('change', ('spec', 'type'), 'HTTP', 'HTTPS'),
+                    ('change', ('spec', 'url'), 'http://foo.com', 'https://foo.com')]
+    changed = changed_fields(MonitorV1Beta1, 'foo', new, diff)
+    assert plan_update(MonitorV1Beta1, MonitorV1Beta1.spec_to_request_dict('foo', new),
+                       changed) == EDIT
+
+
+def query_fixture():
+    inventory = Inventory()
+    inventory.replace(MONITOR, [('1', {'friendly_name': 'foo', 'url': 'https://foo.com', 'status': 2}),
+                                ('2', {'friendly_name': 'bar', 'url': 'https://bar.com', 'status': 9}),
+                                ('3', {'friendly_name': 'baz', 'url': 'https://baz.com', 'status': 0})])
+    loads = []
+    client = SimpleNamespace(fingerprint='abc', inventory=inventory,
+                             load_inventory=lambda kind, max_age: loads.append(kind))
+    records = {'default': [MonitorRecord('default', 'foo', 'my-ingress', '1'),
+                           MonitorRecord('default', 'bar', None, '2')],
+               'default-b': [MonitorRecord('default-b', 'baz', 'my-ingress', '3'),
+                             MonitorRecord('default-b', 'new')]}
+    return MonitorQuery(SimpleNamespace(for_namespace=lambda namespace: client), records, 60), loads
+
+
+def test_monitor_query_filters_and_paginates():
+    query, loads = query_fixture()
+
+    assert [m['name'] for m in query.query(ingress='my-ingress')['items']] == ['foo', 'baz']
+    assert query.query(status='DOWN')['items'][0]['url'] == 'https://bar.com'
+    assert query.query(namespace='default-b', status='PENDING')['items'][0]['name'] == 'new'
+    assert query.query(uid='3')['items'][0]['status'] == 'PAUSED'
+
+    pages, after = [], None
+    while True:
+        page = query.query(limit=3, after=after)
+        pages.append([f'{m["namespace"]}/{m["name"]}' for m in page['items']])
+        after = page['continue']
+        if after is None:
+            break
+    assert pages == [['default/bar', 'default/foo', 'default-b/baz'], ['default-b/new']]
+    # one inventory load per account and query
+    assert len(loads) == 5
+
+
+def test_query_server_serves_monitors():
+    query, _ = query_fixture()
+    server = QueryServer(query, '127.0.0.1', 0)
+    server.start()
+    try:
+        base = f'http://127.0.0.1:{server.server.server_port}'
+        resp = requests.get(f'{base}/monitors', params={'namespace': 'default', 'limit': 1},
+                            timeout=5)
+        assert resp.json() == {'items': [{'namespace': 'default', 'name': 'bar', 'ingress': None,
+                                          'id': '2', 'friendlyName': 'bar',
+                                          'url': 'https://bar.com', 'status': 'DOWN'}],
+                               'continue': 'default/bar'}
+        assert requests.get(f'{base}/monitors', params={'limit': 0}, timeout=5).status_code == 400
+        assert requests.get(f'{base}/foo', timeout=5).status_code == 404
+    finally:
+        server.stop()
+
+
+def test_monitor_query_tries_failing_accounts_once_per_request():
+    query, _ = query_fixture()
+    calls = {'secrets': 0, 'loads': 0}
+
+    def load_inventory(kind, max_age):
+        calls['loads'] += 1
+        raise requests.RequestException('timeout')
+
+    def for_namespace(namespace):
+        calls['secrets'] += 1
+        return SimpleNamespace(fingerprint='abc', load_inventory=load_inventory)
+
+    query.uptime_robots = SimpleNamespace(for_namespace=for_namespace)
+    assert {m['status'] for m in query.query()['items']} == {'UNKNOWN', 'PENDING'}
+    # neither other monitors of the namespace nor other namespaces of the account retry
+    assert calls == {'secrets': 2, 'loads': 1}
+
+
+def test_query_server_survives_failing_accounts():
+    query, _ = query_fixture()
+    accounts = {'default': ApiException(status=403), 'default-b': RuntimeError('invalid key')}
+
+    def for_namespace(namespace):
+        raise accounts[namespace]
+
+    query.uptime_robots = SimpleNamespace(for_namespace=for_namespace)
+    # the monitors of an account that cannot be read are still listed
+    assert {m['status'] for m in query.query(namespace='default')['items']} == {'UNKNOWN'}
+
+    server = QueryServer(query, '127.0.0.1', 0)
+    server.start()
+    try:
+        base = f'http://127.0.0.1:{server.server.server_port}'
+        assert requests.get(f'{base}/monitors', params={'namespace': 'default'},
+                            timeout=5).status_code == 200
+        assert requests.get(f'{base}/monitors', timeout=5).status_code == 503
+    finally:
+        server.stop()
+
+
+def test_status_page_keeps_selection_unless_selector_or_selection_changed():
+    assert not selection_changed(('spec', 'friendlyName'))
+    assert not selection_changed(('spec', 'monitors'))
+    assert selection_changed(('spec', 'monitorSelector', 'matchLabels'))
+    assert selection_changed(('metadata', 'annotations', SELECTED_ANNOTATION))
+    assert selection_changed(('spec',))
+
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://Foo.com:443/') == 'https://foo.com'
+    assert normalize_url('http://foo.com:8080/bar?baz=1') == 'http://foo.com:8080/bar?baz=1'
+    assert normalize_url('Foo.com') == 'foo.com'
+
+
+def test_dedup_key_cannot_be_guessed_without_the_account_secret():
+    request = {'url': 'https://foo.com', 'http_username': 'admin', 'http_password': 'hunter2'}
+    key = dedup_key(request, b'secret')
+    assert key == dedup_key(dict(reversed(request.items())), b'secret')
+    assert key != dedup_key(request, b'other')
+    assert key != hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def test_shared_monitor_deleted_with_last_owner(monkeypatch):
+    monkeypatch.setenv('URO_DEDUPLICATE_MONITORS', 'true')
+    monkeypatch.setattr(handler_base, 'K8s', lambda crd: SimpleNamespace(
+        update_resource=lambda *args, **kwargs: None))
+    calls = []
+    inventory = Inventory()
+
+    def create(kind, logger, props):
+        calls.append(('create', props['url']))
+        inventory.put(kind, '100', props)
+        return '100'
+
+    client = SimpleNamespace(fingerprint='abc', hash_secret=b'secret', inventory=inventory,
+                             load_inventory=lambda kind: None, create=create,
+                             delete=lambda kind, logger, uid: calls.append(('delete', uid)))
+    pool = SimpleNamespace(for_namespace=lambda namespace: client, journal=Journal())
+    shares = {}
+    handler = MonitorHandler(pool, 'on_create_mon', 'on_update_mon',
+                             {ALERT_CONTACT: {}, MWINDOW: {}}, {}, shares)
+    logger = SimpleNamespace(info=lambda msg: None, debug=lambda msg: None)
+
+    statuses = {}
+    for namespace, url in (('blue', 'foo.com'), ('green', 'https://FOO.com/')):
+        result = handler.on_create(namespace, 'foo', {'url': url, 'type': 'HTTPS'}, logger)
+        statuses[namespace] = {'on_create_mon': result}
+        shares.setdefault(result[DEDUP_KEY], []).append(
+            MonitorRecord(namespace, 'foo', uid=result['monitor_id']))
+
+    assert calls == [('create', 'https://foo.com')]
+    assert statuses['blue'] == statuses['green']
+
+    handler.on_delete('blue', 'foo', statuses['blue'], logger)
+    assert calls == [('create', 'https://foo.com')]
+    assert list(handler._MonitorHandler__released) == [('blue', 'foo')]
+    # blue is gone from the index once deleted, it is not remembered any longer
+    key = statuses['blue']['on_create_mon'][DEDUP_KEY]
+    shares[key] = [record for record in shares[key] if record.namespace != 'blue']
+    handler.on_delete('green', 'foo', statuses['green'], logger)
+    assert calls == [('create', 'https://foo.com'), ('delete', '100')]
+    assert not handler._MonitorHandler__released
+
+
+def test_ingress_direct_mode_manages_monitors(monkeypatch):
+    monkeypatch.setenv('URO_INGRESS_DIRECT_MODE', 'true')
+    monkeypatch.setenv('URO_EXCLUDED_DOMAINS', 'default.local')
+    monkeypatch.setattr(handler_base, 'K8s', lambda crd: SimpleNamespace(
+        list_resource=lambda namespace: []))
+    calls = []
+    inventory = Inventory()
+    inventory.replace(MONITOR, [])
+
+    def create(kind, logger, props):
+        uid = str(100 + len(calls))
+        calls.append(('create', props['url']))
+        inventory.put(kind, uid, props)
+        return uid
+
+    def update_monitor(props, uid, logger):
+        calls.append(('edit', uid, props['interval']))
+        inventory.put(MONITOR, uid, props)
+        return uid
+
+    client = SimpleNamespace(fingerprint='abc', hash_secret=b'secret', inventory=inventory,
+                             load_inventory=lambda kind: None, create=create,
+                             update_monitor=update_monitor,
+                             delete=lambda kind, logger, uid: calls.append(('delete', uid)))
+    pool = SimpleNamespace(for_namespace=lambda namespace: client, journal=Journal())
+    handler = IngressHandler(pool, 'on_create_ingress', 'on_update_ingress')
+    logger = SimpleNamespace(info=lambda msg: None, debug=lambda msg: None)
+    spec = {'rules': [{'host': 'foo.com'}, {'host': 'bar.com'}]}
+
+    patch = kopf.Patch()
+    handler.on_create('my-ingress', 'default', {}, spec, logger, patch)
+    annotations = dict(patch['metadata']['annotations'])
+    assert calls == [('create', 'https://foo.com'), ('create', 'https://bar.com')]
+    assert sorted(m['id'] for m in direct_monitors(annotations).values()) == ['100', '101']
+
+    # unchanged ingresses do not touch UptimeRobot
+    patch = kopf.Patch()
+    handler.on_update('my-ingress', 'default', annotations, spec, logger, patch)
+    assert len(calls) == 2
+    assert patch['metadata']['annotations'][MONITORS_ANNOTATION] == annotations[MONITORS_ANNOTATION]
+
+    annotations['uptimerobot.twinhats.com/monitor.interval'] = '600'
+    patch = kopf.Patch()
+    handler.on_update('my-ingress', 'default', annotations, {'rules': [{'host': 'foo.com'}]},
+                      logger, patch)
+    assert calls[2:] == [('edit', '100', 600), ('delete', '101')]
+
+
+def test_ingress_update_ignores_its_own_monitors_annotation():
+    monitor_type = f'{MonitorV1Beta1.group()}/monitor.type'
+    written = [('add', ('metadata', 'annotations', MONITORS_ANNOTATION), None, '{}')]
+    assert only_monitors_annotation_changed(written)
+    first = [('add', ('metadata', 'annotations'), None, {MONITORS_ANNOTATION: '{}'})]
+    assert only_monitors_annotation_changed(first)
+
+    edited = [('change', ('metadata', 'annotations', monitor_type), 'HTTPS', 'KEYWORD')]
+    assert not only_monitors_annotation_changed(written + edited)
+    assert not only_monitors_annotation_changed(
+        [('change', ('spec', 'rules'), [], [{'host': 'foo.com'}])])
+    assert not only_monitors_annotation_changed(
+        [('add', ('metadata', 'annotations'), None, {monitor_type: 'HTTPS'})])
+
+
+def test_ingress_switched_to_direct_mode_does_not_adopt_monitors_of_objects(monkeypatch):
+    monkeypatch.setenv('URO_INGRESS_DIRECT_MODE', 'true')
+    monkeypatch.setenv('URO_EXCLUDED_DOMAINS', 'default.local')
+    logger = SimpleNamespace(info=lambda msg: None, debug=lambda msg: None)
+    spec = {'rules': [{'host': 'foo.com'}]}
+    name = next(iter(ingress_monitor_specs(Config(), 'my-ingress', {}, spec, logger)))
+    deleted = []
+    objects = [{'metadata': {'name': name, 'ownerReferences': [{'name': 'my-ingress'}]}}]
+    monkeypatch.setattr(handler_base, 'K8s', lambda crd: SimpleNamespace(
+        list_resource=lambda namespace: objects,
+        delete_resource=lambda namespace, name: deleted.append(name)))
+    inventory = Inventory()
+    inventory.replace(MONITOR, [('50', {'url': 'https://foo.com'})])
+    calls = []
+
+    def create(kind, logger, props):
+        calls.append(('create', props['url']))
+        inventory.put(kind, '100', props)
+        return '100'
+
+    client = SimpleNamespace(fingerprint='abc', hash_secret=b'secret', inventory=inventory,
+                             load_inventory=lambda kind: None, create=create,
+                             delete=lambda kind, logger, uid: calls.append(('delete', uid)))
+    journal = Journal()
+    # the UptimeRobotMonitor object was created, but its ID was never confirmed
+    journal.complete(journal.intend(MONITOR, 'default', name, CREATE), '50')
+    pool = SimpleNamespace(for_namespace=lambda namespace: client, journal=journal)
+    handler = IngressHandler(pool, 'on_create_ingress', 'on_update_ingress')
+
+    patch = kopf.Patch()
+    handler.on_update('my-ingress', 'default', {}, spec, logger, patch)
+
+    # the monitor of the object is deleted by its finalizer, the ingress gets its own
+    assert deleted == [name]
+    assert calls == [('create', 'https://foo.com')]
+    assert direct_monitors(patch['metadata']['annotations'])[name]['id'] == '100'
+    assert journal.unconfirmed_create(MONITOR, 'default', name)[1] == '50'
+
+
+def test_event_budget_aggregates_repeats_and_limits_objects():
+    now = [0.]
+    budget = EventBudget(per_object=2, total=3, window=60, clock=lambda: now[0])
+
+    def post(uid, msg):
+        record = logging.LogRecord('kopf.objects', logging.INFO, __file__, 0, msg, None, None)
+        record.k8s_ref = {'uid': uid, 'name': uid}
+        assert budget.filter(record)
+        return None if getattr(record, 'k8s_skip', False) else record.getMessage()
+
+    assert post('a', 'updating') == 'updating'
+    assert post('a', 'updating') is None
+    assert post('a', 'updating') is None
+    assert post('a', 'created') == 'created'
+    assert post('a', 'deleted') is None
+    assert post('b', 'created') == 'created'
+    assert post('c', 'created') is None
+    assert post('b', 'x' * 300) is None
+
+    now[0] = 61
+    assert post('a', 'updating') == 'updating (2 more times since the last event)'
+    assert post('c', 'created') == 'created (1 more times since the last event)'
+
+
+def test_event_budget_ignores_records_kopf_does_not_post():
+    budget = EventBudget(per_object=1, total=1, window=60, level=logging.INFO, clock=lambda: 0)
+
+    def post(level, msg):
+        record = logging.LogRecord('kopf.objects', level, __file__, 0, msg, None, None)
+        record.k8s_ref = {'uid': 'a', 'name': 'a'}
+        assert budget.filter(record)
+        return not getattr(record, 'k8s_skip', False)
+
+    # verbose debug logging does not use up the budget of the warning that follows
+    for number in range(10):
+        post(logging.DEBUG, f'spec {number}')
+    assert post(logging.WARNING, 'failed to update monitor')
+    assert not post(logging.ERROR, 'failed to delete monitor')
+
+
+def test_bulk_teardown_of_terminating_namespace():
+    finalizer = 'kopf.zalando.org/KopfFinalizerMarker'
+
+    owned = {'ownerReferences': [{'kind': 'Ingress', 'name': 'web'}]}
+
+    def monitor(name, uid, deleting=True, owner=True):
+        meta = {'name': name, 'namespace': 'shop', 'resourceVersion': '1',
+                'finalizers': [finalizer, 'other/finalizer'], **(owned if owner else {})}
+        if deleting:
+            meta['deletionTimestamp'] = '2026-01-01T00:00:00Z'
+        return {'metadata': meta, 'status': {'on_create_mon': {'monitor_id': uid}}}
+
+    inventory = Inventory()
+    inventory.replace(MONITOR, [('1', {}), ('2', {}), ('5', {})])
+    deleted, patched, checks, deadlines = [], [], [], []
+    objects = [monitor('a', '1'), monitor('b', '2'), monitor('gone', '3'),
+               monitor('kept', '4', deleting=False), monitor('solo', '5', owner=False)]
+    k8s = SimpleNamespace(
+        namespace_terminating=lambda namespace: checks.append(namespace) or namespace == 'shop',
+        ingress_terminating=lambda namespace, name: checks.append((namespace, name)) or False,
+        list_resource=lambda namespace: objects,
+        patch_resource=lambda namespace, name, patch: patched.append((name, patch)))
+    client = SimpleNamespace(inventory=inventory, load_inventory=lambda kind: None)
+    handler = SimpleNamespace(
+        k8s=k8s, uptime_robot=lambda namespace: client,
+        uptime_robots=SimpleNamespace(journal=Journal()),
+        create_event_name='on_create_mon', update_event_name='on_update_mon', id_key='monitor_id',
+        on_delete=lambda namespace, name, status, logger: (deleted.append(name),
+                                                           deadlines.append(DEADLINE.get())))
+    teardown = BulkTeardown(handler, finalizer, concurrency=4)
+    logger = SimpleNamespace(info=lambda msg: None)
+
+    # monitors not created for an Ingress are deleted on their own without a check
+    assert not teardown.teardown('other', 'x', {}, logger)
+    assert not checks
+    assert not teardown.teardown('other', 'y', owned, logger)
+    assert within_deadline(60)(teardown.teardown)('shop', 'a', owned, logger)
+    assert sorted(deleted) == ['a', 'b', 'solo']
+    assert sorted(name for name, _ in patched) == ['a', 'b', 'gone', 'solo']
+    assert all(patch['metadata']['finalizers'] == ['other/finalizer'] for _, patch in patched)
+    assert len(deadlines) == 3 and None not in deadlines
+
+    assert teardown.teardown('shop', 'b', owned, logger)
+    assert teardown.teardown('shop', 'solo', {}, logger)
+    assert sorted(deleted) == ['a', 'b', 'solo']
+    assert checks == ['other', ('other', 'web'), 'shop']
+
+
+def test_call_timeouts_derive_from_handler_deadline():
+    assert call_timeout(30) == 30
+
+    @within_deadline(5)
+    def handler():
+        return call_timeout(30)
+
+    assert 4 < handler() <= 5
+
+    @within_deadline(0)
+    def late_handler():
+        return call_timeout(30)
+
+    with pytest.raises(DeadlineExceeded):
+        late_handler()
+
+
+def test_hedger_returns_faster_attempt():
+    hedger = Hedger(percentile=90)
+    for _ in range(20):
+        hedger.call(lambda: None)
+    assert hedger.threshold() < 0.05
+
+    attempts = []
+
+    def read():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            time.sleep(1)
+            return 'slow'
+        return 'fast'
+
+    started = time.monotonic()
+    assert hedger.call(read) == 'fast'
+    assert time.monotonic() - started < 0.5
+    assert len(attempts) == 2
+    assert Hedger(percentile=None).threshold() is None
+
+
+def test_hedger_closes_losing_attempt_and_does_not_queue():
+    hedger = Hedger(percentile=90, max_workers=2)
+    for _ in range(20):
+        hedger.call(lambda: None)
+
+    release = threading.Event()
+    responses = []
+
+    def read():
+        response = SimpleNamespace(closed=False)
+        response.close = lambda: setattr(response, 'closed', True)
+        responses.append(response)
+        if len(responses) == 1:
+            release.wait(1)
+        return response
+
+    winner = hedger.call(read)
+    assert winner is responses[1]
+    release.set()
+    time.sleep(0.1)
+    assert responses[0].closed
+    assert not winner.closed
+
+    # both workers are busy, reads are called directly instead of queueing for them
+    blocked = threading.Event()
+    busy = [threading.Thread(target=hedger.call, args=(lambda: blocked.wait(1),))
+            for _ in range(2)]
+    for thread in busy:
+        thread.start()
+    time.sleep(0.1)
+    calls = []
+    assert hedger.call(lambda: calls.append(threading.current_thread())) is None
+    assert calls == [threading.current_thread()]
+    blocked.set()
+    for thread in busy:
+        thread.join()
+
+
+def test_streamed_list_is_not_hedged(monkeypatch):
+    posts = []
+
+    class SlowResponse:
+        status_code = 200
+        closed = False
+
+        def iter_content(self, _):
+            # the headers arrive right away, the body takes longer than the hedging threshold
+            time.sleep(0.2)
+            yield b'{"stat": "ok", "pagination": {"total": 1}, "monitors": [{"id": 1}]}'
+
+        def close(self):
+            self.closed = True
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_):
+            self.close()
+
+    def post(url, **kwargs):
+        posts.append(SlowResponse())
+        time.sleep(0.1)
+        return posts[-1]
+
+    class FakeUR:
+        endpoint = 'https://api.uptimerobot.com/v2/'
+
+        def __init__(self, api_key, req_obj):
+            self.payload = {'api_key': api_key}
+            self.request_session = SimpleNamespace(post=post)
+
+        @staticmethod
+        def get_account_details():
+            return {'stat': 'ok', 'account': {'monitor_limit': 50}}
+
+    monkeypatch.setattr(uptimerobot_api, 'UR', FakeUR)
+    monkeypatch.setenv('URO_HEDGE_PERCENTILE', '90')
+    ur = uptimerobot_api.UptimeRobot(Config(), api_key='key')
+    for _ in range(20):
+        ur.hedger.call(lambda: None)
+    assert ur.hedger.threshold() < 0.05
+
+    assert [obj['id'] for obj in ur.iter_objects(MONITOR)] == [1]
+    assert len(posts) == 1
+    assert posts[0].closed
+
+
+def test_alert_webhook_patches_monitor_status():
+    patches = []
+    patched = threading.Event()
+
+    def patch_resource(namespace, name, patch):
+        patches.append((namespace, name, patch))
+        patched.set()
+
+    receiver = AlertReceiver(SimpleNamespace(patch_resource=patch_resource),
+                             {'42': [MonitorRecord('default', 'foo', uid='42')]}, window=0.1)
+    with pytest.raises(ValueError):
+        AlertServer(receiver, '', '127.0.0.1', 0)
+    server = AlertServer(receiver, 'secret', '127.0.0.1', 0)
+    server.start()
+    try:
+        url = f'http://127.0.0.1:{server.server.server_port}/alerts'
+        down = {'token': 'secret', 'monitorID': '42', 'alertType': '1',
+                'alertDetails': 'Connection Timeout', 'alertDateTime': '1700000000'}
+        assert requests.get(url, params={**down, 'token': 'wrong'}, timeout=5).status_code == 403
+        assert requests.get(url, params={k: v for k, v in down.items() if k != 'token'},
+                            timeout=5).status_code == 403
+        assert requests.get(url, params={'token': 'secret'}, timeout=5).status_code == 400
+        assert requests.get(url, params={**down, 'monitorID': '7'},
+                            timeout=5).json() == {'monitors': 0}
+
+        up = {'monitorID': '42', 'alertType': '2', 'alertDetails': 'OK',
+              'alertDateTime': '1700000060'}
+        assert requests.post(url, params={'token': 'secret'}, json=up, timeout=5).status_code == 200
+        assert requests.get(url, params=down, timeout=5).json() == {'monitors': 1}
+        assert patched.wait(5)
+        time.sleep(0.2)
+    finally:
+        server.stop()
+
+    # the older down alert arrived last and is coalesced away
+    assert patches == [('default', 'foo', {'status': {'alert': {
+        'state': 'UP', 'lastChange': '2023-11-14T22:14:20Z', 'reason': 'OK'}}})]
+
+
+def test_alert_webhook_ignores_alerts_older_than_the_stored_one():
+    patches = []
+    record = MonitorRecord('default', 'foo', uid='42', state='UP',
+                           alerted_at='2023-11-14T22:14:20Z')
+    receiver = AlertReceiver(SimpleNamespace(patch_resource=lambda *args: patches.append(args)),
+                             {'42': [record]}, window=0.01)
+
+    # the down alert was delayed past the flush of the newer up alert
+    assert receiver.receive({'monitorID': '42', 'alertType': '1',
+                             'alertDateTime': '1700000000'}) == 1
+    time.sleep(0.1)
+    assert not patches
+
+    receiver.receive({'monitorID': '42', 'alertType': '1', 'alertDateTime': '1700000120'})
+    time.sleep(0.1)
+    assert patches[0][2]['status']['alert']['lastChange'] == '2023-11-14T22:15:20Z'
+
+
+def test_downtime_is_clipped_to_window():
+    logs = [{'type': 1, 'datetime': 900, 'duration': 200}, {'type': 2, 'datetime': 1100},
+            {'type': 1, 'datetime': 1900, 'duration': 500}]
+    assert downtime(logs, 1000, 2000) == 200
+
+
+def test_slo_reporter_aggregates_monitors_ingresses_and_namespaces():
+    now = 1_000_000
+    stats = {
+        '1': {'id': 1, 'custom_uptime_ratio': '99.950',
+              'logs': [{'type': 1, 'datetime': now - 360, 'duration': 36}],
+              'response_times': [{'value': v} for v in (100, 200, 300)]},
+        '2': {'id': 2, 'custom_uptime_ratio': '100.000', 'logs': [],
+              'response_times': [{'value': 400}]},
+    }
+    calls = []
+
+    def iter_monitor_stats(ids, **params):
+        calls.append((ids, params['custom_uptime_ratios']))
+        return [stats[uid] for uid in ids]
+
+    client = SimpleNamespace(fingerprint='abc', iter_monitor_stats=iter_monitor_stats)
+    records = {'shop': [MonitorRecord('shop', 'a', 'web', '1'), MonitorRecord('shop', 'b', 'web', '2'),
+                        MonitorRecord('shop', 'pending')],
+               'blog': [MonitorRecord('blog', 'c', None, '1')]}
+    patches = []
+    config = SimpleNamespace(SLO_TARGET=99.9, SLO_PERIOD_DAYS=30, SLO_BURN_WINDOW=3600,
+                             SLO_REPORT_INTERVAL=60)
+    reporter = SloReporter(SimpleNamespace(for_namespace=lambda namespace: client), records,
+                           SimpleNamespace(patch_resource=lambda *args: patches.append(args)),
+                           config, clock=lambda: now)
+
+    reporter.run_once()
+    assert calls == [(['1', '2'], '30')]
+    report = reporter.report
+    assert report['monitors'][('shop', 'a')] == {
+        'uptime': 0.9995, 'errorBudgetRemaining': 0.5, 'burnRate': 10.0,
+        'latencyMs': {'p50': 200.0, 'p95': 290.0, 'p99': 298.0}}
+    assert report['monitors'][('blog', 'c')] == report['monitors'][('shop', 'a')]
+    web = report['ingresses'][('shop', 'web')]
+    assert (web['monitors'], web['uptime'], web['burnRate']) == (2, 0.99975, 5.0)
+    assert web['latencyMs']['p50'] == 250.0
+    assert report['namespaces']['blog']['monitors'] == 1
+    assert sorted(patch[:2] for patch in patches) == [('blog', 'c'), ('shop', 'a'), ('shop', 'b')]
+
+    reporter.run_once()
+    assert len(patches) == 3
+    metrics = reporter.metrics()
+    assert 'uptimerobot_ingress_uptime_ratio{namespace="shop",ingress="web"} 0.99975' in metrics
+    assert 'uptimerobot_namespace_response_time_milliseconds{namespace="blog",quantile="0.95"} 290.0' in metrics
+
+
+def test_slo_reporter_skips_unreadable_namespaces_and_small_changes():
+    stats = {'id': 1, 'custom_uptime_ratio': '99.950', 'logs': [],
+             'response_times': [{'value': 200}]}
+    client = SimpleNamespace(fingerprint='abc',
+                             iter_monitor_stats=lambda ids, **params: [dict(stats)])
+    reads = []
+
+    def for_namespace(namespace):
+        reads.append(namespace)
+        if namespace == 'locked':
+            raise ApiException(status=403)
+        return client
+
+    records = {'shop': [MonitorRecord('shop', 'a', None, '1')],
+               'locked': [MonitorRecord('locked', 'b', None, '2'),
+                          MonitorRecord('locked', 'c', None, '3')]}
+    patches = []
+    config = SimpleNamespace(SLO_TARGET=99.9, SLO_PERIOD_DAYS=30, SLO_BURN_WINDOW=3600,
+                             SLO_REPORT_INTERVAL=60)
+    reporter = SloReporter(SimpleNamespace(for_namespace=for_namespace), records,
+                           SimpleNamespace(patch_resource=lambda *args: patches.append(args)),
+                           config, clock=lambda: 1_000_000)
+
+    reporter.run_once()
+    assert list(reporter.report['monitors']) == [('shop', 'a')]
+    assert sorted(reads) == ['locked', 'shop']
+    assert [patch[:2] for patch in patches] == [('shop', 'a')]
+
+    # uptime and latency move a little every period, that is not written into the status
+    stats.update(custom_uptime_ratio='99.951', response_times=[{'value': 210}])
+    reporter.run_once()
+    assert len(patches) == 1
+    stats.update(custom_uptime_ratio='99.900')
+    reporter.run_once()
+    assert len(patches) == 2
+
+
+
+def test_json_stream_yields_array_items_across_chunks():
+    data = ('{"stat": "ok", "pagination": {"offset": 0, "limit": 50, "total": 2}, '
+            '"monitors": [{"id": 777, "friendly_name": "caf\u00e9 ☃", "logs": [1, 2]}, '
+            '{"id": 12345, "url": "https://example.com"}], "total": 123}').encode()
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    meta = {}
+    stream = JsonStream(iter(chunks)).iter_array('monitors', meta)
+
+    first = next(stream)
+    assert first == {'id': 777, 'friendly_name': 'café ☃', 'logs': [1, 2]}
+    assert project(first, ('id', 'url')) == {'id': 777}
+    assert list(stream) == [{'id': 12345, 'url': 'https://example.com'}]
+    assert meta == {'stat': 'ok', 'pagination': {'offset': 0, 'limit': 50, 'total': 2},
+                    'total': 123}
+
+    meta = {}
+    assert list(JsonStream([b'{"stat": "fail", "error": {"type": "x"}}']).iter_array(
+        'monitors', meta)) == []
+    assert meta['stat'] == 'fail'
+    with pytest.raises(ValueError):
+        list(JsonStream([b'{"monitors": [{"id": 1}']).iter_array('monitors', {}))
+
+
+# seconds importing the operator may take on top of kopf and its dependencies
+IMPORT_TIME_BUDGET = 0.3
+
+
+def test_operator_import_time_within_budget():
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    # kopf runs the entry file ur_operator/handlers.py, not the handlers package next to it;
+    # its handlers are registered in a throwaway registry
+    script = ('import json, runpy, sys, time; sys.path.insert(0, "ur_operator"); import kopf; '
+              'kopf.set_default_registry(kopf.OperatorRegistry()); '
+              'started = time.perf_counter(); '
+              'entry = runpy.run_path("ur_operator/handlers.py", run_name="ur_operator_entry"); '
+              'print(json.dumps({"seconds": time.perf_counter() - started, '
+              '"indexes": "monitor_records" in entry, '
+              '"modules": [m for m in sys.modules if m.startswith("kubernetes.client.")]}))')
+    result = subprocess.run([sys.executable, '-c', script], cwd=root,
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report['indexes']
+    assert report['seconds'] < IMPORT_TIME_BUDGET
+
+    # API classes and schema models are only loaded when they are used
+    loaded = report['modules']
+    assert not any(module.startswith('kubernetes.client.api.core_v1_api') for module in loaded)
+    assert 'kubernetes.client.models.v1_json_schema_props' not in loaded
+
+
+def test_generated_crd_manifests_are_up_to_date():
+    manifests = [make_manifest(crd) for crd in ALL_CRDS]
+    assert CRD_HASHES == {m['metadata']['name']: m['metadata']['annotations'][SPEC_HASH_ANNOTATION]
+                          for m in manifests}
+    for path, content in ((TEMPLATE_PATH, render_template(manifests)),
+                          (HASHES_PATH, render_hashes(manifests))):
+        with open(path, encoding='utf-8') as file:
+            assert file.read() == content, 'run tools/generate_crd_manifests.py'
+    # the chart keeps the CRDs, and with them all resources, on uninstall
+    rendered = render_template(manifests).split('\n', 2)[2].rsplit('{{', 1)[0]
+    assert all(doc['metadata']['annotations']['helm.sh/resource-policy'] == 'keep'
+               for doc in yaml.safe_load_all(rendered))
+
+
+def test_skip_crd_registration_verifies_installed_hashes(monkeypatch):
+    installed = {name: {SPEC_HASH_ANNOTATION: digest} for name, digest in CRD_HASHES.items()}
+
+    def read_custom_resource_definition(name, **_):
+        return SimpleNamespace(metadata=SimpleNamespace(annotations=installed[name]))
+
+    monkeypatch.setenv('URO_SKIP_CRD_REGISTRATION', 'true')
+    monkeypatch.setattr(k8s_api, 'load_config', lambda: None)
+    monkeypatch.setattr(k8s_api.k8s_client, 'ApiextensionsV1Api', lambda: SimpleNamespace(
+        read_custom_resource_definition=read_custom_resource_definition))
+    # registering would need K8s(CustomResourceDefinition)
+    monkeypatch.setattr(k8s_api, 'K8s', None)
+    logger = SimpleNamespace(debug=lambda msg: None, info=lambda msg: None)
+
+    k8s_api.register_crds(logger)
+
+    installed[next(iter(installed))] = {SPEC_HASH_ANNOTATION: 'outdated'}
+    with pytest.raises(kopf.PermanentError, match='outdated'):
+        k8s_api.register_crds(logger)
+
+
+def test_readiness_gate_retries_setup_and_holds_handlers(monkeypatch):
+    monkeypatch.setattr(readiness, 'BACKOFF', 0.01)
+    gate = readiness.ReadinessGate()
+    attempts = []
+    unavailable = threading.Event()
+    unavailable.set()
+
+    def setup():
+        attempts.append(time.monotonic())
+        if unavailable.is_set():
+            raise requests.ConnectionError('UptimeRobot is unavailable')
+
+    handler = gate.gate(lambda: 'handled')
+    validate = gate.bypass(lambda: 'validated')
+    logger = SimpleNamespace(info=lambda msg: None, warning=lambda msg: None)
+    caught_up = threading.Event()
+    gate.start(setup, logger, caught_up.set)
+
+    with pytest.raises(readiness.NotReady):
+        gate.wait(0.05)
+    assert validate() is None
+    assert len(attempts) > 1
+
+    unavailable.clear()
+    assert handler() == 'handled'
+    assert validate() == 'validated'
+    assert gate.is_ready()
+    assert caught_up.wait(1)
+    gate.stop()
+
+
+def test_readiness_gate_does_not_retry_permanent_errors(monkeypatch):
+    monkeypatch.setattr(readiness, 'BACKOFF', 0.01)
+    gate = readiness.ReadinessGate()
+    attempts = []
+
+    def setup():
+        attempts.append(time.monotonic())
+        raise kopf.PermanentError('CRDs are outdated')
+
+    logger = SimpleNamespace(info=lambda msg: None, warning=lambda msg: None,
+                             error=lambda msg: None)
+    fatal = threading.Event()
+    gate.start(setup, logger, on_fatal=fatal.set)
+
+    assert fatal.wait(1)
+    assert len(attempts) == 1
+    assert not gate.is_ready()
+    with pytest.raises(kopf.PermanentError, match='outdated'):
+        gate.wait(0.05)
+    gate.stop()
@@ -0,0 +1,85 @@
+"""Render the CustomResourceDefinitions of the operator into the Helm chart.
+
+Writes the manifests of all CRDs into the chart's templates and the hashes of their specs
+into ur_operator/crds/hashes.py. With URO_SKIP_CRD_REGISTRATION the operator only verifies
+that the installed CRDs carry these hashes instead of registering them on every start.
+Run it whenever a CRD changes:
+
+    python tools/generate_crd_manifests.py
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '../ur_operator')))
+# pylint: disable=wrong-import-position
+
+import yaml
+
+from crds import ALL_CRDS, SPEC_HASH_ANNOTATION, make_manifest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TEMPLATE_PATH = os.path.join(ROOT, 'helm/uptimerobot-operator/templates/crds.yaml')
+HASHES_PATH = os.path.join(ROOT, 'ur_operator/crds/hashes.py')
+HEADER = 'Generated by tools/generate_crd_manifests.py, do not edit.'
+# Helm keeps the CRDs on uninstall, deleting them would delete all resources of the operator
+RESOURCE_POLICY = {'helm.sh/resource-policy': 'keep'}
+
+
+def render_template(manifests: list[dict]) -> str:
+    """Render the manifests into a Helm template that is only installed with crds.install.
+    The resource policy is not part of the spec hash, the operator's own manifests lack it."""
+    documents = '---\n'.join(
+        yaml.safe_dump({**manifest, 'metadata': {
+            **manifest['metadata'],
+            'annotations': {**manifest['metadata']['annotations'], **RESOURCE_POLICY}}},
+            sort_keys=False)
+        for manifest in manifests)
+    return (f'{{{{- /* {HEADER} */}}}}\n'
+            '{{- if .Values.crds.install }}\n'
+            f'{documents}'
+            '{{- end }}\n')
+
+
+def render_hashes(manifests: list[dict]) -> str:
+    """Render the module with the spec hashes of the CRDs by name"""
+    lines = ['"""Hashes of the specs of the CustomResourceDefinitions by name"""',
+             f'# {HEADER}', 'CRD_HASHES = {']
+    lines.extend(f"    '{manifest['metadata']['name']}': "
+                 f"'{manifest['metadata']['annotations'][SPEC_HASH_ANNOTATION]}',"
+                 for manifest in manifests)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():  # pylint: disable=missing-function-docstring
+    parser = argparse.ArgumentParser(
+        description='Render the CustomResourceDefinitions of the operator into the Helm chart')
+    parser.add_argument('--check', action='store_true',
+                        help='only check that the rendered files are up to date')
+    args = parser.parse_args()
+
+    manifests = [make_manifest(crd) for crd in ALL_CRDS]
+    outdated = []
+    for path, content in ((TEMPLATE_PATH, render_template(manifests)),
+                          (HASHES_PATH, render_hashes(manifests))):
+        current = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                current = file.read()
+        if current == content:
+            continue
+        outdated.append(path)
+        if not args.check:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(content)
+            print(f'wrote {os.path.relpath(path, ROOT)}', file=sys.stderr)
+
+    if args.check and outdated:
+        print(f'outdated: {", ".join(os.path.relpath(p, ROOT) for p in outdated)}',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Generate manifests for the objects of an existing UptimeRobot account.
+
+The manifests contain the IDs of the UptimeRobot objects in their status, so the operator
+adopts the existing objects instead of creating new ones. They are written in chunks of
+YAML files, numbered in the order they should be applied:
+
+    UPTIMEROBOT_API_KEY=... python tools/import_uptimerobot.py --namespace monitoring --out import/
+    kubectl apply -f import/
+"""
+import argparse
+import os
+import re
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '../ur_operator')))
+# pylint: disable=wrong-import-position
+
+import yaml
+
+from config import Config
+from api import UptimeRobot
+from api.inventory import MONITOR, MWINDOW, ALERT_CONTACT, PSP
+from crds import MonitorV1Beta1, AlertContactV1Beta1, MaintenanceWindowV1Beta1, PspV1Beta1
+from crds.alert_contact import AlertContactType
+from crds.maintenance_window import MaintenanceWindowType
+from crds.monitor import MonitorType, MonitorSubType, MonitorKeywordType
+from crds.psp import PspSort, PspStatus
+from plan import RESOURCES
+
+
+class ManifestWriter:
+    """Writes manifests into numbered YAML files of at most chunk_size documents each"""
+
+    def __init__(self, out_dir: str, prefix: str, chunk_size: int):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.__file = None
+
+    def write(self, resource: dict):
+        """Append a manifest, starting the next file once the current one is full"""
+        if self.count % self.chunk_size == 0:
+            self.close()
+            path = os.path.join(self.out_dir,
+                                f'{self.prefix}-{self.count // self.chunk_size:04d}.yaml')
+            self.__file = open(path, 'w', encoding='utf-8')  # pylint: disable=consider-using-with
+        self.__file.write('---\n')
+        yaml.safe_dump(resource, self.__file, sort_keys=False)
+        self.count += 1
+
+    def close(self):
+        """Close the current file, the next manifest starts a new one"""
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+def enum_name(enum_class, value):
+    """Reverse the enum mapping of a CRD, None for empty or unknown values"""
+    try:
+        return enum_class(int(value)).name
+    except (TypeError, ValueError):
+        return None
+
+
+def resource_name(obj: dict) -> str:
+    """Derive a unique resource name from the friendly name and ID of an object"""
+    slug = re.sub('[^a-z0-9]+', '-', str(obj.get('friendly_name', '')).lower()).strip('-')
+    return f'{slug[:40].strip("-") or "imported"}-{obj["id"]}'
+
+
+def manifest(crd, namespace: str, name: str, obj: dict, spec: dict) -> dict:
+    """Build the manifest of a resource with the ID of its UptimeRobot object in its status"""
+    _, id_key, suffix = RESOURCES[crd]
+    return {
+        'apiVersion': f'{crd.group()}/{crd.version()}',
+        'kind': crd.kind(),
+        'metadata': {'name': name, 'namespace': namespace},
+        'spec': {k: v for k, v in spec.items() if v not in (None, '')},
+        'status': {f'on_create_{suffix}': {id_key: str(obj['id'])}}
+    }
+
+
+def alert_contact_spec(obj: dict) -> dict | None:
+    """Build the spec of an AlertContact, None for unsupported types"""
+    contact_type = enum_name(AlertContactType, obj.get('type'))
+    if contact_type is None:
+        return None
+    return {'type': contact_type, 'value': obj.get('value'),
+            'friendlyName': obj.get('friendly_name')}
+
+
+def mwindow_spec(obj: dict) -> dict | None:
+    """Build the spec of a MaintenanceWindow, None for unsupported types"""
+    window_type = enum_name(MaintenanceWindowType, obj.get('type'))
+    if window_type is None:
+        return None
+    return {'type': window_type, 'startTime': str(obj.get('start_time')),
+            'duration': obj.get('duration'), 'value': obj.get('value'),
+            'friendlyName': obj.get('friendly_name')}
+
+
+def monitor_spec(obj: dict, alert_contacts: dict, mwindows: dict) -> dict | None:
+    """Build the spec of an UptimeRobotMonitor, None for unsupported types. alert_contacts
+    and mwindows are the resource names of the imported objects by UptimeRobot ID."""
+    monitor_type = enum_name(MonitorType, obj.get('type'))
+    if monitor_type is None:
+        return None
+    # HTTPS is an alias of HTTP, so its name is never returned by the enum
+    if monitor_type == 'HTTP' and str(obj.get('url')).startswith('https://'):
+        monitor_type = 'HTTPS'
+
+    spec = {
+        'url': obj.get('url'),
+        'type': monitor_type,
+        'friendlyName': obj.get('friendly_name'),
+        'subType': enum_name(MonitorSubType, obj.get('sub_type')),
+        'port': int(obj['port']) if obj.get('port') else None,
+        'keywordType': enum_name(MonitorKeywordType, obj.get('keyword_type')),
+        'keywordValue': obj.get('keyword_value'),
+        'interval': int(obj['interval']) if obj.get('interval') else None,
+        'customHttpHeaders': obj.get('custom_http_headers') or None
+    }
+
+    # reference imported alert contacts and maintenance windows by name, others by ID
+    refs, ids = [], []
+    for contact in obj.get('alert_contacts') or []:
+        suffix = f'_{contact.get("threshold", 0)}_{contact.get("recurrence", 0)}'
+        if str(contact['id']) in alert_contacts:
+            refs.append(f'{alert_contacts[str(contact["id"])]}{suffix}')
+        else:
+            ids.append(f'{contact["id"]}{suffix}')
+    spec['alertContactRefs'] = ','.join(refs)
+    spec['alertContacts'] = '-'.join(ids)
+
+    windows = [str(window['id']) for window in obj.get('mwindows') or []]
+    spec['mwindowRefs'] = ','.join(mwindows[uid] for uid in windows if uid in mwindows)
+    spec['mwindows'] = '-'.join(uid for uid in windows if uid not in mwindows)
+    return spec
+
+
+def psp_spec(obj: dict) -> dict:
+    """Build the spec of a PublicStatusPage"""
+    monitors = obj.get('monitors') or [0]
+    return {'monitors': '-'.join(str(uid) for uid in monitors),
+            'friendlyName': obj.get('friendly_name'),
+            'customDomain': obj.get('custom_domain'),
+            'sort': enum_name(PspSort, obj.get('sort')),
+            'status': enum_name(PspStatus, obj.get('status'))}
+
+
+def main():  # pylint: disable=missing-function-docstring
+    parser = argparse.ArgumentParser(
+        description='Generate manifests for the objects of an existing UptimeRobot account')
+    parser.add_argument('--namespace', default='default', help='namespace of the resources')
+    parser.add_argument('--out', default='.', help='directory the manifests are written to')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='maximum number of manifests per file')
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    uptime_robot = UptimeRobot(Config())
+    # only the names of alert contacts and maintenance windows are kept in memory,
+    # monitors and status pages are written as they are streamed
+    names = {ALERT_CONTACT: {}, MWINDOW: {}}
+    for index, (crd, kind, params) in enumerate([
+            (AlertContactV1Beta1, ALERT_CONTACT, {}),
+            (MaintenanceWindowV1Beta1, MWINDOW, {}),
+            (MonitorV1Beta1, MONITOR, {'alert_contacts': 1, 'mwindows': 1,
+                                       'custom_http_headers': 1}),
+            (PspV1Beta1, PSP, {})], start=1):
+        writer = ManifestWriter(args.out, f'{index}-{crd.plural()}', args.chunk_size)
+        for obj in uptime_robot.iter_objects(kind, **params):
+            if kind == MONITOR:
+                spec = monitor_spec(obj, names[ALERT_CONTACT], names[MWINDOW])
+            elif kind == PSP:
+                spec = psp_spec(obj)
+            else:
+                spec = (alert_contact_spec if kind == ALERT_CONTACT else mwindow_spec)(obj)
+            if spec is None:
+                print(f'skipping {kind} {obj["id"]} of unsupported type {obj.get("type")}',
+                      file=sys.stderr)
+                continue
+
+            name = resource_name(obj)
+            if kind in names:
+                names[kind][str(obj['id'])] = name
+            writer.write(manifest(crd, args.namespace, name, obj, spec))
+        writer.close()
+        print(f'wrote {writer.count} {crd.kind()} manifests', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,4 +2,5 @@
 Also contains decorator functions that create kopf decorators. """
 from .k8s import K8s
 from .uptimerobot import UptimeRobot
-from .on import create, update, delete
+from .uptimerobot_pool import UptimeRobotPool
+from .on import create, update, delete, resume, event, index, validate
@@ -0,0 +1,50 @@
+"""Coalesces concurrent single-key lookups into batched API calls"""
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Batcher:
+    """Collects the keys requested by concurrent callers for a short window and resolves
+    them with as few calls of fetch as possible. fetch receives a list of at most max_batch
+    keys and returns a dict of the values it found, missing keys resolve to None."""
+
+    def __init__(self, fetch, max_batch: int = 50, window: float = 0.2):
+        self.fetch = fetch
+        self.max_batch = max_batch
+        self.window = window
+        self.__pending: dict[str, Future] = {}
+        self.__leading = False
+        self.__lock = threading.Lock()
+
+    def get(self, key: str):
+        """Retrieve the value of a key, blocking until the batch containing it was fetched"""
+        with self.__lock:
+            future = self.__pending.get(key)
+            if future is None:
+                future = self.__pending[key] = Future()
+            lead = not self.__leading
+            self.__leading = True
+
+        if lead:
+            self.__lead()
+        return future.result()
+
+    def __lead(self):
+        time.sleep(self.window)
+        while True:
+            with self.__lock:
+                if not self.__pending:
+                    self.__leading = False
+                    return
+                keys = list(self.__pending)[:self.max_batch]
+                futures = {key: self.__pending.pop(key) for key in keys}
+
+            try:
+                values = self.fetch(keys)
+            except Exception as error:  # pylint: disable=broad-except
+                for future in futures.values():
+                    future.set_exception(error)
+                continue
+            for key, future in futures.items():
+                future.set_result(values.get(key))
@@ -0,0 +1,130 @@
+"""Circuit breaker protecting the operator from hammering a degraded API"""
+import collections
+import enum
+import logging
+import threading
+import time
+
+import kopf
+from requests import RequestException
+
+from .deadline import DeadlineExceeded
+from .rate_limiter import RateLimiter
+
+WINDOW_SIZE = 20
+MIN_CALLS = 5
+
+
+class BreakerState(enum.Enum):  # pylint: disable=missing-class-docstring
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """Opens when too many of the recent calls failed or took longer than the latency threshold.
+    While open, mutations are parked until the API recovers instead of failing right away.
+    After the cooldown a few parked calls probe the API, once they succeed the breaker closes
+    and the remaining parked calls are released at a controlled rate."""
+
+    def __init__(self, config, rate_limiter: RateLimiter):
+        self.error_rate = config.BREAKER_ERROR_RATE
+        self.latency = config.BREAKER_LATENCY
+        self.cooldown = config.BREAKER_COOLDOWN
+        self.probes = config.BREAKER_HALF_OPEN_PROBES
+        self.max_park = config.BREAKER_MAX_PARK
+        self.rate_limiter = rate_limiter
+        self.release_limiter = RateLimiter(config.BREAKER_RELEASE_RATE)
+        self.state = BreakerState.CLOSED
+        self.__outcomes: collections.deque[bool] = collections.deque(maxlen=WINDOW_SIZE)
+        self.__opened_at = 0.
+        self.__probing = 0
+        self.__probe_successes = 0
+        self.__condition = threading.Condition()
+
+    def call(self, method, *args, mutation=True, **kwargs):
+        """Call a method through the breaker. Reads fail fast while the breaker is open,
+        mutations are parked for up to max_park seconds."""
+        parked, probe = self.__admit(mutation)
+        if parked:
+            self.release_limiter.acquire()
+        self.rate_limiter.acquire()
+
+        started = time.monotonic()
+        try:
+            result = method(*args, **kwargs)
+        except DeadlineExceeded:
+            # the call was never sent, it tells nothing about the API
+            if probe:
+                with self.__condition:
+                    self.__probing -= 1
+            raise
+        except RequestException:
+            self.__record(False, probe)
+            raise
+        except Exception:
+            # the API did answer, the response just was not what we expected
+            self.__record(True, probe)
+            raise
+        self.__record(time.monotonic() - started <= self.latency, probe)
+        return result
+
+    def __admit(self, mutation: bool) -> tuple[bool, bool]:
+        deadline = time.monotonic() + self.max_park
+        parked = False
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                if (self.state == BreakerState.OPEN
+                        and now - self.__opened_at >= self.cooldown):
+                    logging.info('UptimeRobot API circuit breaker is half-open, probing')
+                    self.state = BreakerState.HALF_OPEN
+                    self.__probing = 0
+                    self.__probe_successes = 0
+
+                if self.state == BreakerState.CLOSED:
+                    return parked, False
+                if self.state == BreakerState.HALF_OPEN and self.__probing < self.probes:
+                    self.__probing += 1
+                    return parked, True
+
+                if not mutation or now >= deadline:
+                    raise kopf.TemporaryError(
+                        'UptimeRobot API is unavailable, circuit breaker is open',
+                        delay=self.cooldown)
+                parked = True
+                wait = deadline - now
+                if self.state == BreakerState.OPEN:
+                    wait = min(wait, self.__opened_at + self.cooldown - now)
+                self.__condition.wait(wait)
+
+    def __record(self, success: bool, probe: bool):
+        with self.__condition:
+            if probe:
+                self.__probing -= 1
+                if not success:
+                    self.__open()
+                    return
+                self.__probe_successes += 1
+                if (self.state == BreakerState.HALF_OPEN
+                        and self.__probe_successes >= self.probes):
+                    logging.info('UptimeRobot API recovered, closing circuit breaker')
+                    self.state = BreakerState.CLOSED
+                    self.__outcomes.clear()
+                    self.__condition.notify_all()
+                return
+
+            self.__outcomes.append(success)
+            failures = self.__outcomes.count(False)
+            if (self.state == BreakerState.CLOSED
+                    and len(self.__outcomes) >= MIN_CALLS
+                    and failures / len(self.__outcomes) >= self.error_rate):
+                self.__open()
+
+    def __open(self):
+        logging.warning('UptimeRobot API is degraded, opening circuit breaker '
+                        f'for {self.cooldown} seconds')
+        self.state = BreakerState.OPEN
+        self.__opened_at = time.monotonic()
+        self.__outcomes.clear()
+        self.__condition.notify_all()
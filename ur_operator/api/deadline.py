@@ -0,0 +1,138 @@
+"""Deadlines of handler invocations and hedging of idempotent reads.
+Every outbound call derives its timeout from the deadline of the handler it is made for,
+so a stuck connection cannot hold a kopf worker longer than the handler may take."""
+import collections
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import kopf
+import requests
+
+DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar('deadline', default=None)
+# latencies a hedging threshold is derived from
+LATENCY_SAMPLES = 100
+MIN_LATENCY_SAMPLES = 20
+
+
+class DeadlineExceeded(kopf.TemporaryError):
+    """The deadline of the handler passed before an outbound call could be made"""
+
+
+def within_deadline(seconds: float):
+    """Decorate a kopf handler so that all outbound calls it makes finish within seconds"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = DEADLINE.set(time.monotonic() + seconds)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                DEADLINE.reset(token)
+        return wrapper
+    return decorator
+
+
+def call_timeout(timeout: float) -> float:
+    """Timeout of an outbound call, the given one or the time left until the deadline
+    of the current handler if that is sooner"""
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded('deadline of the handler exceeded before calling the API')
+    return min(timeout, remaining)
+
+
+class DeadlineSession(requests.Session):
+    """Session applying the call timeout to every request without an explicit timeout"""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = call_timeout(self.timeout)
+        return super().request(method, url, *args, **kwargs)
+
+
+class Hedger:
+    """Sends a second attempt of an idempotent read if the first one takes longer than the
+    given percentile of the recent latencies and returns the result of whichever attempt
+    finishes first. Without a percentile reads are called directly.
+
+    Attempts never queue for a worker, that would count as latency and trigger more hedges:
+    reads are called directly while all workers are busy. The result of the losing attempt
+    is closed if it can be, e.g. a response."""
+
+    def __init__(self, percentile: float | None, max_workers: int = 8):
+        self.percentile = percentile
+        self.__latencies: collections.deque[float] = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.__lock = threading.Lock()
+        self.__pool = (ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+                       if percentile is not None else None)
+        self.__idle = threading.BoundedSemaphore(max_workers)
+
+    def threshold(self) -> float | None:
+        """Seconds after which a read is hedged, None until enough latencies are known"""
+        with self.__lock:
+            if self.percentile is None or len(self.__latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self.__latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return latencies[index]
+
+    def __timed(self, fn, *args, **kwargs):
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        with self.__lock:
+            self.__latencies.append(time.monotonic() - started)
+        return result
+
+    def __submit(self, fn, *args, **kwargs):
+        """Run an attempt on an idle worker, None if all of them are busy"""
+        if not self.__idle.acquire(blocking=False):
+            return None
+        # attempts run in the pool, but still within the deadline of the calling handler
+        future = self.__pool.submit(contextvars.copy_context().run, self.__timed, fn,
+                                    *args, **kwargs)
+        future.add_done_callback(lambda _: self.__idle.release())
+        return future
+
+    @staticmethod
+    def __discard(future):
+        """Close the result of an attempt that lost once it finished"""
+        def close(_):
+            if future.exception() is None and hasattr(future.result(), 'close'):
+                future.result().close()
+        future.add_done_callback(close)
+
+    def call(self, fn, *args, **kwargs):
+        """Call an idempotent read, hedging it if it is slow"""
+        threshold = self.threshold()
+        if self.__pool is None or threshold is None:
+            return self.__timed(fn, *args, **kwargs)
+
+        first = self.__submit(fn, *args, **kwargs)
+        if first is None:
+            return self.__timed(fn, *args, **kwargs)
+        done, _ = wait([first], timeout=threshold)
+        second = None if done else self.__submit(fn, *args, **kwargs)
+        if second is None:
+            return first.result()
+
+        pending = {first, second}
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        self.__discard(loser)
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
@@ -0,0 +1,33 @@
+"""Collapses bursts of triggers into a single delayed call per key"""
+import logging
+import threading
+
+
+class Debouncer:
+    """Calls action with a key once window seconds after the key was first triggered.
+    Triggers of a key that is already pending are absorbed by the pending call."""
+
+    def __init__(self, action, window: float):
+        self.action = action
+        self.window = window
+        self.__pending: set = set()
+        self.__lock = threading.Lock()
+
+    def trigger(self, key):
+        """Schedule a call for a key unless one is pending already"""
+        with self.__lock:
+            if key in self.__pending:
+                return
+            self.__pending.add(key)
+
+        timer = threading.Timer(self.window, self.__fire, (key,))
+        timer.daemon = True
+        timer.start()
+
+    def __fire(self, key):
+        with self.__lock:
+            self.__pending.discard(key)
+        try:
+            self.action(key)
+        except Exception as error:  # pylint: disable=broad-except
+            logging.warning(f'debounced call for {key} failed: {error}')
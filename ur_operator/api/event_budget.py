@@ -0,0 +1,84 @@
+"""Budget for the Kubernetes Events kopf posts for the log messages of handlers"""
+import logging
+import threading
+import time
+
+# logger kopf's object loggers log to, its K8sPoster handler posts the records as Events
+OBJECTS_LOGGER = 'kopf.objects'
+# longer messages, e.g. with whole specs, are only logged locally
+MAX_MESSAGE_LENGTH = 256
+
+
+class EventBudget(logging.Filter):
+    """Limits the Events posted per object and in total within a window of seconds.
+
+    Records are never dropped, records over the budget are only marked with kopf's
+    k8s_skip attribute so they still reach the local logs. A message repeated for the
+    same object within the window is posted once, the next occurrence after the window
+    is posted with the number of repetitions that were held back in between. Records below
+    kopf's posting level are never posted and do not count against the budget.
+    Handlers run in kopf's thread pool, so all state is guarded by a lock."""
+
+    def __init__(self, per_object: int, total: int, window: float,  # pylint: disable=too-many-arguments
+                 level: int = logging.INFO, clock=time.monotonic):
+        super().__init__()
+        self.per_object = per_object
+        self.total = total
+        self.window = window
+        self.level = level
+        self.clock = clock
+        self.__window_start = clock()
+        self.__posted = 0
+        self.__posted_per_object: dict[str, int] = {}
+        # (object uid, level, message) -> (time last posted, repetitions held back)
+        self.__repeats: dict[tuple, tuple[float, int]] = {}
+        self.__lock = threading.Lock()
+
+    def install(self, logger_name: str = OBJECTS_LOGGER):
+        """Apply the budget to the records of the kopf object loggers"""
+        logging.getLogger(logger_name).addFilter(self)
+
+    def __roll_window(self, now: float):
+        if now - self.__window_start < self.window:
+            return
+        self.__window_start = now
+        self.__posted = 0
+        self.__posted_per_object.clear()
+        # held back repetitions are reported if the message recurs within the next window
+        self.__repeats = {key: value for key, value in self.__repeats.items()
+                          if now - value[0] < 2 * self.window}
+
+    def __allow(self, record: logging.LogRecord, uid: str, message: str) -> bool:
+        now = self.clock()
+        self.__roll_window(now)
+        if len(message) > MAX_MESSAGE_LENGTH:
+            return False
+
+        key = (uid, record.levelno, message)
+        last_posted, held_back = self.__repeats.get(key, (None, 0))
+        if last_posted is not None and now - last_posted < self.window:
+            self.__repeats[key] = (last_posted, held_back + 1)
+            return False
+        if (self.__posted >= self.total
+                or self.__posted_per_object.get(uid, 0) >= self.per_object):
+            self.__repeats[key] = (last_posted or now, held_back + 1)
+            return False
+
+        self.__posted += 1
+        self.__posted_per_object[uid] = self.__posted_per_object.get(uid, 0) + 1
+        self.__repeats[key] = (now, 0)
+        if held_back:
+            record.msg = f'{message} ({held_back} more times since the last event)'
+            record.args = None
+        return True
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ref = getattr(record, 'k8s_ref', None)
+        if (ref is None or getattr(record, 'k8s_skip', False)
+                or record.levelno < self.level):
+            return True
+        with self.__lock:
+            if not self.__allow(record, ref.get('uid') or ref.get('name', ''),
+                                record.getMessage()):
+                record.k8s_skip = True
+        return True
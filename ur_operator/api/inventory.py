@@ -0,0 +1,86 @@
+"""In-memory cache of the objects an UptimeRobot account contains"""
+import threading
+import time
+
+from .records import Record
+
+MONITOR = 'monitor'
+MWINDOW = 'mwindow'
+ALERT_CONTACT = 'alert_contact'
+PSP = 'psp'
+
+KINDS = (MONITOR, MWINDOW, ALERT_CONTACT, PSP)
+
+
+class Inventory:
+    """Cache of UptimeRobot objects by kind and ID, kept up to date
+    by the API client whenever it creates, updates or deletes something.
+    Objects are stored as compact records of the properties the operator compares."""
+
+    def __init__(self):
+        self.__objects: dict[str, dict[str, Record]] = {kind: {} for kind in KINDS}
+        self.__loaded_at: dict[str, float] = {kind: float('-inf') for kind in KINDS}
+        self.__restored: set[str] = set()
+        self.__lock = threading.Lock()
+
+    def get(self, kind: str, uid) -> Record | None:
+        """Retrieve the cached properties of an object, None if unknown"""
+        with self.__lock:
+            return self.__objects[kind].get(str(uid))
+
+    def put(self, kind: str, uid, props: dict):
+        """Store the properties of an object, merging them with known ones"""
+        with self.__lock:
+            cached = self.__objects[kind].get(str(uid))
+            if cached is None:
+                self.__objects[kind][str(uid)] = Record(props)
+            else:
+                cached.update(props)
+
+    def replace(self, kind: str, objects):
+        """Replace all objects of a kind with the given (ID, properties) pairs,
+        e.g. after fetching all of them from UptimeRobot"""
+        replacement = {str(uid): Record(props) for uid, props in objects}
+        with self.__lock:
+            self.__objects[kind] = replacement
+            self.__loaded_at[kind] = time.monotonic()
+            self.__restored.discard(kind)
+
+    def restore(self, kind: str, objects: dict[str, dict]):
+        """Replace all objects of a kind with the ones of a snapshot. Restored objects
+        may be outdated and should be refreshed before acting on a mismatch."""
+        with self.__lock:
+            self.__objects[kind] = {uid: Record(props) for uid, props in objects.items()}
+            self.__loaded_at[kind] = time.monotonic()
+            self.__restored.add(kind)
+
+    def is_restored(self, kind: str) -> bool:
+        """Check if the objects of a kind come from a snapshot and may be outdated"""
+        with self.__lock:
+            return kind in self.__restored
+
+    def snapshot(self, kind: str) -> dict[str, dict] | None:
+        """Retrieve a copy of all objects of a kind, None if they have never been loaded"""
+        with self.__lock:
+            if self.__loaded_at[kind] == float('-inf'):
+                return None
+            return {uid: record.to_dict() for uid, record in self.__objects[kind].items()}
+
+    def loaded_at(self, kind: str) -> float:
+        """Retrieve the monotonic time all objects of a kind were last loaded at"""
+        with self.__lock:
+            return self.__loaded_at[kind]
+
+    def remove(self, kind: str, uid):
+        """Drop an object from the cache"""
+        with self.__lock:
+            self.__objects[kind].pop(str(uid), None)
+
+    def ids(self, kind: str) -> set[str]:
+        """Retrieve the IDs of all cached objects of a kind"""
+        with self.__lock:
+            return set(self.__objects[kind])
+
+    def __len__(self):
+        with self.__lock:
+            return sum(len(objects) for objects in self.__objects.values())
@@ -0,0 +1,108 @@
+"""Durable journal of UptimeRobot mutations that survives operator restarts"""
+import logging
+import sqlite3
+import threading
+import time
+
+CREATE = 'create'
+DELETE = 'delete'
+
+RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS mutations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    action TEXT NOT NULL,
+    uid TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mutations_by_object ON mutations (kind, namespace, name);
+'''
+
+
+class Journal:
+    """Append-only journal of intended and completed creates and deletes, stored in SQLite.
+    A create is recorded before the API call and completed with the new ID afterwards,
+    so a create that finished without its ID reaching the object's status can be adopted
+    on the next attempt instead of creating a duplicate. Without a path the journal is
+    kept in memory and only protects against failures within the running process."""
+
+    def __init__(self, path: str | None = None):
+        self.__db = sqlite3.connect(path or ':memory:', check_same_thread=False,
+                                    isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.executescript(SCHEMA)
+        self.__lock = threading.Lock()
+
+    def __execute(self, query: str, *params):
+        with self.__lock:
+            return self.__db.execute(query, params).fetchall()
+
+    def intend(self, kind: str, namespace: str, name: str, action: str, uid=None) -> int:
+        """Record a mutation before it is sent to UptimeRobot, returns the entry ID"""
+        with self.__lock:
+            cursor = self.__db.execute(
+                'INSERT INTO mutations (kind, namespace, name, action, uid, created) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, namespace, name, action,
+                 None if uid is None else str(uid), time.time()))
+            return cursor.lastrowid
+
+    def complete(self, entry_id: int, uid):
+        """Mark a mutation as accepted by UptimeRobot"""
+        self.__execute('UPDATE mutations SET completed = 1, uid = ? WHERE id = ?',
+                       None if uid is None else str(uid), entry_id)
+
+    def discard(self, entry_id: int):
+        """Drop a mutation that UptimeRobot rejected"""
+        self.__execute('DELETE FROM mutations WHERE id = ?', entry_id)
+
+    def unconfirmed_create(self, kind: str, namespace: str, name: str):
+        """Retrieve the latest create of an object whose ID has not been confirmed yet
+        as a tuple of entry ID, UptimeRobot ID and completion flag, None if there is none"""
+        rows = self.__execute(
+            'SELECT id, uid, completed FROM mutations '
+            'WHERE kind = ? AND namespace = ? AND name = ? AND action = ? '
+            'ORDER BY id DESC LIMIT 1',
+            kind, namespace, name, CREATE)
+        return (rows[0][0], rows[0][1], bool(rows[0][2])) if rows else None
+
+    def confirm(self, kind: str, namespace: str, name: str, uid):
+        """Compact the creates of an object once its ID has been found in the object's status"""
+        self.__execute(
+            'DELETE FROM mutations WHERE kind = ? AND namespace = ? AND name = ? '
+            'AND action = ? AND uid = ?',
+            kind, namespace, name, CREATE, str(uid))
+
+    def forget(self, kind: str, namespace: str, name: str):
+        """Drop all entries of an object after it has been deleted"""
+        self.__execute('DELETE FROM mutations WHERE kind = ? AND namespace = ? AND name = ?',
+                       kind, namespace, name)
+
+    def unconfirmed_creates(self) -> list[tuple[int, str, str, str, str]]:
+        """Retrieve the completed creates whose ID has not been found in a status yet
+        as tuples of entry ID, kind, namespace, name and UptimeRobot ID"""
+        return self.__execute(
+            'SELECT id, kind, namespace, name, uid FROM mutations '
+            'WHERE action = ? AND completed = 1 ORDER BY id',
+            CREATE)
+
+    def pending_deletes(self) -> list[tuple[int, str, str, str, str]]:
+        """Retrieve the deletes that were never completed
+        as tuples of entry ID, kind, namespace, name and UptimeRobot ID"""
+        return self.__execute(
+            'SELECT id, kind, namespace, name, uid FROM mutations '
+            'WHERE action = ? AND completed = 0 ORDER BY id',
+            DELETE)
+
+    def compact(self):
+        """Drop entries older than the retention period"""
+        with self.__lock:
+            cursor = self.__db.execute('DELETE FROM mutations WHERE created < ?',
+                                       (time.time() - RETENTION_SECONDS,))
+        if cursor.rowcount > 0:
+            logging.info(f'compacted {cursor.rowcount} journal entries')
@@ -0,0 +1,94 @@
+"""Incremental parsing of large JSON API responses"""
+import codecs
+import json
+
+DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStream:
+    """Parses the top-level JSON object of a response streamed in byte chunks.
+    Only the text of the value that is currently parsed is kept in memory."""
+
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__decoder = codecs.getincrementaldecoder('utf-8')()
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+
+    def __read(self) -> bool:
+        if self.__eof:
+            return False
+        chunk = next(self.__chunks, None)
+        if chunk is None:
+            self.__eof = True
+            text = self.__decoder.decode(b'', final=True)
+        else:
+            text = self.__decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        # drop what has been parsed already
+        self.__buffer = self.__buffer[self.__pos:] + text
+        self.__pos = 0
+        return True
+
+    def __peek(self) -> str:
+        while True:
+            while (self.__pos < len(self.__buffer)
+                   and self.__buffer[self.__pos] in WHITESPACE):
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__read():
+                raise ValueError('unexpected end of JSON response')
+
+    def __expect(self, token: str):
+        if self.__peek() != token:
+            raise ValueError(f'expected {token!r} in JSON response at '
+                             f'{self.__buffer[self.__pos:self.__pos + 20]!r}')
+        self.__pos += 1
+
+    def __value(self):
+        self.__peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.__buffer, self.__pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.__buffer) or self.__eof:
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            self.__read()
+
+    def iter_array(self, key: str, fields: dict):
+        """Yield the items of the array under key one by one as soon as each is complete,
+        the other values of the object are stored in fields"""
+        self.__expect('{')
+        if self.__peek() == '}':
+            return
+        while True:
+            name = self.__value()
+            self.__expect(':')
+            if name == key and self.__peek() == '[':
+                self.__expect('[')
+                if self.__peek() != ']':
+                    while True:
+                        yield self.__value()
+                        if self.__peek() != ',':
+                            break
+                        self.__expect(',')
+                self.__expect(']')
+            else:
+                fields[name] = self.__value()
+            if self.__peek() != ',':
+                break
+            self.__expect(',')
+        self.__expect('}')
+
+
+def project(obj: dict, fields: tuple[str, ...] | None) -> dict:
+    """Keep only the given fields of an object, all of them without fields"""
+    if fields is None:
+        return obj
+    return {k: obj[k] for k in fields if k in obj}
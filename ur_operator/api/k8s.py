@@ -4,11 +4,74 @@ import base64
 import time
 
 import kopf
+import kubernetes.client as k8s_client
 import kubernetes.config as k8s_config
-from kubernetes.client import CustomObjectsApi, CoreV1Api, ApiClient
+from kubernetes.client.rest import ApiException
 from kubernetes.dynamic.client import DynamicClient
 from kubernetes.dynamic.exceptions import ResourceNotFoundError
-from crds import BaseCrd, GROUP
+from config import Config
+from crds import ALL_CRDS, BaseCrd, CRD_HASHES, CustomResourceDefinition, GROUP
+from crds import SPEC_HASH_ANNOTATION, make_manifest
+from .deadline import Hedger, call_timeout
+
+
+def load_config():
+    """Load the kube config, falling back to the in-cluster config"""
+    try:
+        k8s_config.load_kube_config()
+    except k8s_config.ConfigException:
+        try:
+            k8s_config.load_incluster_config()
+        except k8s_config.ConfigException as error:
+            logging.error(
+                "Failed to load kube and incluster config, giving up...")
+            raise error
+
+
+def register_crds(logger):
+    """Create the CustomResourceDefinitions of the operator or update existing ones.
+    With URO_SKIP_CRD_REGISTRATION the installed ones are only verified."""
+    if Config().SKIP_CRD_REGISTRATION:
+        verify_crds(logger)
+        return
+
+    k8s = K8s(CustomResourceDefinition)
+
+    for crd in ALL_CRDS:
+        manifest = make_manifest(crd)
+        name, spec = manifest['metadata']['name'], manifest['spec']
+        try:
+            k8s.create_resource(None, name, spec)
+            logger.info(f'CRD {name} successfully created')
+        except ApiException as error:
+            if error.status == 409:
+                k8s.update_resource(None, name, spec)
+                logger.debug(f'CRD {name} successfully patched')
+            else:
+                logger.error(f'CRD {name} failed to create')
+                raise error
+        k8s.annotate_resource(None, name, manifest['metadata']['annotations'])
+
+
+def verify_crds(logger):
+    """Verify that the installed CustomResourceDefinitions, e.g. the ones of the Helm chart,
+    match the ones of the operator by the hash of their spec"""
+    load_config()
+    api = k8s_client.ApiextensionsV1Api()
+    timeout = Config().CALL_TIMEOUT
+    for name, expected in CRD_HASHES.items():
+        try:
+            installed = api.read_custom_resource_definition(
+                name, _request_timeout=call_timeout(timeout))
+        except ApiException as error:
+            if error.status == 404:
+                raise kopf.PermanentError(f'CRD {name} is not installed') from error
+            raise
+        installed_hash = (installed.metadata.annotations or {}).get(SPEC_HASH_ANNOTATION)
+        if installed_hash != expected:
+            raise kopf.PermanentError(f'CRD {name} has spec hash {installed_hash} instead of '
+                                      f'{expected}, upgrade the CRDs to the operator version')
+        logger.debug(f'CRD {name} is up to date')
 
 
 class K8s:
@@ -16,19 +79,15 @@ class K8s:
 
     def __init__(self, crd: type[BaseCrd]):
         self.crd = crd
-        try:
-            k8s_config.load_kube_config()
-        except k8s_config.ConfigException:
-            try:
-                k8s_config.load_incluster_config()
-            except k8s_config.ConfigException as error:
-                logging.error(
-                    "Failed to load kube and incluster config, giving up...")
-                raise error
+        config = Config()
+        self.timeout = config.CALL_TIMEOUT
+        self.hedger = Hedger(config.HEDGE_PERCENTILE)
+        load_config()
 
-        client = DynamicClient(ApiClient())
-        self.core_api = CoreV1Api()
-        self.custom_objects_api = CustomObjectsApi()
+        # the API classes are only loaded by kubernetes.client once they are needed
+        client = DynamicClient(k8s_client.ApiClient())
+        self.core_api = k8s_client.CoreV1Api()
+        self.custom_objects_api = k8s_client.CustomObjectsApi()
         try:
             self.api = client.resources.get(
                 api_version=f'{crd.group()}/{crd.version()}', kind=crd.kind())
@@ -55,21 +114,44 @@ class K8s:
     def update_resource(self, namespace, name, spec, adopt=False):
         """Update a K8s resource"""
         body = self.create_body(namespace, name, spec, adopt)
-        return self.api.patch(body=body, content_type="application/merge-patch+json")
+        return self.api.patch(body=body, content_type="application/merge-patch+json",
+                              _request_timeout=call_timeout(self.timeout))
+
+    def annotate_resource(self, namespace, name, annotations: dict[str, str]):
+        """Merge the given annotations into the metadata of a K8s resource"""
+        body = {
+            'apiVersion': f'{self.crd.group()}/{self.crd.version()}',
+            'kind': self.crd.kind(),
+            'metadata': {'name': name, 'namespace': namespace, 'annotations': annotations}
+        }
+        return self.api.patch(body=body, content_type="application/merge-patch+json",
+                              _request_timeout=call_timeout(self.timeout))
+
+    def patch_resource(self, namespace, name, patch: dict):
+        """Merge a patch of metadata, spec or status into a K8s resource"""
+        body = {
+            **patch,
+            'apiVersion': f'{self.crd.group()}/{self.crd.version()}',
+            'kind': self.crd.kind(),
+            'metadata': {**patch.get('metadata', {}), 'name': name, 'namespace': namespace}
+        }
+        return self.api.patch(body=body, content_type="application/merge-patch+json",
+                              _request_timeout=call_timeout(self.timeout))
 
     def create_resource(self, namespace, name, spec, adopt=False):
         """Create a K8s resource"""
         body = self.create_body(namespace, name, spec, adopt)
-        return self.api.create(body)
+        return self.api.create(body, _request_timeout=call_timeout(self.timeout))
 
     def list_resource(self, namespace):
         """List this K8s instance's CRDs in a given namespace"""
-        return self.custom_objects_api.list_namespaced_custom_object(
+        return self.hedger.call(lambda: self.custom_objects_api.list_namespaced_custom_object(
             group=GROUP,
             version=self.crd.version(),
             plural=self.crd.plural(),
-            namespace=namespace
-        )['items']
+            namespace=namespace,
+            _request_timeout=call_timeout(self.timeout)
+        ))['items']
 
     def delete_resource(self, namespace, name):
         """Delete a K8s resource"""
@@ -79,9 +161,50 @@ class K8s:
             plural=self.crd.plural(),
             namespace=namespace,
             name=name,
+            _request_timeout=call_timeout(self.timeout)
         )
 
+    def resource_terminating(self, namespace, name) -> bool:
+        """Check if a K8s resource is being deleted or gone already"""
+        try:
+            obj = self.custom_objects_api.get_namespaced_custom_object(
+                group=GROUP,
+                version=self.crd.version(),
+                plural=self.crd.plural(),
+                namespace=namespace,
+                name=name,
+                _request_timeout=call_timeout(self.timeout)
+            )
+        except ApiException as error:
+            if error.status == 404:
+                return True
+            raise
+        return bool(obj['metadata'].get('deletionTimestamp'))
+
+    def namespace_terminating(self, namespace) -> bool:
+        """Check if a namespace is being deleted or gone already"""
+        try:
+            obj = self.core_api.read_namespace(
+                namespace, _request_timeout=call_timeout(self.timeout))
+            return obj.status.phase == 'Terminating'
+        except ApiException as error:
+            if error.status == 404:
+                return True
+            raise
+
+    def ingress_terminating(self, namespace, name) -> bool:
+        """Check if an ingress is being deleted or gone already"""
+        try:
+            ingress = k8s_client.NetworkingV1Api().read_namespaced_ingress(
+                name, namespace, _request_timeout=call_timeout(self.timeout))
+        except ApiException as error:
+            if error.status == 404:
+                return True
+            raise
+        return ingress.metadata.deletion_timestamp is not None
+
     def get_secret(self, namespace, name) -> dict[str, str]:
         """Retrieve the decoded data from a K8s secret"""
-        secret = self.core_api.read_namespaced_secret(name, namespace)
-        return {k: base64.b64decode(v).decode() for k, v in secret.data}
+        secret = self.hedger.call(lambda: self.core_api.read_namespaced_secret(
+            name, namespace, _request_timeout=call_timeout(self.timeout)))
+        return {k: base64.b64decode(v).decode() for k, v in secret.data.items()}
@@ -1,18 +1,48 @@
 """Functions to create kopf decoractors based on a CRD class"""
+from config import Config
 from crds import BaseCrd
 import kopf.on
+from .deadline import within_deadline
+from .readiness import READY
 
 # pylint: disable=missing-function-docstring
 
 
+def with_deadline(decorator, gate=READY.gate):
+    """Apply the handler deadline to the handlers decorated with a kopf decorator,
+    by default they wait for the setup of the operator before it starts"""
+    deadline = within_deadline(Config().HANDLER_DEADLINE)
+    return lambda fn: decorator(gate(deadline(fn)))
+
+
 def create(crd: type[BaseCrd]) -> kopf.on.ChangingDecorator:
-    return kopf.on.create(crd.group(), crd.version(), crd.plural())
+    return with_deadline(kopf.on.create(crd.group(), crd.version(), crd.plural()))
+
+
+def update(crd: type[BaseCrd], when=None) -> kopf.on.ChangingDecorator:
+    return with_deadline(kopf.on.update(crd.group(), crd.version(), crd.plural(), when=when))
+
+
+def delete(crd: type[BaseCrd], when=None) -> kopf.on.ChangingDecorator:
+    return with_deadline(kopf.on.delete(crd.group(), crd.version(), crd.plural(), when=when))
+
+
+def resume(crd: type[BaseCrd], when=None) -> kopf.on.ChangingDecorator:
+    return with_deadline(kopf.on.resume(crd.group(), crd.version(), crd.plural(), when=when))
+
+
+def event(crd: type[BaseCrd]) -> kopf.on.WatchingDecorator:
+    # kopf never retries event handlers, events during the setup are skipped instead of
+    # holding a worker, what they would have changed is caught up once the operator is ready
+    return with_deadline(kopf.on.event(crd.group(), crd.version(), crd.plural()), READY.bypass)
 
 
-def update(crd: type[BaseCrd]) -> kopf.on.ChangingDecorator:
-    return kopf.on.update(crd.group(), crd.version(), crd.plural())
+def index(crd: type[BaseCrd]) -> kopf.on.IndexingDecorator:
+    return kopf.index(crd.group(), crd.version(), crd.plural())
 
 
-def delete(crd: type[BaseCrd]) -> kopf.on.ChangingDecorator:
-    return kopf.on.delete(crd.group(), crd.version(), crd.plural())
+def validate(crd: type[BaseCrd]) -> kopf.on.WebhookDecorator:
+    # an unavailable or starting operator must not block changes of the resources
+    decorator = kopf.on.validate(crd.group(), crd.version(), crd.plural(), ignore_failures=True)
+    return lambda fn: decorator(READY.bypass(fn))
 # pylint: enable=missing-function-docstring
@@ -0,0 +1,31 @@
+"""Thread-safe token bucket used to stay within API rate limits"""
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket that blocks callers until a call is allowed.
+    Handlers run in kopf's thread pool, so all state is guarded by a lock."""
+
+    def __init__(self, calls_per_minute: float):
+        self.rate = calls_per_minute / 60
+        self.capacity = max(1., calls_per_minute)
+        self.__tokens = self.capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill(self, now: float):
+        self.__tokens = min(self.capacity,
+                            self.__tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    def acquire(self):
+        """Block until a token is available and consume it"""
+        while True:
+            with self.__lock:
+                self.__refill(time.monotonic())
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,101 @@
+"""Readiness gate of the operator. kopf starts watching and filling the indexes right away,
+while the UptimeRobot clients and handlers are set up in the background with retries."""
+import functools
+import threading
+
+import kopf
+
+# seconds a handler waits for the operator to become ready before it is retried
+READY_WAIT = 5
+# seconds after which a handler that found the operator starting is retried
+RETRY_DELAY = 10
+# first and maximum seconds between two attempts to set up the operator
+BACKOFF = 1
+MAX_BACKOFF = 60
+
+
+class NotReady(kopf.TemporaryError):
+    """The operator has not finished setting up yet"""
+
+
+class ReadinessGate:
+    """Opens once the setup of the operator succeeded. Handlers wait for it instead of
+    failing while the UptimeRobot API is slow or briefly unavailable at startup."""
+
+    def __init__(self):
+        self.__ready = threading.Event()
+        self.__stopped = threading.Event()
+        self.__failure: kopf.PermanentError | None = None
+        self.__thread: threading.Thread | None = None
+
+    def is_ready(self) -> bool:
+        """Check if the setup of the operator succeeded"""
+        return self.__ready.is_set()
+
+    def wait(self, timeout: float = READY_WAIT):
+        """Wait for the setup of the operator, NotReady if it did not finish within timeout and
+        the PermanentError of the setup if it failed for good"""
+        if self.__failure is not None:
+            raise kopf.PermanentError(f'the operator failed to start: {self.__failure}')
+        if not self.__ready.wait(timeout):
+            raise NotReady('the operator is still starting', delay=RETRY_DELAY)
+
+    def gate(self, fn):
+        """Decorate a handler so that it waits for the setup of the operator"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.wait()
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def bypass(self, fn):
+        """Decorate a handler so that it is skipped until the setup of the operator finished"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.is_ready():
+                return None
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def start(self, setup, logger, on_ready=None, on_fatal=None):
+        """Call setup in a background thread until it succeeds, backing off between attempts,
+        and open the gate. on_ready is called afterwards, e.g. to catch up on skipped events.
+        A PermanentError of setup is not retried, on_fatal is called instead, e.g. to exit.
+        setup has to be idempotent, an attempt may fail halfway through."""
+        def run():
+            backoff = BACKOFF
+            while not self.__stopped.is_set():
+                try:
+                    setup()
+                except kopf.PermanentError as error:
+                    self.__failure = error
+                    logger.error(f'failed to set up the operator: {error}')
+                    if on_fatal is not None:
+                        on_fatal()
+                    return
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning(f'failed to set up the operator, retrying in {backoff}s: '
+                                   f'{error}')
+                    if self.__stopped.wait(backoff):
+                        return
+                    backoff = min(2 * backoff, MAX_BACKOFF)
+                    continue
+                self.__ready.set()
+                logger.info('the operator is ready')
+                if on_ready is not None:
+                    try:
+                        on_ready()
+                    except Exception as error:  # pylint: disable=broad-except
+                        logger.warning(f'failed to catch up after the setup: {error}')
+                return
+
+        self.__thread = threading.Thread(target=run, name='startup', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop setting up the operator"""
+        self.__stopped.set()
+
+
+# gate of the handlers of this operator
+READY = ReadinessGate()
@@ -0,0 +1,79 @@
+"""Compact records of the UptimeRobot objects and UptimeRobotMonitors held in memory"""
+import sys
+
+# only these properties are kept, everything else (e.g. credentials) is dropped
+FIELDS = ('friendly_name', 'url', 'type', 'sub_type', 'port', 'keyword_value',
+          'interval', 'duration', 'value', 'status')
+
+
+class Record:
+    """Properties of an UptimeRobot object stored in slots instead of a dict, a fraction of the
+    size of the API response it is built from. Fields that have not been set are missing, like
+    the keys of a dict, so records can be read like the responses they replace."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, props: dict | None = None):
+        if props:
+            self.update(props)
+
+    def update(self, props: dict):
+        """Set the known fields of props, other properties are dropped"""
+        for field in FIELDS:
+            if field in props:
+                setattr(self, field, props[field])
+
+    def get(self, field: str, default=None):
+        """Retrieve a field, default if it has not been set"""
+        return getattr(self, field, default) if field in FIELDS else default
+
+    def to_dict(self) -> dict:
+        """Convert the record into a dict of its set fields"""
+        return {field: getattr(self, field) for field in FIELDS if hasattr(self, field)}
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other if isinstance(other, dict) else NotImplemented
+
+    def __repr__(self):
+        return f'Record({self.to_dict()!r})'
+
+
+class MonitorRecord:
+    """What the indexes of the operator keep of an UptimeRobotMonitor instead of its body:
+    its namespace and name, the name of the owning Ingress, the UptimeRobot ID, the hash of
+    the applied spec, the URL and the alerted state and its time. All monitor indexes share
+    this type.
+    Namespaces and Ingress names repeat across many monitors and are interned."""
+
+    __slots__ = ('namespace', 'name', 'owner', 'uid', 'spec_hash', 'url', 'state', 'alerted_at')
+
+    def __init__(self, namespace: str, name: str, owner: str | None = None,  # pylint: disable=too-many-arguments
+                 uid: str | None = None, spec_hash: str | None = None, url: str | None = None,
+                 state: str | None = None, alerted_at: str | None = None):
+        self.namespace = sys.intern(namespace)
+        self.name = name
+        self.owner = sys.intern(owner) if owner is not None else None
+        self.uid = str(uid) if uid is not None else None
+        self.spec_hash = spec_hash
+        self.url = url
+        self.state = state
+        self.alerted_at = alerted_at
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """Namespace and name of the monitor"""
+        return self.namespace, self.name
+
+    def __eq__(self, other):
+        if not isinstance(other, MonitorRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)
+        return f'MonitorRecord({fields})'
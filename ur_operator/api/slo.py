@@ -0,0 +1,224 @@
+"""Uptime, error budget and latency reports of the monitors of the operator, computed from
+bulk listings of the logs, uptime ratios and response times UptimeRobot keeps for them"""
+import logging
+import statistics
+import threading
+import time
+
+import kopf
+from kubernetes.client.rest import ApiException
+from requests.exceptions import RequestException
+
+# status key the report of a monitor is stored under
+SLO_KEY = 'slo'
+# log type of a period the monitor was down
+DOWN_LOG = 1
+QUANTILES = (50, 95, 99)
+# UptimeRobot keeps response times for at most a week, a day is plenty for percentiles
+RESPONSE_TIME_WINDOW = 86400
+PRECISION = 5
+STATS_FIELDS = ('id', 'custom_uptime_ratio', 'logs', 'response_times')
+# changes of the report of a monitor that are written into its status, smaller ones are only
+# exported as metrics; latencies are compared relative to the written ones
+STATUS_TOLERANCE = {'uptime': 0.0001, 'errorBudgetRemaining': 0.05, 'burnRate': 0.1}
+LATENCY_TOLERANCE = 0.1
+
+
+def downtime(logs: list[dict], start: float, end: float) -> float:
+    """Seconds the down periods in the logs of a monitor overlap the window from start to end"""
+    total = 0.
+    for log in logs:
+        if int(log.get('type', 0)) != DOWN_LOG:
+            continue
+        began = int(log['datetime'])
+        total += max(0., min(end, began + int(log.get('duration') or 0)) - max(start, began))
+    return total
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    """Latency percentiles of response times in milliseconds, None without samples"""
+    if not samples:
+        return {f'p{q}': None for q in QUANTILES}
+    if len(samples) == 1:
+        return {f'p{q}': float(samples[0]) for q in QUANTILES}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {f'p{q}': round(cuts[q - 1], 1) for q in QUANTILES}
+
+
+def budget_remaining(uptime: float | None, target: float) -> float | None:
+    """Share of the error budget of the SLO target an uptime leaves, negative if overspent"""
+    if uptime is None:
+        return None
+    return round(1 - (1 - uptime) / (1 - target), PRECISION)
+
+
+def changed_significantly(written: dict | None, report: dict) -> bool:
+    """Check if a report differs from the one written into the status by more than the
+    tolerances, e.g. because the error budget shrank or the burn rate rose"""
+    if written is None:
+        return True
+    pairs = [(written[field], report[field], tolerance)
+             for field, tolerance in STATUS_TOLERANCE.items()]
+    pairs.extend((written['latencyMs'][key], value,
+                  LATENCY_TOLERANCE * (written['latencyMs'][key] or 0))
+                 for key, value in report['latencyMs'].items())
+    for old, new, tolerance in pairs:
+        if (old is None) != (new is None) or (old is not None and abs(new - old) > tolerance):
+            return True
+    return False
+
+
+def aggregate(reports: list[dict], samples: list[list[float]], target: float) -> dict:
+    """Combine the reports of monitors, e.g. of an Ingress or namespace. Every monitor counts
+    the same for uptime and burn rate, latencies are computed from all their response times."""
+    uptimes = [report['uptime'] for report in reports if report['uptime'] is not None]
+    uptime = round(statistics.fmean(uptimes), PRECISION) if uptimes else None
+    return {
+        'monitors': len(reports),
+        'uptime': uptime,
+        'errorBudgetRemaining': budget_remaining(uptime, target),
+        'burnRate': round(statistics.fmean(report['burnRate'] for report in reports), PRECISION),
+        'latencyMs': percentiles([value for values in samples for value in values])
+    }
+
+
+class SloReporter:
+    """Computes the uptime over the SLO period, the remaining error budget, the burn rate over
+    the burn window and latency percentiles of all monitors with an UptimeRobot ID, and of their
+    Ingresses and namespaces. Statistics are fetched for up to 50 monitors per UptimeRobot call.
+    records is the kopf index of the records of monitors by namespace.
+    The report of each monitor is written into its status whenever it changed noticeably.
+    Monitors of namespaces whose account cannot be read are left out of the report."""
+
+    def __init__(self, ur, records, k8s, config, clock=time.time):  # pylint: disable=too-many-arguments
+        self.uptime_robots = ur
+        self.records = records
+        self.k8s = k8s
+        self.target = config.SLO_TARGET / 100
+        self.period_days = config.SLO_PERIOD_DAYS
+        self.burn_window = config.SLO_BURN_WINDOW
+        self.interval = config.SLO_REPORT_INTERVAL
+        self.clock = clock
+        self.report: dict[str, dict] = {'monitors': {}, 'ingresses': {}, 'namespaces': {}}
+        self.__written: dict[tuple[str, str], dict] = {}
+        self.__stopped = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def __monitor_report(self, monitor: dict, now: float) -> tuple[dict, list[float]]:
+        ratios = str(monitor.get('custom_uptime_ratio') or '').split('-')
+        try:
+            uptime = round(float(ratios[0]) / 100, PRECISION)
+        except ValueError:
+            uptime = None
+        down = downtime(monitor.get('logs') or [], now - self.burn_window, now)
+        samples = [float(entry['value']) for entry in monitor.get('response_times') or []]
+        return {
+            'uptime': uptime,
+            'errorBudgetRemaining': budget_remaining(uptime, self.target),
+            'burnRate': round(down / self.burn_window / (1 - self.target), PRECISION),
+            'latencyMs': percentiles(samples)
+        }, samples
+
+    def collect(self) -> dict[str, dict]:
+        """Fetch the statistics of all monitors and compute the report"""
+        now = self.clock()
+        accounts: dict[str, tuple] = {}
+        for namespace in list(self.records):
+            records = [record for record in self.records.get(namespace, [])
+                       if record.uid is not None]
+            if not records:
+                continue
+            try:
+                uptime_robot = self.uptime_robots.for_namespace(namespace)
+            except (kopf.TemporaryError, RequestException, ApiException) as error:
+                logging.warning(f'monitors of namespace {namespace} are not reported: {error}')
+                continue
+            for record in records:
+                _, owners = accounts.setdefault(uptime_robot.fingerprint, (uptime_robot, {}))
+                owners.setdefault(record.uid, []).append((namespace, record.name, record.owner))
+
+        params = {'custom_uptime_ratios': str(self.period_days), 'logs': 1,
+                  'logs_start_date': int(now - self.burn_window), 'logs_end_date': int(now),
+                  'response_times': 1,
+                  'response_times_start_date': int(now - RESPONSE_TIME_WINDOW),
+                  'response_times_end_date': int(now)}
+        monitors, groups = {}, {}
+        for uptime_robot, owners in accounts.values():
+            try:
+                for monitor in uptime_robot.iter_monitor_stats(sorted(owners),
+                                                               fields=STATS_FIELDS, **params):
+                    report, samples = self.__monitor_report(monitor, now)
+                    for namespace, name, ingress in owners.get(str(monitor['id']), []):
+                        monitors[(namespace, name)] = report
+                        groups.setdefault(('namespaces', namespace), []).append((report, samples))
+                        if ingress is not None:
+                            groups.setdefault(('ingresses', (namespace, ingress)),
+                                              []).append((report, samples))
+            except (kopf.TemporaryError, RequestException) as error:
+                # the monitors listed so far are still reported
+                logging.warning(f'statistics of account {uptime_robot.fingerprint} are '
+                                f'incomplete: {error}')
+
+        result = {'monitors': monitors, 'ingresses': {}, 'namespaces': {}}
+        for (scope, key), members in groups.items():
+            result[scope][key] = aggregate([report for report, _ in members],
+                                           [samples for _, samples in members], self.target)
+        return result
+
+    def run_once(self):
+        """Compute the report and write the noticeably changed reports of monitors into their
+        status"""
+        self.report = self.collect()
+        for (namespace, name), report in self.report['monitors'].items():
+            if not changed_significantly(self.__written.get((namespace, name)), report):
+                continue
+            self.k8s.patch_resource(namespace, name, {'status': {SLO_KEY: report}})
+            self.__written[(namespace, name)] = report
+        for key in self.__written.keys() - self.report['monitors'].keys():
+            del self.__written[key]
+
+    def metrics(self) -> str:
+        """Render the report in the Prometheus text format"""
+        lines = []
+        for scope, prefix, label in (('monitors', 'uptimerobot_monitor', 'name'),
+                                     ('ingresses', 'uptimerobot_ingress', 'ingress'),
+                                     ('namespaces', 'uptimerobot_namespace', None)):
+            samples = {'uptime_ratio': [], 'error_budget_remaining': [], 'burn_rate': [],
+                       'response_time_milliseconds': []}
+            for key, report in sorted(self.report[scope].items()):
+                labels = (f'namespace="{key[0]}",{label}="{key[1]}"' if label
+                          else f'namespace="{key}"')
+                for metric, field in (('uptime_ratio', 'uptime'),
+                                      ('error_budget_remaining', 'errorBudgetRemaining'),
+                                      ('burn_rate', 'burnRate')):
+                    if report[field] is not None:
+                        samples[metric].append(f'{prefix}_{metric}{{{labels}}} {report[field]}')
+                for quantile in QUANTILES:
+                    value = report['latencyMs'][f'p{quantile}']
+                    if value is not None:
+                        samples['response_time_milliseconds'].append(
+                            f'{prefix}_response_time_milliseconds'
+                            f'{{{labels},quantile="{quantile / 100}"}} {value}')
+            for metric, values in samples.items():
+                if values:
+                    lines.append(f'# TYPE {prefix}_{metric} gauge')
+                    lines.extend(values)
+        return '\n'.join(lines) + '\n'
+
+    def start(self):
+        """Compute the report every interval seconds in a background thread"""
+        def run():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as error:  # pylint: disable=broad-except
+                    logging.warning(f'failed to compute the SLO report: {error}')
+                if self.__stopped.wait(self.interval):
+                    return
+
+        self.__thread = threading.Thread(target=run, name='slo-report', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop computing the report"""
+        self.__stopped.set()
@@ -0,0 +1,129 @@
+"""Persistent snapshot of the UptimeRobot inventories for warm restarts"""
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import kubernetes.client as k8s_client
+from kubernetes.client.rest import ApiException
+from .inventory import KINDS
+
+VERSION = 1
+CONFIGMAP_KEY = 'inventory.json.gz'
+
+
+class InventorySnapshot:
+    """Versioned, gzipped snapshot of the inventories of all UptimeRobot accounts,
+    stored in a file on a mounted volume or in a ConfigMap. Accounts are identified
+    by a fingerprint of their API key, the key itself is never stored."""
+
+    def __init__(self, config):
+        self.path = config.SNAPSHOT_PATH
+        self.configmap = config.SNAPSHOT_CONFIGMAP
+        self.interval = config.SNAPSHOT_INTERVAL
+        self.max_age = config.SNAPSHOT_MAX_AGE
+        self.core_api = k8s_client.CoreV1Api() if self.configmap else None
+        self.__stopped = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def __read(self) -> bytes | None:
+        if self.path:
+            try:
+                with open(self.path, 'rb') as snapshot_file:
+                    return snapshot_file.read()
+            except FileNotFoundError:
+                return None
+
+        namespace, name = self.configmap.split('/')
+        try:
+            configmap = self.core_api.read_namespaced_config_map(name, namespace)
+        except ApiException as error:
+            if error.status == 404:
+                return None
+            raise
+        data = (configmap.binary_data or {}).get(CONFIGMAP_KEY)
+        return base64.b64decode(data) if data else None
+
+    def __write(self, data: bytes):
+        if self.path:
+            # write to a temporary file first, a crash must never leave a truncated snapshot
+            with open(f'{self.path}.tmp', 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(f'{self.path}.tmp', self.path)
+            return
+
+        namespace, name = self.configmap.split('/')
+        body = k8s_client.V1ConfigMap(
+            metadata=k8s_client.V1ObjectMeta(name=name, namespace=namespace),
+            binary_data={CONFIGMAP_KEY: base64.b64encode(data).decode()})
+        try:
+            self.core_api.replace_namespaced_config_map(name, namespace, body)
+        except ApiException as error:
+            if error.status != 404:
+                raise
+            self.core_api.create_namespaced_config_map(namespace, body)
+
+    def load(self) -> dict | None:
+        """Load the snapshot, None if there is none or it has an unknown version"""
+        try:
+            data = self.__read()
+            snapshot = json.loads(gzip.decompress(data)) if data else None
+        except (OSError, ValueError, ApiException) as error:
+            logging.warning(f'failed to load inventory snapshot: {error}')
+            return None
+
+        if snapshot is None or snapshot.get('version') != VERSION:
+            return None
+        return snapshot
+
+    def restore(self, fingerprint: str, kind: str) -> dict[str, dict] | None:
+        """Retrieve the objects of a kind of an account, None if the snapshot does not contain
+        them or they are older than the configured maximum age"""
+        snapshot = self.load()
+        entry = snapshot['accounts'].get(fingerprint, {}).get(kind) if snapshot else None
+        if entry is None or time.time() - entry['taken_at'] > self.max_age:
+            return None
+        return entry['objects']
+
+    def save(self, clients):
+        """Store the loaded inventories of the given clients. Kinds that have not been loaded
+        or that were restored from a snapshot keep their previous content."""
+        snapshot = self.load() or {'version': VERSION, 'accounts': {}}
+        now = time.time()
+        changed = False
+        for client in clients:
+            for kind in KINDS:
+                objects = client.inventory.snapshot(kind)
+                if objects is None or client.inventory.is_restored(kind):
+                    continue
+                snapshot['accounts'].setdefault(client.fingerprint, {})[kind] = {
+                    'taken_at': now,
+                    'objects': objects
+                }
+                changed = True
+
+        if not changed:
+            # e.g. a standby replica, never overwrite the snapshot of the active one
+            return
+        snapshot['taken_at'] = now
+        self.__write(gzip.compress(json.dumps(snapshot, separators=(',', ':')).encode()))
+
+    def start(self, pool):
+        """Save the inventories of a client pool periodically in a background thread"""
+        def run():
+            while not self.__stopped.wait(self.interval):
+                try:
+                    self.save(pool.clients())
+                except Exception as error:  # pylint: disable=broad-except
+                    logging.warning(f'failed to save inventory snapshot: {error}')
+
+        self.__thread = threading.Thread(target=run, name='inventory-snapshot', daemon=True)
+        self.__thread.start()
+
+    def stop(self, pool):
+        """Stop saving periodically and save a final snapshot"""
+        self.__stopped.set()
+        self.save(pool.clients())
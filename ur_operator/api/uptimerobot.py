@@ -1,28 +1,106 @@
 """UptimeRobot API client"""
+import hashlib
 import logging
+import threading
+import time
+
+from urllib.parse import urljoin
 
 import kopf
+from requests.exceptions import HTTPError, RequestException
 from uptimerobotpy import UptimeRobot as UR
 
+from .batcher import Batcher
+from .circuit_breaker import CircuitBreaker
+from .deadline import DeadlineSession, Hedger
+from .inventory import Inventory, KINDS, MONITOR, MWINDOW, ALERT_CONTACT, PSP
+from .json_stream import JsonStream, project
+from .records import FIELDS, Record
+from .rate_limiter import RateLimiter
+
+FREE_PLAN_RATE_LIMIT = 10
+PRO_PLAN_MAX_RATE_LIMIT = 5000
+PAGE_SIZE = 50
+INVENTORY_MAX_AGE = 300
+ACCOUNT_MAX_AGE = 300
+# list endpoint and JSON name of the objects of each kind
+LISTS = {
+    MONITOR: ('getMonitors', 'monitors'),
+    MWINDOW: ('getMWindows', 'mwindows'),
+    ALERT_CONTACT: ('getAlertContacts', 'alert_contacts'),
+    PSP: ('getPSPs', 'psps')
+}
+INVENTORY_FIELDS = ('id',) + FIELDS
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class UptimeRobot:
-    """UptimeRobot API client"""
+    """UptimeRobot API client for a single account.
+    Every client has its own rate limiter and inventory cache."""
 
-    def __init__(self, config):
-        try:
-            ur_api_key = config.UPTIMEROBOT_API_KEY
-        except KeyError as error:
-            msg = f'Required environment variable {error.args[0]} has not been provided'
-            logging.error(msg)
-            raise RuntimeError(msg) from error
+    def __init__(self, config, api_key: str | None = None, snapshot=None):
+        if api_key is None:
+            try:
+                api_key = config.UPTIMEROBOT_API_KEY
+            except KeyError as error:
+                msg = f'Required environment variable {error.args[0]} has not been provided'
+                logging.error(msg)
+                raise RuntimeError(msg) from error
 
-        self.api = UR(api_key=ur_api_key)
+        self.api = UR(api_key=api_key, req_obj=DeadlineSession(config.CALL_TIMEOUT))
+        self.hedger = Hedger(config.HEDGE_PERCENTILE)
+        self.fingerprint = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        # keys hashes of requests that are stored in resources, e.g. to deduplicate monitors
+        self.hash_secret = hashlib.sha256(f'hash-secret:{api_key}'.encode()).digest()
+        self.inventory = Inventory()
+        self.snapshot = snapshot
+        self.__inventory_locks = {kind: threading.Lock() for kind in KINDS}
+        self.__refreshers = {kind: Batcher(lambda ids, kind=kind: self.__fetch(kind, ids),
+                                           PAGE_SIZE)
+                             for kind in KINDS}
         resp = self.api.get_account_details()
 
         if resp['stat'] != 'ok':  # type: ignore
             logging.error('failed to authenticate against UptimeRobot API')
             raise RuntimeError(resp['error'])  # type: ignore
 
+        self.__account = resp['account']  # type: ignore
+        self.__account_loaded_at = time.monotonic()
+        self.__account_lock = threading.Lock()
+        self.rate_limiter = RateLimiter(
+            config.RATE_LIMIT or self.__plan_rate_limit(self.__account))
+        self.breaker = CircuitBreaker(config, self.rate_limiter)
+
+    @staticmethod
+    def __plan_rate_limit(account: dict):
+        # free plans allow 10 requests per minute, pro plans twice the monitor limit
+        monitor_limit = int(account.get('monitor_limit', 0))
+        if monitor_limit <= 50:
+            return FREE_PLAN_RATE_LIMIT
+        return min(2 * monitor_limit, PRO_PLAN_MAX_RATE_LIMIT)
+
+    def account_details(self, max_age: float = ACCOUNT_MAX_AGE) -> dict:
+        """Retrieve the details of this account, e.g. its monitor limit and minimum interval.
+        They are fetched again once they are older than max_age seconds, if that fails the
+        cached ones are returned."""
+        with self.__account_lock:
+            if time.monotonic() - self.__account_loaded_at >= max_age:
+                try:
+                    resp = self.__read(self.api.get_account_details)
+                except (kopf.TemporaryError, RequestException):
+                    resp = {'stat': 'fail'}
+                if resp['stat'] == 'ok':
+                    self.__account = resp['account']
+                    self.__account_loaded_at = time.monotonic()
+            return dict(self.__account)
+
+    def __request(self, method, *args, **kwargs):
+        return self.breaker.call(method, *args, **kwargs)
+
+    def __read(self, method, **kwargs):
+        # reads are idempotent, a hedged attempt goes through the rate limiter as well
+        return self.hedger.call(self.__request, method, mutation=False, **kwargs)
+
     @staticmethod
     def __check_response(resp, logger, thing, action, uid=None, json_name=None):
         json_name = json_name if json_name else thing.lower()
@@ -41,57 +119,201 @@ class UptimeRobot:
         raise kopf.PermanentError(
             f'failed to {action} {thing}{id_desc}: {resp["error"]}')
 
+    def __cache(self, kind, uid, props):
+        if uid is not None:
+            self.inventory.put(kind, uid, props)
+
+    def __uncache(self, kind, uid):
+        self.inventory.remove(kind, uid)
+
     @staticmethod
     def __stringify_values(props):
         return {k: str(v) for k, v in props.items()}
+
+    def __post(self, route: str, **params):
+        resp = self.api.request_session.post(urljoin(self.api.endpoint, route),
+                                             json={**params, **self.api.payload}, stream=True)
+        if resp.status_code // 100 != 2:
+            resp.close()
+            raise HTTPError(f'{resp.status_code} ==> {resp.reason}', response=resp)
+        return resp
+
+    def __stream(self, kind: str, meta: dict, fields: tuple[str, ...] | None, **params):
+        """Yield the objects a list call returns as soon as each of them has been parsed,
+        keeping only the given fields. The other values of the response are stored in meta."""
+        route, json_name = LISTS[kind]
+        # not hedged, the latency of a streamed read is only known once its body is consumed
+        with self.__request(self.__post, mutation=False, route=route, **params) as resp:
+            for obj in JsonStream(resp.iter_content(STREAM_CHUNK_SIZE)).iter_array(json_name,
+                                                                                   meta):
+                yield project(obj, fields)
+        if meta.get('stat') != 'ok':
+            raise kopf.TemporaryError(f'failed to list {json_name}: {meta.get("error")}')
+
+    def iter_objects(self, kind: str, fields: tuple[str, ...] | None = None, **params):
+        """Iterate over all objects of a kind in this account, page by page. Responses are
+        parsed as they are received, only one object and its given fields are held at a time."""
+        offset = 0
+        while True:
+            meta, count = {}, 0
+            for obj in self.__stream(kind, meta, fields, offset=offset, limit=PAGE_SIZE, **params):
+                count += 1
+                yield obj
+
+            # getAlertContacts returns the pagination at the top level
+            pagination = meta.get('pagination', meta)
+            offset += count
+            if not count or offset >= int(pagination.get('total', 0)):
+                return
+
+    def load_inventory(self, kind: str, max_age: float = INVENTORY_MAX_AGE, restore=True):
+        """Load all objects of a kind into the inventory, unless that happened
+        within the last max_age seconds. Concurrent callers share a single bulk fetch.
+        Without restore the snapshot is never used and the objects are always listed."""
+        with self.__inventory_locks[kind]:
+            loaded_at = self.inventory.loaded_at(kind)
+            if time.monotonic() - loaded_at < max_age:
+                return
+            if restore and self.snapshot is not None and loaded_at == float('-inf'):
+                objects = self.snapshot.restore(self.fingerprint, kind)
+                if objects is not None:
+                    self.inventory.restore(kind, objects)
+                    logging.info(f'restored {len(objects)} objects of kind {kind} from snapshot')
+                    return
+            self.inventory.replace(kind, ((obj['id'], obj)
+                                          for obj in self.iter_objects(kind, INVENTORY_FIELDS)))
+            logging.info(f'loaded {len(self.inventory.ids(kind))} objects of kind {kind}')
+
+    def __fetch(self, kind: str, ids: list[str]) -> dict[str, Record]:
+        _, json_name = LISTS[kind]
+        found = {str(obj['id']): obj for obj in self.__stream(
+            kind, {}, INVENTORY_FIELDS, **{json_name: '-'.join(ids)})}
+        for uid in ids:
+            if uid in found:
+                self.inventory.put(kind, uid, found[uid])
+            else:
+                self.inventory.remove(kind, uid)
+        return {uid: self.inventory.get(kind, uid) for uid in found}
+
+    def iter_monitor_stats(self, ids: list[str], fields: tuple[str, ...] | None = None,
+                           **params):
+        """Iterate over the given monitors with statistics like logs, response times or custom
+        uptime ratios requested by params, fetching them in batches of PAGE_SIZE monitors"""
+        for start in range(0, len(ids), PAGE_SIZE):
+            yield from self.__stream(MONITOR, {}, fields,
+                                     monitors='-'.join(ids[start:start + PAGE_SIZE]), **params)
+
+    def refresh_object(self, kind: str, uid) -> Record | None:
+        """Fetch the current properties of a single object into the inventory, None if it does
+        not exist. Concurrent refreshes are coalesced into batched list calls."""
+        return self.__refreshers[kind].get(str(uid))
+
+    def find_id(self, kind: str, props: dict):
+        """Find the ID of an object with the friendly name and URL of the given request props,
+        None if there is none"""
+        for obj in self.iter_objects(kind, ('id', 'friendly_name', 'url')):
+            if (obj.get('friendly_name') == props.get('friendly_name')
+                    and obj.get('url') == props.get('url')):
+                return str(obj['id'])
+        return None
+
+    def create(self, kind: str, logger, props: dict):
+        """Create an object of the given kind, returns its ID"""
+        if kind == MONITOR:
+            return self.create_monitor(props.get('friendly_name'), props, logger)
+        return {
+            MWINDOW: self.create_mw,
+            ALERT_CONTACT: self.create_ac,
+            PSP: self.create_psp
+        }[kind](logger, props)
+
+    def update(self, kind: str, logger, uid, props: dict):
+        """Edit an object of the given kind, returns its ID"""
+        if kind == MONITOR:
+            return self.update_monitor(props, uid, logger)
+        return {
+            MWINDOW: self.update_mw,
+            ALERT_CONTACT: self.update_ac,
+            PSP: self.update_psp
+        }[kind](logger, uid, props)
+
+    def delete(self, kind: str, logger, uid):
+        """Delete an object of the given kind"""
+        return {
+            MONITOR: self.delete_monitor,
+            MWINDOW: self.delete_mw,
+            ALERT_CONTACT: self.delete_ac,
+            PSP: self.delete_psp
+        }[kind](logger, uid)
 # pylint: disable=missing-function-docstring
 
     def create_psp(self, logger, props):
-        resp = self.api.new_psp(type='1', **self.__stringify_values(props))
-        return self.__check_response(resp, logger, "PSP", "create")
+        resp = self.__request(self.api.new_psp, type='1', **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "PSP", "create")
+        self.__cache(PSP, uid, props)
+        return uid
 
     def update_psp(self, logger, uid, props):
-        resp = self.api.edit_psp(uid, **self.__stringify_values(props))
-        return self.__check_response(resp, logger, "PSP", "update")
+        resp = self.__request(self.api.edit_psp, uid, **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "PSP", "update", uid)
+        self.__cache(PSP, uid, props)
+        return uid
 
     def delete_psp(self, logger, uid):
-        resp = self.api.delete_psp(uid)
-        return self.__check_response(resp, logger, "PSP", "delete")
+        resp = self.__request(self.api.delete_psp, uid)
+        self.__uncache(PSP, uid)
+        return self.__check_response(resp, logger, "PSP", "delete", uid)
 
     def create_monitor(self, name: str, spec: dict, logger):
-        resp = self.api.new_monitor(**spec)
-        return self.__check_response(resp, logger, "monitor", "create", name)
+        resp = self.__request(self.api.new_monitor, **spec)
+        uid = self.__check_response(resp, logger, "monitor", "create", name)
+        self.__cache(MONITOR, uid, spec)
+        return uid
 
     def update_monitor(self, spec: dict, uid, logger):
-        resp = self.api.edit_monitor(uid, **spec)
-        return self.__check_response(resp, logger, "monitor", "update", uid)
+        resp = self.__request(self.api.edit_monitor, uid, **spec)
+        uid = self.__check_response(resp, logger, "monitor", "update", uid)
+        self.__cache(MONITOR, uid, spec)
+        return uid
 
     def delete_monitor(self, logger, uid):
-        resp = self.api.delete_monitor(uid)
+        resp = self.__request(self.api.delete_monitor, uid)
+        self.__uncache(MONITOR, uid)
         return self.__check_response(resp, logger, "monitor", "delete", uid)
 
     def create_mw(self, logger, props):
-        resp = self.api.new_m_window(**self.__stringify_values(props))
-        return self.__check_response(resp, logger, "MW", "create", json_name="mwindow")
+        resp = self.__request(self.api.new_m_window, **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "MW", "create", json_name="mwindow")
+        self.__cache(MWINDOW, uid, props)
+        return uid
 
     def update_mw(self, logger, uid, props):
-        resp = self.api.edit_m_window(uid, **self.__stringify_values(props))
-        return self.__check_response(resp, logger, "MW", "update", uid, "mwindow")
+        resp = self.__request(self.api.edit_m_window, uid, **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "MW", "update", uid, "mwindow")
+        self.__cache(MWINDOW, uid, props)
+        return uid
 
     def delete_mw(self, logger, uid):
-        resp = self.api.delete_m_window(uid)
+        resp = self.__request(self.api.delete_m_window, uid)
+        self.__uncache(MWINDOW, uid)
         return self.__check_response(resp, logger, "MW", "delete", uid)
 
     def create_ac(self, logger, props):
-        resp = self.api.new_alert_contact(**self.__stringify_values(props))
-        return self.__check_response(resp, logger, "alert contact", "delete", id, "alertcontact")
+        resp = self.__request(self.api.new_alert_contact, **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "alert contact", "create",
+                                    json_name="alertcontact")
+        self.__cache(ALERT_CONTACT, uid, props)
+        return uid
 
     def update_ac(self, logger, uid, props):
-        resp = self.api.edit_alert_contact(
-            uid, **self.__stringify_values(props))
-        return self.__check_response(resp, logger, "alert contact", "update", uid, "alert_contact")
+        resp = self.__request(self.api.edit_alert_contact,
+                              uid, **self.__stringify_values(props))
+        uid = self.__check_response(resp, logger, "alert contact", "update", uid, "alert_contact")
+        self.__cache(ALERT_CONTACT, uid, props)
+        return uid
 
     def delete_ac(self, logger, uid):
-        resp = self.api.delete_alert_contact(uid)
-        return self.__check_response(resp, logger, "alert contact", "update", uid)
+        resp = self.__request(self.api.delete_alert_contact, uid)
+        self.__uncache(ALERT_CONTACT, uid)
+        return self.__check_response(resp, logger, "alert contact", "delete", uid)
 # pylint: enable=missing-function-docstring
@@ -0,0 +1,110 @@
+"""Pool of UptimeRobot API clients selected per namespace"""
+import base64
+import threading
+import time
+
+import kopf
+import kubernetes.client as k8s_client
+from kubernetes.client.rest import ApiException
+from crds import GROUP
+from .deadline import Hedger, call_timeout
+from .journal import Journal
+from .k8s import load_config
+from .snapshot import InventorySnapshot
+from .uptimerobot import UptimeRobot
+
+API_KEY_SECRET_ANNOTATION = f'{GROUP}/api-key-secret'
+API_KEY_SECRET_KEY = 'UPTIMEROBOT_API_KEY'
+
+
+class UptimeRobotPool:
+    """Holds one UptimeRobot client per API key. The key of a namespace is read from the secret
+    referenced by its api-key-secret annotation, falling back to the global API key.
+    Without journaled, e.g. for read-only tools, the journal is kept in memory only."""
+
+    def __init__(self, config, journaled: bool = True):
+        self.config = config
+        load_config()
+        self.core_api = k8s_client.CoreV1Api()
+        self.hedger = Hedger(config.HEDGE_PERCENTILE)
+        self.snapshot = (InventorySnapshot(config)
+                         if config.SNAPSHOT_PATH or config.SNAPSHOT_CONFIGMAP else None)
+        self.default = UptimeRobot(config, snapshot=self.snapshot)
+        self.journal = Journal(config.JOURNAL_PATH if journaled else None)
+        self.__clients: dict[str, UptimeRobot] = {}
+        self.__namespaces: dict[str, tuple[float, UptimeRobot]] = {}
+        self.__lock = threading.Lock()
+
+    def clients(self) -> list[UptimeRobot]:
+        """Retrieve all clients of this pool, starting with the default one"""
+        with self.__lock:
+            return [self.default, *self.__clients.values()]
+
+    def replay_journal(self, logger, orphaned=None):
+        """Finish the deletes that were interrupted by a restart and compact the journal.
+        With orphaned, a function of kind, namespace and name, the objects of unconfirmed
+        creates whose resource is gone are deleted. Those of existing resources are adopted
+        once their handlers run again."""
+        for entry_id, kind, namespace, name, uid in self.journal.pending_deletes():
+            logger.info(f'replaying interrupted delete of {kind} {uid} for {namespace}/{name}')
+            try:
+                self.for_namespace(namespace).delete(kind, logger, uid)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning(f'failed to replay delete of {kind} {uid}: {error}')
+                continue
+            self.journal.complete(entry_id, uid)
+
+        for _, kind, namespace, name, uid in (self.journal.unconfirmed_creates()
+                                              if orphaned is not None else []):
+            try:
+                if not orphaned(kind, namespace, name):
+                    continue
+                logger.info(f'deleting {kind} {uid} created for {namespace}/{name}, '
+                            f'which is gone')
+                self.for_namespace(namespace).delete(kind, logger, uid)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning(f'failed to replay create of {kind} {uid}: {error}')
+                continue
+            self.journal.forget(kind, namespace, name)
+        self.journal.compact()
+
+    def for_namespace(self, namespace: str | None) -> UptimeRobot:
+        """Retrieve the client for the UptimeRobot account assigned to a namespace"""
+        if namespace is None:
+            return self.default
+
+        with self.__lock:
+            cached = self.__namespaces.get(namespace)
+        if cached and time.monotonic() - cached[0] < self.config.NAMESPACE_CACHE_TTL:
+            return cached[1]
+
+        client = self.__resolve(namespace)
+        with self.__lock:
+            self.__namespaces[namespace] = (time.monotonic(), client)
+        return client
+
+    def __resolve(self, namespace: str) -> UptimeRobot:
+        timeout = self.config.CALL_TIMEOUT
+        annotations = self.hedger.call(lambda: self.core_api.read_namespace(
+            namespace, _request_timeout=call_timeout(timeout))).metadata.annotations or {}
+        secret_name = annotations.get(API_KEY_SECRET_ANNOTATION)
+        if not secret_name:
+            return self.default
+
+        try:
+            secret = self.hedger.call(lambda: self.core_api.read_namespaced_secret(
+                secret_name, namespace, _request_timeout=call_timeout(timeout)))
+            api_key = base64.b64decode(secret.data[API_KEY_SECRET_KEY]).decode()
+        except (ApiException, KeyError, TypeError) as error:
+            # never fall back to the global account, objects would end up in the wrong one
+            raise kopf.TemporaryError(
+                f'failed to read {API_KEY_SECRET_KEY} from secret {namespace}/{secret_name}: '
+                f'{error}', delay=60) from error
+
+        with self.__lock:
+            client = self.__clients.get(api_key)
+        if client is None:
+            client = UptimeRobot(self.config, api_key, self.snapshot)
+            with self.__lock:
+                client = self.__clients.setdefault(api_key, client)
+        return client
@@ -9,6 +9,12 @@ class Config:
         """Flag for disabling ingress handling"""
         return os.getenv('URO_DISABLE_INGRESS_HANDLING', 'False').lower() in ['true', '1']
 
+    @property
+    def INGRESS_DIRECT_MODE(self):
+        """Flag for managing the UptimeRobot monitors of ingresses directly,
+        without creating UptimeRobotMonitor objects for them"""
+        return os.getenv('URO_INGRESS_DIRECT_MODE', 'False').lower() in ['true', '1']
+
     @property
     def EXCLUDED_DOMAINS(self):
         """Domains excluded from processing in ingresses"""
@@ -28,3 +34,207 @@ class Config:
     def UPTIMEROBOT_API_KEY(self):
         """UptimeRobot API key"""
         return os.environ['UPTIMEROBOT_API_KEY']
+
+    @property
+    def RATE_LIMIT(self):
+        """Maximum number of UptimeRobot API calls per minute and account,
+        derived from the account's plan if not set"""
+        rate_limit = os.getenv('URO_RATE_LIMIT')
+        return float(rate_limit) if rate_limit else None
+
+    @property
+    def NAMESPACE_CACHE_TTL(self):
+        """Seconds for which the UptimeRobot account of a namespace is cached"""
+        return float(os.getenv('URO_NAMESPACE_CACHE_TTL', '60'))
+
+    @property
+    def HANDLER_DEADLINE(self):
+        """Seconds a handler invocation may take, the timeouts of its UptimeRobot and
+        Kubernetes API calls are derived from it"""
+        return float(os.getenv('URO_HANDLER_DEADLINE', '120'))
+
+    @property
+    def CALL_TIMEOUT(self):
+        """Maximum number of seconds a single UptimeRobot or Kubernetes API call may take"""
+        return float(os.getenv('URO_CALL_TIMEOUT', '30'))
+
+    @property
+    def HEDGE_PERCENTILE(self):
+        """Percentile of the recent latencies after which an idempotent read is sent again,
+        the faster response is used. Reads are not hedged if not set."""
+        percentile = os.getenv('URO_HEDGE_PERCENTILE')
+        return float(percentile) if percentile else None
+
+    @property
+    def BREAKER_ERROR_RATE(self):
+        """Share of failed or slow UptimeRobot API calls that opens the circuit breaker"""
+        return float(os.getenv('URO_BREAKER_ERROR_RATE', '0.5'))
+
+    @property
+    def BREAKER_LATENCY(self):
+        """Seconds after which an UptimeRobot API call counts as slow"""
+        return float(os.getenv('URO_BREAKER_LATENCY', '10'))
+
+    @property
+    def BREAKER_COOLDOWN(self):
+        """Seconds the circuit breaker stays open before probing the UptimeRobot API"""
+        return float(os.getenv('URO_BREAKER_COOLDOWN', '30'))
+
+    @property
+    def BREAKER_HALF_OPEN_PROBES(self):
+        """Number of successful probe calls required to close the circuit breaker"""
+        return int(os.getenv('URO_BREAKER_HALF_OPEN_PROBES', '2'))
+
+    @property
+    def BREAKER_RELEASE_RATE(self):
+        """Calls per minute at which parked mutations are released after recovery"""
+        return float(os.getenv('URO_BREAKER_RELEASE_RATE', '30'))
+
+    @property
+    def BREAKER_MAX_PARK(self):
+        """Seconds a mutation is parked while the circuit breaker is open before it is retried"""
+        return float(os.getenv('URO_BREAKER_MAX_PARK', '120'))
+
+    @property
+    def JOURNAL_PATH(self):
+        """Path of the SQLite file journaling UptimeRobot mutations, kept in memory if not set"""
+        return os.getenv('URO_JOURNAL_PATH') or None
+
+    @property
+    def SKIP_CRD_REGISTRATION(self):
+        """Flag for only verifying the hashes of the installed CRDs instead of creating or
+        updating them on start, e.g. if they are installed with the Helm chart"""
+        return os.getenv('URO_SKIP_CRD_REGISTRATION', 'False').lower() in ['true', '1']
+
+    @property
+    def SNAPSHOT_PATH(self):
+        """Path of the file the UptimeRobot inventory snapshot is stored in"""
+        return os.getenv('URO_SNAPSHOT_PATH') or None
+
+    @property
+    def SNAPSHOT_CONFIGMAP(self):
+        """ConfigMap the UptimeRobot inventory snapshot is stored in, as namespace/name"""
+        return os.getenv('URO_SNAPSHOT_CONFIGMAP') or None
+
+    @property
+    def SNAPSHOT_INTERVAL(self):
+        """Seconds between two UptimeRobot inventory snapshots"""
+        return float(os.getenv('URO_SNAPSHOT_INTERVAL', '300'))
+
+    @property
+    def SNAPSHOT_MAX_AGE(self):
+        """Seconds after which an UptimeRobot inventory snapshot is not used anymore"""
+        return float(os.getenv('URO_SNAPSHOT_MAX_AGE', '86400'))
+
+    @property
+    def PSP_DEBOUNCE(self):
+        """Seconds monitor changes are collected before a selector based status page is updated"""
+        return float(os.getenv('URO_PSP_DEBOUNCE', '10'))
+
+    @property
+    def ADMISSION_WEBHOOK_HOST(self):
+        """Hostname the Kubernetes API server reaches the admission webhook at,
+        the webhook is disabled if not set"""
+        return os.getenv('URO_ADMISSION_WEBHOOK_HOST')
+
+    @property
+    def ADMISSION_WEBHOOK_PORT(self):
+        """Port the admission webhook listens on"""
+        return int(os.getenv('URO_ADMISSION_WEBHOOK_PORT', '9443'))
+
+    @property
+    def ADMISSION_WEBHOOK_CERT(self):
+        """Path to the TLS certificate of the admission webhook, self-signed if not set"""
+        return os.getenv('URO_ADMISSION_WEBHOOK_CERT')
+
+    @property
+    def ADMISSION_WEBHOOK_KEY(self):
+        """Path to the TLS private key of the admission webhook"""
+        return os.getenv('URO_ADMISSION_WEBHOOK_KEY')
+
+    @property
+    def ADMISSION_WEBHOOK_CA(self):
+        """Path to the CA certificate the Kubernetes API server verifies the admission webhook
+        with, the webhook's certificate is used if not set"""
+        return os.getenv('URO_ADMISSION_WEBHOOK_CA')
+
+    @property
+    def BATCH_CONCURRENCY(self):
+        """Number of resources reconciled at the same time in batch mode"""
+        return int(os.getenv('URO_BATCH_CONCURRENCY', '4'))
+
+    @property
+    def TEARDOWN_CONCURRENCY(self):
+        """Number of UptimeRobot monitors deleted at the same time when a namespace
+        or Ingress with many monitors is deleted"""
+        return int(os.getenv('URO_TEARDOWN_CONCURRENCY', '8'))
+
+    @property
+    def QUERY_API_PORT(self):
+        """Port of the read-only query API over the known monitors, disabled if not set"""
+        port = os.getenv('URO_QUERY_API_PORT')
+        return int(port) if port else None
+
+    @property
+    def QUERY_API_MAX_AGE(self):
+        """Seconds the UptimeRobot inventory answering the query API may be old"""
+        return float(os.getenv('URO_QUERY_API_MAX_AGE', '60'))
+
+    @property
+    def EVENTS_PER_OBJECT(self):
+        """Maximum number of Kubernetes Events posted per object within the event window"""
+        return int(os.getenv('URO_EVENTS_PER_OBJECT', '10'))
+
+    @property
+    def EVENTS_TOTAL(self):
+        """Maximum number of Kubernetes Events posted in total within the event window"""
+        return int(os.getenv('URO_EVENTS_TOTAL', '100'))
+
+    @property
+    def EVENTS_WINDOW(self):
+        """Seconds in which the number of posted Kubernetes Events is limited and
+        repeated messages are aggregated"""
+        return float(os.getenv('URO_EVENTS_WINDOW', '60'))
+
+    @property
+    def SLO_REPORT_INTERVAL(self):
+        """Seconds between SLO reports of the monitors, disabled if not set"""
+        interval = os.getenv('URO_SLO_REPORT_INTERVAL')
+        return float(interval) if interval else None
+
+    @property
+    def SLO_TARGET(self):
+        """Uptime in percent the error budget of monitors is derived from"""
+        return float(os.getenv('URO_SLO_TARGET', '99.9'))
+
+    @property
+    def SLO_PERIOD_DAYS(self):
+        """Days the uptime and remaining error budget of monitors are computed over"""
+        return int(os.getenv('URO_SLO_PERIOD_DAYS', '30'))
+
+    @property
+    def SLO_BURN_WINDOW(self):
+        """Seconds the error budget burn rate of monitors is computed over"""
+        return float(os.getenv('URO_SLO_BURN_WINDOW', '3600'))
+
+    @property
+    def ALERT_WEBHOOK_PORT(self):
+        """Port of the receiver for alerts of UptimeRobot web-hook alert contacts,
+        disabled if not set"""
+        port = os.getenv('URO_ALERT_WEBHOOK_PORT')
+        return int(port) if port else None
+
+    @property
+    def ALERT_WEBHOOK_TOKEN(self):
+        """Token alerts have to carry as token query parameter, required with the alert receiver"""
+        return os.getenv('URO_ALERT_WEBHOOK_TOKEN')
+
+    @property
+    def ALERT_COALESCE_WINDOW(self):
+        """Seconds within which the alerts of a monitor are written to its status at once"""
+        return float(os.getenv('URO_ALERT_COALESCE_WINDOW', '2'))
+
+    @property
+    def DEDUPLICATE_MONITORS(self):
+        """Flag for sharing a single UptimeRobot monitor between monitors with identical settings"""
+        return os.getenv('URO_DEDUPLICATE_MONITORS', 'False').lower() in ['true', '1']
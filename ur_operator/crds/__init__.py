@@ -5,11 +5,14 @@ from crds.custom_resource_definition import CustomResourceDefinition
 from crds.monitor import MonitorV1Beta1
 from crds.ingress import IngressV1
 from crds.psp import PspV1Beta1
-from .common.crd_base import BaseCrd, GROUP, make_spec
+from .common.crd_base import BaseCrd, GROUP, SPEC_HASH_ANNOTATION, crd_name, make_manifest
+from .common.crd_base import make_spec
+from .hashes import CRD_HASHES
 
 __all__ = ['AlertContactV1Beta1', 'MaintenanceWindowV1Beta1',
            'CustomResourceDefinition', 'MonitorV1Beta1', 'PspV1Beta1',
-           'BaseCrd', 'IngressV1', 'GROUP', 'make_spec']
+           'BaseCrd', 'IngressV1', 'GROUP', 'make_spec', 'make_manifest', 'crd_name',
+           'SPEC_HASH_ANNOTATION', 'CRD_HASHES']
 
 ALL_CRDS: list[type[BaseCrd]] = [MonitorV1Beta1, PspV1Beta1,
                                  MaintenanceWindowV1Beta1, AlertContactV1Beta1]
@@ -56,6 +56,17 @@ class AlertContactV1Beta1(BaseCrd):
         }
 # pylint: enable=line-too-long
 
+    @staticmethod
+    def drift_fields():
+        return ['friendly_name', 'type', 'value']
+
+    @staticmethod
+    def recreate_fields(request: dict) -> set[str]:
+        # only the value of web hooks can be edited
+        if request.get('type') == AlertContactType.WEB_HOOK.value:
+            return {'type'}
+        return {'type', 'value'}
+
     @staticmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
         # convert all keys from camel to snake case
@@ -1,12 +1,13 @@
 """Base class for CRDs. Also contains make_spec() for creating a CRD's spec"""
+import hashlib
+import json
 from abc import ABC, abstractmethod
-from kubernetes.client import V1JSONSchemaProps, V1CustomResourceDefinitionSpec as CRD
-from kubernetes.client import V1CustomResourceDefinitionVersion as Version
-from kubernetes.client import V1CustomResourceValidation as CRDValidation
-from kubernetes.client import V1CustomResourceDefinitionNames as Names
-from kubernetes.client import V1CustomResourceColumnDefinition
+# models are loaded by kubernetes.client on first access, only when a schema is built
+import kubernetes.client as k8s_client
 from .property_types import v1object, schema_props  # pylint: disable=relative-beyond-top-level
 GROUP = 'uptimerobot.twinhats.com'
+# annotation of the installed CRDs with the hash of the spec they were created from
+SPEC_HASH_ANNOTATION = f'{GROUP}/spec-hash'
 
 
 class BaseCrd(ABC):
@@ -43,7 +44,7 @@ class BaseCrd(ABC):
 
     @staticmethod
     @abstractmethod
-    def properties() -> dict[str, V1JSONSchemaProps]:
+    def properties() -> dict[str, 'k8s_client.V1JSONSchemaProps']:
         """Retrieve the properties for this CRD as a dict[str, V1JsonSchemaProps]. 
         Must be overridden in the child class."""
 
@@ -54,11 +55,23 @@ class BaseCrd(ABC):
         Must be overridden in the child class."""
 
     @staticmethod
-    def printer_columns() -> list[V1CustomResourceColumnDefinition]:
+    def printer_columns() -> list['k8s_client.V1CustomResourceColumnDefinition']:
         """Retrieve the list of printer columns (fields to be displayed in tables) for this CRD. 
         Must be overridden in the child class."""
         return []
 
+    @staticmethod
+    def drift_fields() -> list[str]:
+        """Retrieve the request fields UptimeRobot returns unchanged when listing objects,
+        used to detect objects that were changed outside of the operator."""
+        return ['friendly_name']
+
+    @staticmethod
+    def recreate_fields(request: dict) -> set[str]:  # pylint: disable=unused-argument
+        """Retrieve the request fields UptimeRobot's edit endpoint does not accept for a request,
+        changing one of them requires deleting and recreating the object."""
+        return set()
+
     @staticmethod
     @abstractmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
@@ -68,19 +81,39 @@ class BaseCrd(ABC):
 
 def make_spec(crd: type[BaseCrd]):
     """Create the spec for a given CRD class"""
-    version = Version(name=crd.version(),
-                      served=True,
-                      storage=True,
-                      schema=CRDValidation(schema_props(
-                          {
-                              'spec': schema_props(crd.properties(), crd.required_properties()),
-                              'status': v1object(None)
-                          })),
-                      additional_printer_columns=crd.printer_columns())
-
-    names = Names(kind=crd.kind(),
-                  plural=crd.plural(),
-                  singular=crd.singular(),
-                  short_names=crd.short_names())
-
-    return CRD(group=crd.group(), versions=[version], scope='Namespaced', names=names)
+    version = k8s_client.V1CustomResourceDefinitionVersion(
+        name=crd.version(),
+        served=True,
+        storage=True,
+        schema=k8s_client.V1CustomResourceValidation(open_apiv3_schema=schema_props(
+            {
+                'spec': schema_props(crd.properties(), crd.required_properties()),
+                'status': v1object(None)
+            })),
+        additional_printer_columns=crd.printer_columns())
+
+    names = k8s_client.V1CustomResourceDefinitionNames(kind=crd.kind(),
+                                                       plural=crd.plural(),
+                                                       singular=crd.singular(),
+                                                       short_names=crd.short_names())
+
+    return k8s_client.V1CustomResourceDefinitionSpec(group=crd.group(), versions=[version],
+                                                     scope='Namespaced', names=names)
+
+
+def crd_name(crd: type[BaseCrd]) -> str:
+    """Retrieve the name of the CustomResourceDefinition of a CRD class"""
+    return f'{crd.plural()}.{crd.group()}'
+
+
+def make_manifest(crd: type[BaseCrd]) -> dict:
+    """Create the CustomResourceDefinition manifest for a given CRD class,
+    annotated with the hash of its spec"""
+    spec = k8s_client.ApiClient().sanitize_for_serialization(make_spec(crd))
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+    return {
+        'apiVersion': 'apiextensions.k8s.io/v1',
+        'kind': 'CustomResourceDefinition',
+        'metadata': {'name': crd_name(crd), 'annotations': {SPEC_HASH_ANNOTATION: digest}},
+        'spec': spec
+    }
@@ -1,5 +1,5 @@
 """Contains functions for creating V1JSONSchemaProps of different types."""
-from kubernetes.client import V1JSONSchemaProps
+import kubernetes.client as k8s_client
 
 
 def v1string(description, enum_type=None, property_type='string'):
@@ -10,7 +10,7 @@ def v1string(description, enum_type=None, property_type='string'):
             else list(enum_type.__members__.keys()))
     description = (description if enum_type is None
                    else f"{description}, one of: {','.join(list(enum_type.__members__.keys()))}")
-    return V1JSONSchemaProps(
+    return k8s_client.V1JSONSchemaProps(
         type=property_type,
         enum=enum,
         description=description
@@ -19,7 +19,7 @@ def v1string(description, enum_type=None, property_type='string'):
 
 def v1object(description):
     """Create a V1JSONSchemaProps of type 'object'"""
-    return V1JSONSchemaProps(
+    return k8s_client.V1JSONSchemaProps(
         type='object',
         description=description,
         x_kubernetes_preserve_unknown_fields=True
@@ -29,7 +29,7 @@ def v1object(description):
 def schema_props(props, required=None, preserve_unknown_fields=None):
     """Create a V1JSONSchemaProps of type 'object' 
     that defines V1JSONSchemaProps to be used in a CRD"""
-    return V1JSONSchemaProps(
+    return k8s_client.V1JSONSchemaProps(
         type='object',
         properties=props,
         required=required,
@@ -40,7 +40,7 @@ def schema_props(props, required=None, preserve_unknown_fields=None):
 def v1integer(description, mult=1.):
     """Create a V1JSONSchemaProps of type 'integer' 
     with optional multiplier for allowed values"""
-    return V1JSONSchemaProps(
+    return k8s_client.V1JSONSchemaProps(
         type='integer',
         multiple_of=mult,
         description=description
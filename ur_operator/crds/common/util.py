@@ -1,6 +1,6 @@
 """Additional utility functions"""
 import re
-from kubernetes.client import V1CustomResourceColumnDefinition
+import kubernetes.client as k8s_client
 
 pattern = re.compile(r'(?<!^)(?=[A-Z])')
 
@@ -12,7 +12,7 @@ def camel_to_snake_case(string):
 
 def printer_column(name, path):
     """Create a V1CustomResourceColumnDefinitionto be used as a printer column"""
-    return V1CustomResourceColumnDefinition(
+    return k8s_client.V1CustomResourceColumnDefinition(
         description=name,
         json_path=path,
         name=name,
@@ -0,0 +1,8 @@
+"""Hashes of the specs of the CustomResourceDefinitions by name"""
+# Generated by tools/generate_crd_manifests.py, do not edit.
+CRD_HASHES = {
+    'uptimerobotmonitors.uptimerobot.twinhats.com': '80fd252cbf148fea',
+    'publicstatuspages.uptimerobot.twinhats.com': '417e423f8a52d28b',
+    'maintenancewindows.uptimerobot.twinhats.com': 'fe6d480cc2082001',
+    'alertcontacts.uptimerobot.twinhats.com': '2f651d2ed86d7e12',
+}
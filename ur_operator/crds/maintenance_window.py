@@ -52,6 +52,14 @@ class MaintenanceWindowV1Beta1(BaseCrd):
         }
 # pylint: enable=line-too-long
 
+    @staticmethod
+    def drift_fields():
+        return ['friendly_name', 'type', 'duration']
+
+    @staticmethod
+    def recreate_fields(request: dict) -> set[str]:
+        return {'type'}
+
     @staticmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
         # convert all keys from camel to snake case
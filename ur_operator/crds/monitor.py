@@ -120,7 +120,9 @@ class MonitorV1Beta1(BaseCrd):
             'customHttpStatuses': v1string('Allows to define HTTP status codes that will be handled as up or down, e.g. 404:0_200:1 to accept 404 as down and 200 as up'),
             'ignoreSslErrors': v1boolean('Flag to ignore SSL certificate related issues'),
             'alertContacts': v1string('Alert contacts to be notified when monitor goes up or down. For syntax check https://uptimerobot.com/api/#newMonitorWrap'),
-            'mwindows': v1string('Maintenance window IDs for this monitor')
+            'alertContactRefs': v1string('Names of AlertContacts in the same namespace to be notified, separated with ",". Threshold and recurrence can be appended like name_threshold_recurrence'),
+            'mwindows': v1string('Maintenance window IDs for this monitor'),
+            'mwindowRefs': v1string('Names of MaintenanceWindows in the same namespace for this monitor, separated with ","')
         }
 # pylint: enable=line-too-long
 
@@ -131,9 +133,18 @@ class MonitorV1Beta1(BaseCrd):
             printer_column('Ingress', '.metadata.ownerReferences[0].name'),
             printer_column('Monitor Type', '.spec.type'),
             printer_column('Monitored URL', '.spec.url'),
-            printer_column('Monitored Path', '.spec.path')
+            printer_column('Monitored Path', '.spec.path'),
+            printer_column('State', '.status.alert.state')
         ]
 
+    @staticmethod
+    def drift_fields():
+        return ['friendly_name', 'url', 'type', 'interval', 'port', 'keyword_value']
+
+    @staticmethod
+    def recreate_fields(request: dict) -> set[str]:
+        return {'type'}
+
     @staticmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
         # convert all keys from camel to snake case
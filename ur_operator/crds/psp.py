@@ -2,7 +2,7 @@
 import enum
 
 from .common.crd_base import BaseCrd
-from .common.property_types import v1string as string, v1boolean as boolean
+from .common.property_types import v1string as string, v1boolean as boolean, v1object as obj
 from .common.util import camel_to_snake_case
 
 
@@ -45,13 +45,15 @@ class PspV1Beta1(BaseCrd):
 
     @staticmethod
     def required_properties():
-        return ['monitors']
+        # either monitors or monitorSelector, checked by the handler
+        return []
 # pylint: disable=line-too-long
 
     @staticmethod
     def properties():
         return {
             'monitors': string('the list of monitor IDs to be displayed in status page (the values are seperated with "-" or 0 for all monitors)'),
+            'monitorSelector': obj('label selector for UptimeRobotMonitors in the same namespace to be displayed in status page, supports matchLabels and matchExpressions'),
             'friendlyName': string('Friendly name of public status page, defaults to name of PublicStatusPage object'),
             'customDomain': string('the domain or subdomain that the status page will run on'),
             'password': string('the password for the status page, deprecated: use passwordSecret'),
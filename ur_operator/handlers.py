@@ -1,122 +1,319 @@
 """Main operator logic and handlers"""
 import logging
-from kopf.on import startup as on_startup
-from kopf import PermanentError
+import os
+import signal
+from kopf.on import startup as on_startup, cleanup as on_cleanup, probe as on_probe
+from kopf import PermanentError, WebhookServer
 from config import Config
-from crds import ALL_CRDS, CustomResourceDefinition, AlertContactV1Beta1
-from crds import MaintenanceWindowV1Beta1, MonitorV1Beta1, PspV1Beta1, IngressV1, make_spec
-from kubernetes.client.rest import ApiException
+from crds import AlertContactV1Beta1, MaintenanceWindowV1Beta1, MonitorV1Beta1, PspV1Beta1
+from crds import IngressV1, GROUP
 from handlers import MonitorHandler, AlertContactHandler
-from handlers import MaintananceWindowHandler, PSPHandler, IngressHandler
-from api import UptimeRobot, K8s, on
-
-ur: UptimeRobot
+from handlers import MaintananceWindowHandler, PSPHandler, IngressHandler, AdmissionHandler
+from api import UptimeRobotPool, on
+from api.event_budget import EventBudget
+from api.k8s import register_crds
+from api.readiness import READY
+from api.slo import SloReporter
+from api.inventory import ALERT_CONTACT, MWINDOW
+from handlers.common.dedup import DEDUP_KEY
+from handlers.common.references import indexed_identifier, indexed_refs
+from handlers.common.teardown import BulkTeardown
+from handlers.ingress import only_monitors_annotation_changed
+from handlers.monitors import indexed_record
+from handlers.public_status_page import SELECTED_KEY
+from server import AlertReceiver, AlertServer, MonitorQuery, QueryServer
+
+ur: UptimeRobotPool | None = None
 mon_handler: MonitorHandler
 ac_handler: AlertContactHandler
 ingress_handler: IngressHandler
 mw_handler: MaintananceWindowHandler
 psp_handler: PSPHandler
+admission_handler: AdmissionHandler
+teardown: BulkTeardown
+query_server: QueryServer | None = None
+alert_server: AlertServer | None = None
+slo_reporter: SloReporter | None = None
 
 # disable liveness check request logs
 logging.getLogger('aiohttp.access').setLevel(logging.WARN)
 
 
-def __create_crds(logger):
-    k8s = K8s(CustomResourceDefinition)
-
-    for crd in ALL_CRDS:
-        name = f'{crd.plural()}.{crd.group()}'
-        spec = make_spec(crd)
-        # logger.info(f"Spec for CRD {name}: {spec}")
-        try:
-            k8s.create_resource(None, name, spec)
-            logger.info(f'CRD {name} successfully created')
-        except ApiException as error:
-            if error.status == 409:
-                k8s.update_resource(None, name, spec)
-                logger.debug(f'CRD {name} successfully patched')
-            else:
-                logger.error(f'CRD {name} failed to create')
-                raise error
-
-
 @on_startup()
-def __startup(logger, **_):
-    global ur, mon_handler, ac_handler, mw_handler, ingress_handler, psp_handler
+def __startup(logger, settings, alert_contact_ids, mwindow_ids, monitor_refs,  # pylint: disable=too-many-arguments
+              monitor_labels, monitor_records, monitor_shares, monitor_ids, psp_selectors, **_):
     config = Config()
+    # debug messages, e.g. whole specs, are only logged locally
+    settings.posting.level = logging.INFO
+    EventBudget(config.EVENTS_PER_OBJECT, config.EVENTS_TOTAL, config.EVENTS_WINDOW,
+                settings.posting.level).install()
+
+    if config.ADMISSION_WEBHOOK_HOST:
+        settings.admission.server = WebhookServer(port=config.ADMISSION_WEBHOOK_PORT,
+                                                  host=config.ADMISSION_WEBHOOK_HOST,
+                                                  certfile=config.ADMISSION_WEBHOOK_CERT,
+                                                  pkeyfile=config.ADMISSION_WEBHOOK_KEY,
+                                                  cafile=config.ADMISSION_WEBHOOK_CA)
+        settings.admission.managed = GROUP
 
     if config.DISABLE_INGRESS_HANDLING:
         logger.info('handling of Ingress resources has been disabled')
 
     try:
-        ur = UptimeRobot(config)
-    except Exception as error:
+        config.UPTIMEROBOT_API_KEY  # pylint: disable=pointless-statement
+    except KeyError as error:
         logger.error('failed to create UptimeRobot API')
-        raise PermanentError(error) from error
-
-    __create_crds(logger)
-    psp_handler = PSPHandler(ur,
-                             on_create_psp.__name__,
-                             on_update_psp.__name__)
-    mon_handler = MonitorHandler(ur,
-                                 on_create_mon.__name__,
-                                 on_update_mon.__name__)
-    ac_handler = AlertContactHandler(ur,
-                                     on_create_ac.__name__,
-                                     on_update_ac.__name__)
-    ingress_handler = IngressHandler(ur,
-                                     on_create_ingress.__name__,
-                                     on_update_ingress.__name__)
-    mw_handler = MaintananceWindowHandler(ur,
-                                          on_create_mw.__name__,
-                                          on_update_mw.__name__)
+        raise PermanentError(f'Required environment variable {error.args[0]} has not been '
+                             f'provided') from error
+    if config.ALERT_WEBHOOK_PORT and not config.ALERT_WEBHOOK_TOKEN:
+        raise PermanentError('URO_ALERT_WEBHOOK_TOKEN is required to receive alerts')
+
+    def setup():
+        global ur, mon_handler, ac_handler, mw_handler, ingress_handler, psp_handler
+        global admission_handler, query_server, alert_server, slo_reporter, teardown
+        # retried until it succeeds, so only create what an earlier attempt has not
+        if ur is None:
+            # authenticates against UptimeRobot and loads the limits of the account
+            pool = UptimeRobotPool(config)
+            if pool.snapshot is not None:
+                pool.snapshot.start(pool)
+            ur = pool
+        register_crds(logger)
+        psp_handler = PSPHandler(ur,
+                                 on_create_psp.__name__,
+                                 on_update_psp.__name__,
+                                 monitor_labels,
+                                 psp_selectors)
+        mon_handler = MonitorHandler(ur,
+                                     on_create_mon.__name__,
+                                     on_update_mon.__name__,
+                                     {ALERT_CONTACT: alert_contact_ids, MWINDOW: mwindow_ids},
+                                     monitor_refs,
+                                     monitor_shares)
+        teardown = BulkTeardown(mon_handler, settings.persistence.finalizer,
+                                config.TEARDOWN_CONCURRENCY)
+        ac_handler = AlertContactHandler(ur,
+                                         on_create_ac.__name__,
+                                         on_update_ac.__name__)
+        ingress_handler = IngressHandler(ur,
+                                         on_create_ingress.__name__,
+                                         on_update_ingress.__name__,
+                                         {ALERT_CONTACT: alert_contact_ids, MWINDOW: mwindow_ids})
+        mw_handler = MaintananceWindowHandler(ur,
+                                              on_create_mw.__name__,
+                                              on_update_mw.__name__)
+        admission_handler = AdmissionHandler(ur)
+        # finishes interrupted deletes and deletes what was created for resources that are gone
+        by_kind = {handler.kind: handler for handler in (mon_handler, ac_handler, mw_handler,
+                                                          psp_handler)}
+        ur.replay_journal(logger, lambda kind, namespace, name:
+                          by_kind[kind].journaled_orphan(namespace, name))
+
+        if config.SLO_REPORT_INTERVAL and slo_reporter is None:
+            slo_reporter = SloReporter(ur, monitor_records, mon_handler.k8s, config)
+            slo_reporter.start()
+
+        if config.QUERY_API_PORT and query_server is None:
+            query_server = QueryServer(MonitorQuery(ur, monitor_records, config.QUERY_API_MAX_AGE),
+                                       '0.0.0.0', config.QUERY_API_PORT,
+                                       slo_reporter.metrics if slo_reporter else None)
+            query_server.start()
+            logger.info(f'query API listening on port {config.QUERY_API_PORT}')
+
+        if config.ALERT_WEBHOOK_PORT and alert_server is None:
+            alert_server = AlertServer(AlertReceiver(mon_handler.k8s, monitor_ids,
+                                                     config.ALERT_COALESCE_WINDOW),
+                                       config.ALERT_WEBHOOK_TOKEN, '0.0.0.0',
+                                       config.ALERT_WEBHOOK_PORT)
+            alert_server.start()
+            logger.info(f'receiving UptimeRobot alerts on port {config.ALERT_WEBHOOK_PORT}')
+
+    def catch_up():
+        # events are skipped during the setup, apply what they may have changed
+        for kind, ids in ((ALERT_CONTACT, alert_contact_ids), (MWINDOW, mwindow_ids)):
+            for namespace, name in list(ids):
+                mon_handler.on_reference_changed(kind, namespace, name, logger)
+        psp_handler.reselect_all()
+
+    # kopf starts watching and filling the indexes meanwhile, handlers wait for the setup
+    # a permanent error, e.g. outdated CRDs, stops the operator instead of being retried
+    READY.start(setup, logger, catch_up, lambda: os.kill(os.getpid(), signal.SIGTERM))
+
+
+@on_cleanup()
+def __cleanup(logger, **_):
+    READY.stop()
+    if query_server is not None:
+        query_server.stop()
+    if alert_server is not None:
+        alert_server.stop()
+    if slo_reporter is not None:
+        slo_reporter.stop()
+    if READY.is_ready() and ur.snapshot is not None:
+        logger.info('saving UptimeRobot inventory snapshot')
+        ur.snapshot.stop(ur)
+
+
+@on_probe(id='ready')
+def __ready(**_):
+    return READY.is_ready()
 
 # pylint: disable=missing-function-docstring
 
 
+def __direct_mode(**_):
+    config = Config()
+    return config.INGRESS_DIRECT_MODE and not config.DISABLE_INGRESS_HANDLING
+
+
 @on.create(IngressV1)
-def on_create_ingress(name: str, namespace: str, annotations: dict, spec: dict, logger, **_):
-    return ingress_handler.on_create(name, namespace, annotations, spec, logger)
+def on_create_ingress(name: str, namespace: str, annotations: dict, spec: dict, patch, logger,  # pylint: disable=too-many-arguments
+                      **_):
+    return ingress_handler.on_create(name, namespace, annotations, spec, logger, patch)
+
+
+def __ingress_changed(diff, **_):
+    return not only_monitors_annotation_changed(diff)
+
+
+@on.update(IngressV1, when=__ingress_changed)
+def on_update_ingress(name: str, namespace: str, annotations: dict, spec: dict, patch, logger,  # pylint: disable=too-many-arguments
+                      **_):
+    return ingress_handler.on_update(name, namespace, annotations, spec, logger, patch)
+
+
+@on.resume(IngressV1, when=__direct_mode)
+def on_resume_ingress(name: str, namespace: str, annotations: dict, spec: dict, patch, logger,  # pylint: disable=too-many-arguments
+                      **_):
+    return ingress_handler.on_resume_direct(name, namespace, annotations, spec, logger, patch)
 
 
-@on.update(IngressV1)
-def on_update_ingress(name: str, namespace: str, annotations: dict, spec: dict, logger, **_):
-    return ingress_handler.on_update(name, namespace, annotations, spec, logger)
+@on.delete(IngressV1, when=__direct_mode)
+def on_delete_ingress(name: str, namespace: str, annotations: dict, logger, **_):
+    return ingress_handler.on_delete(name, namespace, annotations, logger)
+
+
+@on.index(AlertContactV1Beta1)
+def alert_contact_ids(namespace: str, name: str, status: dict, **_):
+    uid = indexed_identifier(status, (on_create_ac.__name__, on_update_ac.__name__), 'ac_id')
+    return None if uid is None else {(namespace, name): uid}
+
+
+@on.event(AlertContactV1Beta1)
+def on_event_ac(namespace: str, name: str, logger, **_):
+    mon_handler.on_reference_changed(ALERT_CONTACT, namespace, name, logger)
+
+
+@on.validate(AlertContactV1Beta1)
+def validate_ac(namespace: str, spec: dict, operation: str, old, **_):
+    admission_handler.validate(AlertContactV1Beta1, namespace, spec, operation, old)
 
 
 @on.create(AlertContactV1Beta1)
-def on_create_ac(name: str, spec: dict, logger, **_):
-    return ac_handler.on_create(name, spec, logger)
+def on_create_ac(namespace: str, name: str, spec: dict, status: dict, logger, **_):
+    return ac_handler.on_create(namespace, name, spec, logger, status)
 
 
 @on.update(AlertContactV1Beta1)
-def on_update_ac(name: str, spec: dict, status: dict, logger, diff, **_):
-    return ac_handler.on_update(name, spec, status, logger, diff)
+def on_update_ac(namespace: str, name: str, spec: dict, status: dict, logger, diff, **_):
+    return ac_handler.on_update(namespace, name, spec, status, logger, diff)
+
+
+@on.resume(AlertContactV1Beta1)
+def on_resume_ac(namespace: str, name: str, spec: dict, status: dict, patch, logger, **_):
+    return ac_handler.on_resume(namespace, name, spec, status, patch, logger)
 
 
 @on.delete(AlertContactV1Beta1)
-def on_delete_ac(status: dict, logger, **_):
-    return ac_handler.on_delete(status, logger)
+def on_delete_ac(namespace: str, name: str, status: dict, logger, **_):
+    return ac_handler.on_delete(namespace, name, status, logger)
+
+
+@on.index(MaintenanceWindowV1Beta1)
+def mwindow_ids(namespace: str, name: str, status: dict, **_):
+    uid = indexed_identifier(status, (on_create_mw.__name__, on_update_mw.__name__), 'mw_id')
+    return None if uid is None else {(namespace, name): uid}
+
+
+@on.event(MaintenanceWindowV1Beta1)
+def on_event_mw(namespace: str, name: str, logger, **_):
+    mon_handler.on_reference_changed(MWINDOW, namespace, name, logger)
+
+
+@on.validate(MaintenanceWindowV1Beta1)
+def validate_mw(namespace: str, spec: dict, operation: str, old, **_):
+    admission_handler.validate(MaintenanceWindowV1Beta1, namespace, spec, operation, old)
 
 
 @on.create(MaintenanceWindowV1Beta1)
-def on_create_mw(name: str, spec: dict, logger, **_):
-    return mw_handler.on_create(name, spec, logger)
+def on_create_mw(namespace: str, name: str, spec: dict, status: dict, logger, **_):
+    return mw_handler.on_create(namespace, name, spec, logger, status)
 
 
 @on.update(MaintenanceWindowV1Beta1)
-def on_update_mw(name: str, spec: dict, status: dict, logger, diff, **_):
-    return mw_handler.on_update(name, spec, status, logger, diff)
+def on_update_mw(namespace: str, name: str, spec: dict, status: dict, logger, diff, **_):
+    return mw_handler.on_update(namespace, name, spec, status, logger, diff)
+
+
+@on.resume(MaintenanceWindowV1Beta1)
+def on_resume_mw(namespace: str, name: str, spec: dict, status: dict, patch, logger, **_):
+    return mw_handler.on_resume(namespace, name, spec, status, patch, logger)
 
 
 @on.delete(MaintenanceWindowV1Beta1)
-def on_delete_mw(status: dict, logger, **_):
-    return mw_handler.on_delete(status, logger)
+def on_delete_mw(namespace: str, name: str, status: dict, logger, **_):
+    return mw_handler.on_delete(namespace, name, status, logger)
+
+
+@on.index(MonitorV1Beta1)
+def monitor_refs(namespace: str, name: str, spec: dict, status: dict, **_):
+    return indexed_refs(namespace, name, spec, status,
+                        (on_create_mon.__name__, on_update_mon.__name__))
+
+
+@on.index(MonitorV1Beta1)
+def monitor_labels(namespace: str, name: str, labels: dict, status: dict, **_):
+    uid = indexed_identifier(status, (on_create_mon.__name__, on_update_mon.__name__), 'monitor_id')
+    return None if uid is None else {namespace: (name, dict(labels), uid)}
+
+
+@on.index(MonitorV1Beta1)
+def monitor_records(namespace: str, name: str, meta: dict, spec: dict, status: dict, **_):
+    return {namespace: indexed_record(namespace, name, meta, spec, status,
+                                      (on_create_mon.__name__, on_update_mon.__name__))}
+
+
+@on.index(MonitorV1Beta1)
+def monitor_ids(namespace: str, name: str, meta: dict, spec: dict, status: dict, **_):
+    record = indexed_record(namespace, name, meta, spec, status,
+                            (on_create_mon.__name__, on_update_mon.__name__))
+    return None if record.uid is None else {record.uid: record}
+
+
+@on.index(MonitorV1Beta1)
+def monitor_shares(namespace: str, name: str, meta: dict, spec: dict, status: dict, **_):
+    result = status.get(on_update_mon.__name__) or status.get(on_create_mon.__name__) or {}
+    record = indexed_record(namespace, name, meta, spec, status,
+                            (on_create_mon.__name__, on_update_mon.__name__))
+    if record.uid is None or DEDUP_KEY not in result:
+        return None
+    return {result[DEDUP_KEY]: record}
+
+
+@on.event(MonitorV1Beta1)
+def on_event_mon(namespace: str, labels: dict, status: dict, event: dict, **_):
+    uid = indexed_identifier(status, (on_create_mon.__name__, on_update_mon.__name__), 'monitor_id')
+    psp_handler.on_monitor_changed(namespace, dict(labels), uid, event['type'] == 'DELETED')
+
+
+@on.validate(MonitorV1Beta1)
+def validate_mon(namespace: str, spec: dict, operation: str, old, **_):
+    admission_handler.validate(MonitorV1Beta1, namespace, spec, operation, old)
 
 
 @on.create(MonitorV1Beta1)
-def on_create_mon(spec, namespace: str, name: str, logger, **_):
-    return mon_handler.on_create(namespace, name, spec, logger)
+def on_create_mon(spec, namespace: str, name: str, status: dict, logger, **_):
+    return mon_handler.on_create(namespace, name, spec, logger, status)
 
 
 @on.update(MonitorV1Beta1)
@@ -124,22 +321,46 @@ def on_update_mon(namespace: str, name: str, spec: dict, status: dict, logger, d
     return mon_handler.on_update(namespace, name, spec, status, diff, logger)
 
 
+@on.resume(MonitorV1Beta1)
+def on_resume_mon(namespace: str, name: str, spec: dict, status: dict, patch, logger, **_):
+    return mon_handler.on_resume(namespace, name, spec, status, patch, logger)
+
+
 @on.delete(MonitorV1Beta1)
-def on_delete_mon(status: dict, logger, **_):
-    mon_handler.on_delete(status, logger)
+def on_delete_mon(namespace: str, name: str, meta: dict, status: dict, logger, **_):
+    if teardown.teardown(namespace, name, meta, logger):
+        return
+    mon_handler.on_delete(namespace, name, status, logger)
+
+
+@on.index(PspV1Beta1)
+def psp_selectors(namespace: str, name: str, spec: dict, status: dict, **_):
+    if 'monitorSelector' not in spec:
+        return None
+    result = status.get(on_update_psp.__name__) or status.get(on_create_psp.__name__) or {}
+    return {namespace: (name, dict(spec['monitorSelector']), result.get(SELECTED_KEY))}
+
+
+@on.validate(PspV1Beta1)
+def validate_psp(namespace: str, spec: dict, operation: str, old, **_):
+    admission_handler.validate(PspV1Beta1, namespace, spec, operation, old)
 
 
 @on.create(PspV1Beta1)
-def on_create_psp(namespace: str, name: str, spec: dict, logger, **_):
-    return psp_handler.on_create(namespace, name, spec, logger)
+def on_create_psp(namespace: str, name: str, spec: dict, status: dict, logger, **_):
+    return psp_handler.on_create(namespace, name, spec, logger, status)
 
 
 @on.update(PspV1Beta1)
-def on_update_psp(namespace: str, name: str, spec: dict, status, logger, **_):
-    return psp_handler.on_update(namespace, name, spec, status, logger)
+def on_update_psp(namespace: str, name: str, spec: dict, status, logger, diff, **_):
+    return psp_handler.on_update(namespace, name, spec, status, logger, diff)
+
+
+@on.resume(PspV1Beta1)
+def on_resume_psp(namespace: str, name: str, spec: dict, status: dict, patch, logger, **_):
+    return psp_handler.on_resume(namespace, name, spec, status, patch, logger)
 
 
 @on.delete(PspV1Beta1)
-def on_delete_psp(status, logger):
-    return psp_handler.on_delete(status, logger)
-# pylint: disable=missing-function-docstring
+def on_delete_psp(namespace: str, name: str, status, logger, **_):
+    return psp_handler.on_delete(namespace, name, status, logger)
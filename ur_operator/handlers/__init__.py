@@ -4,7 +4,9 @@ from handlers.alert_contacts import AlertContactHandler
 from handlers.maintanance_window import MaintananceWindowHandler
 from handlers.monitors import MonitorHandler
 from handlers.public_status_page import PSPHandler
+from handlers.admission import AdmissionHandler
 from .common.handler_base import BaseHandler, type_changed, format_url
 
 __all__ = ['IngressHandler', 'AlertContactHandler', 'MaintananceWindowHandler',
-           'MonitorHandler', 'PSPHandler', 'BaseHandler', 'format_url', 'type_changed']
+           'MonitorHandler', 'PSPHandler', 'AdmissionHandler', 'BaseHandler', 'format_url',
+           'type_changed']
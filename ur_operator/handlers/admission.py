@@ -0,0 +1,93 @@
+"""Handler class for validating admission requests"""
+import kopf
+from config import Config
+from api import UptimeRobotPool
+from api.inventory import MONITOR
+from crds import BaseCrd, MonitorV1Beta1, MaintenanceWindowV1Beta1, PspV1Beta1
+
+PROPERTY_TYPES = {
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+    'object': dict
+}
+
+
+def validate_properties(crd: type[BaseCrd], spec: dict) -> list[str]:
+    """Check a spec against the properties of a CRD, returns the errors found"""
+    properties = crd.properties()
+    errors = [f'{key} is required' for key in crd.required_properties() if key not in spec]
+
+    for key, value in spec.items():
+        prop = properties.get(key)
+        if prop is None:
+            errors.append(f'unknown property {key}')
+        elif prop.enum and value not in prop.enum:
+            errors.append(f'{key} must be one of: {",".join(prop.enum)}')
+        elif (not isinstance(value, PROPERTY_TYPES[prop.type])
+              or (isinstance(value, bool) and prop.type != 'boolean')):
+            errors.append(f'{key} must be of type {prop.type}')
+        elif prop.multiple_of and value % prop.multiple_of:
+            errors.append(f'{key} must be a multiple of {prop.multiple_of:g}')
+    return errors
+
+
+class AdmissionHandler:
+    """Validates the specs of resources before Kubernetes stores them, so invalid specs are
+    rejected by kubectl instead of failing against UptimeRobot. Limits of UptimeRobot accounts
+    are checked against their cached account details."""
+
+    def __init__(self, ur: UptimeRobotPool):
+        self.config = Config()
+        self.uptime_robots = ur
+
+    def validate(self, crd: type[BaseCrd], namespace: str, spec: dict, operation: str, old):  # pylint: disable=too-many-arguments
+        """Raise an AdmissionError if a created or updated spec is invalid"""
+        if operation not in ('CREATE', 'UPDATE'):
+            return
+        if operation == 'UPDATE' and old is not None and dict(old.get('spec') or {}) == dict(spec):
+            # e.g. kopf adding finalizers, never block objects created before the webhook
+            return
+
+        errors = validate_properties(crd, spec)
+        if not errors and crd is MonitorV1Beta1:
+            errors = self.__validate_monitor(namespace, spec, operation)
+        elif not errors and crd is MaintenanceWindowV1Beta1:
+            if spec['type'] in ('WEEKLY', 'MONTHLY') and not spec.get('value'):
+                errors = [f'value is required for maintenance windows of type {spec["type"]}']
+        elif not errors and crd is PspV1Beta1:
+            if not spec.get('monitors') and not spec.get('monitorSelector'):
+                errors = ['either monitors or monitorSelector is required']
+
+        if errors:
+            raise kopf.AdmissionError('; '.join(errors))
+
+    def __validate_monitor(self, namespace: str, spec: dict, operation: str) -> list[str]:
+        errors = []
+        monitor_type = spec.get('type', self.config.DEFAULT_MONITOR_TYPE)
+        if monitor_type == 'KEYWORD' and 'keywordValue' not in spec:
+            errors.append('keywordValue is required for monitors of type KEYWORD')
+        if monitor_type == 'PORT' and 'port' not in spec:
+            errors.append('port is required for monitors of type PORT')
+
+        try:
+            uptime_robot = self.uptime_robots.for_namespace(namespace)
+        except kopf.TemporaryError:
+            # the account of the namespace is unknown, its limits cannot be checked
+            return errors
+        account = uptime_robot.account_details()
+
+        min_interval = int(account.get('monitor_interval', 0)) * 60
+        if spec.get('interval', min_interval) < min_interval:
+            errors.append(f'interval must be at least {min_interval} seconds for this account')
+
+        if operation == 'CREATE' and 'monitor_limit' in account:
+            if uptime_robot.inventory.loaded_at(MONITOR) > float('-inf'):
+                monitors = len(uptime_robot.inventory.ids(MONITOR))
+            else:
+                monitors = sum(int(account.get(f'{state}_monitors', 0))
+                               for state in ('up', 'down', 'paused'))
+            if monitors >= int(account['monitor_limit']):
+                errors.append(f'the monitor limit of {account["monitor_limit"]} has been reached')
+        return errors
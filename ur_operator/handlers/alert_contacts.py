@@ -1,55 +1,55 @@
 """Handler class for AlertContacts"""
 import kopf
 from crds import AlertContactV1Beta1
-from .common.handler_base import BaseHandler, type_changed, UptimeRobot
+from api import UptimeRobotPool
+from api.inventory import ALERT_CONTACT
+from .common.handler_base import BaseHandler
+from .common.planner import RECREATE, changed_fields, edit_request, plan_update
 
 
 class AlertContactHandler(BaseHandler):
     """Contains handler functions for AlertContacts"""
 
-    def __init__(self, ur: UptimeRobot, create_event_name, update_event_name):
+    def __init__(self, ur: UptimeRobotPool, create_event_name, update_event_name):
         super().__init__(ur, AlertContactV1Beta1,
-                         create_event_name, update_event_name, 'ac_id')
+                         create_event_name, update_event_name, 'ac_id', ALERT_CONTACT)
 
-    def on_create(self, name: str, spec: dict, logger):  # pylint: disable=missing-function-docstring
-        return {self.id_key: self.uptime_robot.create_ac(logger, self.build_request(name, spec))}
+    def on_create(self, namespace: str, name: str, spec: dict, logger, status=None):  # pylint: disable=missing-function-docstring
+        request = self.build_request(name, spec)
+        return self.status(self.create_object(namespace, name, request, logger, status), request)
 
-    def on_update(self, name: str, spec: dict, status: dict, logger, diff: dict):  # pylint: disable=missing-function-docstring
-        identifier = self.get_identifier(status)
+    def on_update(self, namespace: str, name: str, spec: dict, status: dict, logger, diff: dict):  # pylint: disable=missing-function-docstring disable=too-many-arguments
+        identifier = self.confirmed_identifier(namespace, name, status)
         if identifier == -1:
             raise kopf.PermanentError(
                 "was not able to determine the AC ID for update")
 
         update_payload = AlertContactV1Beta1.spec_to_request_dict(name, spec)
+        changed = changed_fields(self.crd, name, spec, diff)
 
-        if type_changed(diff) or spec['type'] != 'WEB_HOOK':
+        if diff and not changed:
+            # e.g. only labels or annotations changed
+            return self.status(identifier, update_payload)
+        if plan_update(self.crd, update_payload, changed) == RECREATE:
             logger.info(
-                'alert contact type changed or is not of type WEB_HOOK, need to delete and recreate')  # pylint: disable=line-too-long
-            self.uptime_robot.delete_ac(logger, identifier)
-
-            identifier = self.uptime_robot.create_ac(
-                logger,
-                update_payload
-            )
+                'alert contact type or value of a non WEB_HOOK alert contact changed, need to delete and recreate')  # pylint: disable=line-too-long
+            self.delete_object(namespace, name, identifier, logger)
+            identifier = self.create_object(namespace, name, update_payload, logger)
         else:
-            # update does not accept type parameter
-            update_payload.pop('type', None)
-
-            identifier = self.uptime_robot.update_ac(
-                logger,
-                identifier,
-                update_payload
-            )
+            identifier = self.uptime_robot(namespace).update_ac(
+                logger, identifier, edit_request(self.crd, update_payload))
 
-        return {self.id_key: identifier}
+        return self.status(identifier, update_payload)
 
-    def on_delete(self, status: dict, logger):  # pylint: disable=missing-function-docstring
+    def on_delete(self, namespace: str, name: str, status: dict, logger):  # pylint: disable=missing-function-docstring
         identifier = self.get_identifier(status)
         if identifier == -1:
             raise kopf.PermanentError(
                 "was not able to determine the AC ID for deletion")
         try:
-            self.uptime_robot.delete_ac(logger, identifier)
+            self.delete_object(namespace, name, identifier, logger, forget=True)
+        except kopf.TemporaryError:
+            raise
         except Exception as error:
             raise kopf.PermanentError(
                 f"deleting AC failed: {error}") from error
@@ -0,0 +1,33 @@
+"""Sharing of a single UptimeRobot monitor between monitors with identical settings"""
+import hashlib
+import hmac
+import json
+from urllib.parse import urlsplit, urlunsplit
+
+DEDUP_KEY = 'dedup_key'
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent spellings compare equal, e.g. 'HTTPS://Foo.com:443/'
+    and 'https://foo.com'. URLs without a scheme, e.g. of PING monitors, are only lowercased."""
+    if '://' not in url:
+        return url.strip().lower()
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f'{host}:{parts.port}'
+    if parts.username:
+        host = f'{parts.username}{":" + parts.password if parts.password else ""}@{host}'
+    path = '' if parts.path == '/' and not parts.query else parts.path
+    return urlunsplit((parts.scheme.lower(), host, path, parts.query, ''))
+
+
+def dedup_key(request: dict, secret: bytes) -> str:
+    """Hash everything that is sent to UptimeRobot for a monitor, monitors with the same
+    key can share a single UptimeRobot monitor. The request contains credentials, e.g. HTTP
+    passwords, and the key is stored in the status, so it is keyed with a secret of the
+    account the keys are compared in to prevent guessing them offline."""
+    return hmac.new(secret, json.dumps(request, sort_keys=True, default=str).encode(),
+                    hashlib.sha256).hexdigest()[:16]
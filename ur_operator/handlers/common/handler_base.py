@@ -1,22 +1,35 @@
 """Base class for handlers"""
+import hashlib
+import json
+
 import kopf
 from config import Config
 from crds import BaseCrd
-from api import K8s, UptimeRobot
+from api import K8s, UptimeRobot, UptimeRobotPool
+from api.journal import CREATE, DELETE
+from .planner import RECREATE, edit_request, plan_update
+from .references import indexed_identifier
+
+SPEC_HASH_KEY = 'spec_hash'
 
 
 class BaseHandler():
     """Base class for handlers"""
 
-    def __init__(self, ur: UptimeRobot, crd: type[BaseCrd],
-                 create_event_name, update_event_name, status_key):
+    def __init__(self, ur: UptimeRobotPool, crd: type[BaseCrd],
+                 create_event_name, update_event_name, status_key, kind):
         self.crd = crd
+        self.kind = kind
         self.config = Config()
         self.k8s = K8s(crd)
         self.id_key = status_key
         self.create_event_name = create_event_name
         self.update_event_name = update_event_name
-        self.uptime_robot = ur
+        self.uptime_robots = ur
+
+    def uptime_robot(self, namespace: str) -> UptimeRobot:
+        """Retrieve the UptimeRobot client for the account assigned to a namespace"""
+        return self.uptime_robots.for_namespace(namespace)
 
     def get_identifier(self, status: dict):
         """Retrieve the status value for a given resource, 
@@ -28,11 +41,156 @@ class BaseHandler():
         raise kopf.PermanentError(
             f"was not able to determine the {self.id_key}!")
 
+    def status(self, uid, request: dict) -> dict:
+        """Build the handler result that is stored in the status of a resource"""
+        return {self.id_key: uid, SPEC_HASH_KEY: spec_hash(self.crd, request)}
+
+    def on_resume(self, namespace: str, name: str, spec: dict, status: dict, patch, logger):  # pylint: disable=too-many-arguments
+        """Verify a resource against the bulk-loaded inventory of its UptimeRobot account
+        after a restart, reconciling it only if its object is missing or has drifted"""
+        if self.update_event_name in status:
+            event_name = self.update_event_name
+        elif self.create_event_name in status:
+            event_name = self.create_event_name
+        else:
+            # never created, kopf runs the create handler
+            return
+
+        uid = self.confirmed_identifier(namespace, name, status)
+        uptime_robot = self.uptime_robot(namespace)
+        uptime_robot.load_inventory(self.kind)
+        desired = self.crd.spec_to_request_dict(name, spec)
+        desired_hash = spec_hash(self.crd, desired)
+
+        def matches(record):
+            return (record is not None
+                    and spec_hash(self.crd, {k: record.get(k) for k in desired}) == desired_hash)
+
+        record = uptime_robot.inventory.get(self.kind, uid)
+        if not matches(record) and uptime_robot.inventory.is_restored(self.kind):
+            # the inventory comes from a snapshot, only refresh the objects that do not match it
+            record = uptime_robot.refresh_object(self.kind, uid)
+
+        if record is None:
+            logger.info(f'{self.kind} {uid} does not exist anymore, recreating it')
+            patch.status[event_name] = self.on_create(namespace, name, spec, logger)
+            return
+        if status[event_name].get(SPEC_HASH_KEY) not in (None, desired_hash):
+            # the spec changed while the operator was down, kopf runs the update handler
+            return
+        if matches(record):
+            return
+
+        drifted = {k for k in self.crd.drift_fields()
+                   if k in desired and str(record.get(k)) != str(desired[k])}
+        if plan_update(self.crd, desired, drifted) == RECREATE:
+            logger.info(f'{self.kind} {uid} has been changed outside of the operator '
+                        f'in a way that cannot be edited, recreating it')
+            self.delete_object(namespace, name, uid, logger)
+            patch.status[event_name] = self.on_create(namespace, name, spec, logger)
+            return
+
+        logger.info(f'{self.kind} {uid} has been changed outside of the operator, updating it')
+        patch.status[event_name] = self.on_update(namespace, name, spec, status,
+                                                  logger=logger, diff=[])
+
+    def journaled_orphan(self, namespace: str, name: str) -> bool:
+        """Check if the objects journaled for a resource are orphaned, i.e. the resource is
+        gone or being deleted without their IDs in its status"""
+        return self.k8s.resource_terminating(namespace, name)
+
+    def confirmed_identifier(self, namespace: str, name: str, status: dict):
+        """Retrieve the identifier from the status, confirming the journaled create of it"""
+        uid = self.get_identifier(status)
+        self.uptime_robots.journal.confirm(self.kind, namespace, name, uid)
+        return uid
+
+    def adopt_object(self, namespace: str, name: str, props: dict, status: dict, logger):
+        """Adopt the existing UptimeRobot object whose ID has been written into the status of a
+        new resource, e.g. by tools/import_uptimerobot.py. It is only edited if it differs from
+        the request, returns its ID or None if there is nothing to adopt."""
+        uid = indexed_identifier(status, (self.create_event_name, self.update_event_name),
+                                 self.id_key)
+        if uid is None:
+            return None
+
+        uptime_robot = self.uptime_robot(namespace)
+        uptime_robot.load_inventory(self.kind)
+        record = uptime_robot.inventory.get(self.kind, uid)
+        if record is None and uptime_robot.inventory.is_restored(self.kind):
+            record = uptime_robot.refresh_object(self.kind, uid)
+        if record is None:
+            logger.info(f'{self.kind} {uid} from the status does not exist, creating a new one')
+            return None
+
+        drifted = {k for k in self.crd.drift_fields()
+                   if k in props and str(record.get(k)) != str(props[k])}
+        if plan_update(self.crd, props, drifted) == RECREATE:
+            logger.info(f'{self.kind} {uid} from the status cannot be edited to match, '
+                        f'recreating it')
+            self.delete_object(namespace, name, uid, logger)
+            return None
+        if drifted:
+            uptime_robot.update(self.kind, logger, uid, edit_request(self.crd, props))
+        logger.info(f'adopted existing {self.kind} {uid}')
+        return uid
+
+    def create_object(self, namespace: str, name: str, props: dict, logger, status=None):  # pylint: disable=too-many-arguments
+        """Create the UptimeRobot object for a resource through the journal.
+        An object created by an earlier attempt whose ID never reached the status is adopted,
+        as well as an existing object whose ID is in the given status of a new resource."""
+        uptime_robot = self.uptime_robot(namespace)
+        journal = self.uptime_robots.journal
+
+        uid = self.adopt_object(namespace, name, props, status, logger) if status else None
+        if uid is not None:
+            return uid
+
+        entry = journal.unconfirmed_create(self.kind, namespace, name)
+        if entry is not None:
+            entry_id, uid, completed = entry
+            if not completed:
+                # the earlier attempt died during the API call, it may or may not have succeeded
+                uid = uptime_robot.find_id(self.kind, props)
+                if uid is None:
+                    journal.discard(entry_id)
+                else:
+                    journal.complete(entry_id, uid)
+            if uid is not None:
+                logger.info(f'adopting {self.kind} {uid} created by an earlier attempt')
+                return uid
+
+        entry_id = journal.intend(self.kind, namespace, name, CREATE)
+        try:
+            uid = uptime_robot.create(self.kind, logger, props)
+        except kopf.PermanentError:
+            journal.discard(entry_id)
+            raise
+        journal.complete(entry_id, uid)
+        return uid
+
+    def delete_object(self, namespace: str, name: str, uid, logger, forget=False):
+        """Delete the UptimeRobot object of a resource through the journal.
+        With forget the journal entries of the resource are dropped afterwards."""
+        journal = self.uptime_robots.journal
+        entry_id = journal.intend(self.kind, namespace, name, DELETE, uid)
+        self.uptime_robot(namespace).delete(self.kind, logger, uid)
+        if forget:
+            journal.forget(self.kind, namespace, name)
+        else:
+            journal.complete(entry_id, uid)
+
     def build_request(self, name, spec: dict):
         """Create an UptimeRobot API request for this handler's CRD"""
         return self.crd.spec_to_request_dict(name, spec)
 
 
+def spec_hash(crd: type[BaseCrd], request: dict) -> str:
+    """Hash the fields of an UptimeRobot request that can be compared with listed objects"""
+    fields = {k: str(request[k]) for k in crd.drift_fields() if k in request}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+
+
 def format_url(monitor_body: dict, host):
     """Prefix a given monitor's URL with HTTP:// or HTTPS:// based on its type,
     unless the type is PING."""
@@ -0,0 +1,46 @@
+"""Plans updates of UptimeRobot objects with as few mutations as possible"""
+from crds import BaseCrd
+from crds.common.util import camel_to_snake_case
+
+EDIT = 'edit'
+RECREATE = 'recreate'
+
+
+def changed_fields(crd: type[BaseCrd], name: str, spec: dict, diff) -> set[str]:
+    """Retrieve the request fields a kopf diff changed, e.g. an HTTP monitor that is changed
+    to HTTPS only changes its URL. If the old spec cannot be reconstructed from the diff
+    all request fields are considered changed."""
+    request = crd.spec_to_request_dict(name, spec)
+    old_spec = dict(spec)
+    nested = set()
+    for _, path, old, _ in diff:
+        path = tuple(path)
+        if path[:1] != ('spec',):
+            # e.g. labels or annotations
+            continue
+        if len(path) == 1:
+            return set(request)
+        if len(path) > 2:
+            nested.add(camel_to_snake_case(path[1]))
+        elif old is None:
+            old_spec.pop(path[1], None)
+        else:
+            old_spec[path[1]] = old
+
+    try:
+        old_request = crd.spec_to_request_dict(name, old_spec)
+    except (KeyError, ValueError):
+        return set(request)
+    return nested | {k for k in request.keys() | old_request.keys()
+                     if str(request.get(k)) != str(old_request.get(k))}
+
+
+def plan_update(crd: type[BaseCrd], request: dict, changed: set[str]) -> str:
+    """Decide whether changed request fields can be edited in place or require a recreate"""
+    return RECREATE if changed & crd.recreate_fields(request) else EDIT
+
+
+def edit_request(crd: type[BaseCrd], request: dict) -> dict:
+    """Strip the fields UptimeRobot's edit endpoint does not accept from a request"""
+    recreate_fields = crd.recreate_fields(request)
+    return {k: v for k, v in request.items() if k not in recreate_fields}
@@ -0,0 +1,76 @@
+"""Resolution of AlertContacts and MaintenanceWindows referenced by name from monitors"""
+import kopf
+from api.inventory import ALERT_CONTACT, MWINDOW
+from crds import GROUP
+from crds.common.util import camel_to_snake_case
+
+REFS_KEY = 'refs'
+REFS_ANNOTATION = f'{GROUP}/resolved-refs'
+
+# spec field the names are read from and request field the resolved IDs are added to
+REFERENCE_FIELDS = {
+    ALERT_CONTACT: ('alertContactRefs', 'alert_contacts'),
+    MWINDOW: ('mwindowRefs', 'mwindows')
+}
+
+
+def parse_refs(value: str | None) -> list[tuple[str, str]]:
+    """Split a comma separated list of references into tuples of name and suffix,
+    e.g. 'team_0_0,ops' into [('team', '_0_0'), ('ops', '')]"""
+    refs = []
+    for ref in (value or '').split(','):
+        ref = ref.strip()
+        if ref:
+            name, _, suffix = ref.partition('_')
+            refs.append((name, f'_{suffix}' if suffix else ''))
+    return refs
+
+
+def indexed_identifier(status: dict, event_names: tuple[str, str], id_key: str):
+    """Retrieve the UptimeRobot ID of a resource for an index, None if it has none yet"""
+    for event_name in reversed(event_names):
+        if id_key in (status.get(event_name) or {}):
+            return str(status[event_name][id_key])
+    return None
+
+
+def indexed_refs(namespace: str, name: str, spec: dict, status: dict,
+                 event_names: tuple[str, str]) -> dict:
+    """Build the index entries of the resources a monitor references. Each entry is keyed
+    by namespace, kind and name of the referenced resource and contains the name of the
+    monitor and the ID the reference was resolved to when it was last reconciled."""
+    resolved = {}
+    for event_name in event_names:
+        resolved.update((status.get(event_name) or {}).get(REFS_KEY) or {})
+
+    entries = {}
+    for kind, (spec_field, _) in REFERENCE_FIELDS.items():
+        for ref, _ in parse_refs(spec.get(spec_field)):
+            entries[(namespace, kind, ref)] = (name, resolved.get(f'{kind}/{ref}'))
+    return entries
+
+
+def lookup(index, key):
+    """Retrieve the single value of a key in a kopf index, None if it is not indexed"""
+    for value in index.get(key, []):
+        return value
+    return None
+
+
+def resolve_refs(namespace: str, request: dict, ids: dict) -> dict[str, str]:
+    """Replace the references in a monitor request with the IDs found in the given
+    kopf indexes by kind, returns the resolved IDs by kind and name"""
+    resolved = {}
+    for kind, (spec_field, ids_field) in REFERENCE_FIELDS.items():
+        values = [request[ids_field]] if request.get(ids_field) else []
+        for ref, suffix in parse_refs(request.pop(camel_to_snake_case(spec_field), None)):
+            uid = lookup(ids[kind], (namespace, ref))
+            if uid is None:
+                raise kopf.TemporaryError(
+                    f'referenced {kind} {namespace}/{ref} does not exist or has no ID yet',
+                    delay=30)
+            resolved[f'{kind}/{ref}'] = uid
+            values.append(f'{uid}{suffix}')
+        if values:
+            request[ids_field] = '-'.join(values)
+    return resolved
@@ -0,0 +1,22 @@
+"""Matching of Kubernetes label selectors against the labels of resources"""
+
+
+def matches_selector(selector: dict, labels: dict | None) -> bool:
+    """Check if labels match a label selector with matchLabels and matchExpressions"""
+    labels = labels or {}
+    for key, value in (selector.get('matchLabels') or {}).items():
+        if labels.get(key) != value:
+            return False
+
+    for expression in selector.get('matchExpressions') or []:
+        key, operator = expression['key'], expression['operator']
+        values = expression.get('values') or []
+        if operator == 'In' and labels.get(key) not in values:
+            return False
+        if operator == 'NotIn' and key in labels and labels[key] in values:
+            return False
+        if operator == 'Exists' and key not in labels:
+            return False
+        if operator == 'DoesNotExist' and key in labels:
+            return False
+    return True
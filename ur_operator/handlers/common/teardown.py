@@ -0,0 +1,140 @@
+"""Bulk teardown of the monitors of a namespace or Ingress that is being deleted"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import kopf
+from kubernetes.client.rest import ApiException
+from api.inventory import MONITOR
+from crds import IngressV1
+from .references import indexed_identifier
+
+# seconds for which torn down monitors and terminating namespaces and Ingresses are remembered
+MEMORY = 600
+# seconds for which a namespace or Ingress that is not being deleted is not checked again
+RECHECK = 5
+
+
+class BulkTeardown:
+    """Deletes the UptimeRobot monitors of all UptimeRobotMonitors of a terminating namespace
+    or Ingress in one round instead of one finalizer run after the other. A round lists the
+    monitors being deleted, skips the IDs the inventory knows to be gone, deletes the others
+    concurrently, rate limited by the UptimeRobot client, and releases their finalizers.
+    Deletes arriving during a round wait for it and only fall back to the regular delete
+    handler if their monitor could not be torn down. Only the deletes of monitors created for
+    an Ingress start a round, others do not cost a check of their namespace."""
+
+    def __init__(self, handler, finalizer: str, concurrency: int):
+        self.handler = handler
+        self.finalizer = finalizer
+        self.concurrency = concurrency
+        self.__done: dict[tuple[str, str], float] = {}
+        self.__terminating: dict[tuple[str, str | None], tuple[float, bool]] = {}
+        self.__rounds: dict[tuple[str, str | None], threading.Lock] = {}
+        self.__lock = threading.Lock()
+
+    def __is_terminating(self, namespace: str, ingress: str | None) -> bool:
+        now = time.monotonic()
+        with self.__lock:
+            checked_at, terminating = self.__terminating.get((namespace, ingress), (0., False))
+        if now - checked_at < (MEMORY if terminating else RECHECK):
+            return terminating
+
+        if ingress is None:
+            terminating = self.handler.k8s.namespace_terminating(namespace)
+        else:
+            terminating = self.handler.k8s.ingress_terminating(namespace, ingress)
+        with self.__lock:
+            self.__terminating = {key: value for key, value in self.__terminating.items()
+                                  if now - value[0] < MEMORY}
+            self.__terminating[(namespace, ingress)] = (now, terminating)
+        return terminating
+
+    def group(self, namespace: str, meta: dict) -> tuple[str, str | None] | None:
+        """Determine the namespace, and the Ingress if only it is being deleted, a monitor is
+        torn down with. None if the monitor is deleted on its own."""
+        owner = next((ref['name'] for ref in meta.get('ownerReferences') or []
+                      if ref.get('kind') == IngressV1.kind()), None)
+        if owner is None:
+            return None
+        if self.__is_terminating(namespace, None):
+            return (namespace, None)
+        if self.__is_terminating(namespace, owner):
+            return (namespace, owner)
+        return None
+
+    def __torn_down(self, namespace: str, name: str) -> bool:
+        with self.__lock:
+            now = time.monotonic()
+            self.__done = {key: at for key, at in self.__done.items() if now - at < MEMORY}
+            return (namespace, name) in self.__done
+
+    def teardown(self, namespace: str, name: str, meta: dict, logger) -> bool:
+        """Tear down a deleted monitor together with the other monitors of its namespace or
+        Ingress if they are being deleted. Returns False if the monitor has to be deleted
+        through the regular delete handler."""
+        if self.__torn_down(namespace, name):
+            # e.g. a monitor of its own in a namespace torn down for the monitors of an Ingress
+            return True
+        group = self.group(namespace, meta)
+        if group is None:
+            return False
+
+        with self.__lock:
+            round_lock = self.__rounds.setdefault(group, threading.Lock())
+        with round_lock:
+            if not self.__torn_down(namespace, name):
+                self.__round(group, logger)
+        return self.__torn_down(namespace, name)
+
+    def __round(self, group: tuple[str, str | None], logger):
+        namespace, ingress = group
+        objects = [obj for obj in self.handler.k8s.list_resource(namespace)
+                   if 'deletionTimestamp' in obj['metadata']
+                   and self.finalizer in obj['metadata'].get('finalizers', [])
+                   and not self.__torn_down(namespace, obj['metadata']['name'])
+                   and (ingress is None or any(ref.get('name') == ingress for ref
+                                               in obj['metadata'].get('ownerReferences', [])))]
+        if not objects:
+            return
+
+        uptime_robot = self.handler.uptime_robot(namespace)
+        uptime_robot.load_inventory(MONITOR)
+        # a restored snapshot may miss monitors created after it was taken
+        known = (None if uptime_robot.inventory.is_restored(MONITOR)
+                 else uptime_robot.inventory.ids(MONITOR))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # the deadline of the delete handler starting the round applies to its calls
+            futures = [pool.submit(contextvars.copy_context().run, self.__teardown_one,
+                                   namespace, obj, known) for obj in objects]
+            results = [future.result() for future in futures]
+        logger.info(f'tore down {results.count(True)} of {len(objects)} monitors of '
+                    f'{"namespace " + namespace if ingress is None else "ingress " + ingress}')
+
+    def __teardown_one(self, namespace: str, obj: dict, known: set[str] | None) -> bool:
+        meta, status = obj['metadata'], obj.get('status') or {}
+        name = meta['name']
+        logger = kopf.LocalObjectLogger(body=kopf.Body(obj), settings=kopf.OperatorSettings())
+        uid = indexed_identifier(status, (self.handler.create_event_name,
+                                          self.handler.update_event_name), self.handler.id_key)
+        try:
+            if uid is None or (known is not None and str(uid) not in known):
+                self.handler.uptime_robots.journal.forget(MONITOR, namespace, name)
+            else:
+                self.handler.on_delete(namespace, name, status, logger)
+        except (kopf.TemporaryError, kopf.PermanentError) as error:
+            logger.warning(f'bulk teardown failed, deleting the monitor on its own: {error}')
+            return False
+
+        with self.__lock:
+            self.__done[(namespace, name)] = time.monotonic()
+        try:
+            # the version guards against releasing a finalizer another operator added meanwhile
+            self.handler.k8s.patch_resource(namespace, name, {'metadata': {
+                'finalizers': [f for f in meta['finalizers'] if f != self.finalizer],
+                'resourceVersion': meta['resourceVersion']}})
+        except ApiException as error:
+            # the delete handler of the monitor releases the finalizer instead
+            logger.debug(f'releasing the finalizer failed: {error.reason}')
+        return True
@@ -1,93 +1,214 @@
 """Handler class for Ingresses"""
 import hashlib
+import json
 
-from api import UptimeRobot
+from api import UptimeRobotPool
+from api.inventory import MONITOR, ALERT_CONTACT, MWINDOW
+from crds import GROUP
 from crds.monitor import MonitorV1Beta1
+from .common.dedup import dedup_key
 from .common.handler_base import BaseHandler, format_url
+from .common.planner import RECREATE, edit_request, plan_update
+from .common.references import resolve_refs
+from .monitors import with_defaults
 
+# UptimeRobot ID and request hash of the monitors of an ingress in direct mode, by monitor name
+MONITORS_ANNOTATION = f'{GROUP}/monitors'
 
-class IngressHandler(BaseHandler):
-    """Contains handler functions for Ingresses"""
-
-    def __init__(self, ur: UptimeRobot, create_event_name, update_event_name):
-        super().__init__(ur, MonitorV1Beta1, create_event_name, update_event_name, 'monitor_id')
 
-    def on_create(self, name: str, namespace: str, annotations: dict, spec: dict, logger):  # pylint: disable=missing-function-docstring
+class IngressHandler(BaseHandler):
+    """Contains handler functions for Ingresses. By default an UptimeRobotMonitor object is
+    created per rule, in direct mode the UptimeRobot monitors are managed by this handler.
+    ids are the kopf indexes of UptimeRobot IDs by kind the references of monitors in
+    direct mode are resolved with."""
+
+    def __init__(self, ur: UptimeRobotPool, create_event_name, update_event_name, ids=None):
+        super().__init__(ur, MonitorV1Beta1, create_event_name, update_event_name,
+                         'monitor_id', MONITOR)
+        self.ids = ids if ids is not None else {ALERT_CONTACT: {}, MWINDOW: {}}
+
+    def on_create(self, name: str, namespace: str, annotations: dict, spec: dict, logger,  # pylint: disable=missing-function-docstring disable=too-many-arguments
+                  patch=None):
         logger.info(f"Creating monitors for new ingress {name}")
-        self.__create_or_update_crds(
-            name, namespace, annotations, spec, logger)
+        self.__reconcile(name, namespace, annotations, spec, logger, patch)
 
-    def on_update(self, name: str, namespace: str, annotations: dict, spec: dict, logger):  # pylint: disable=missing-function-docstring
+    def on_update(self, name: str, namespace: str, annotations: dict, spec: dict, logger,  # pylint: disable=missing-function-docstring disable=too-many-arguments
+                  patch=None):
         logger.info(f"Updating monitors for ingress {name}")
-        self.__create_or_update_crds(
-            name, namespace, annotations, spec, logger)
-
-    def __create_or_update_crds(self, ingress_name: str, namespace: str,
-                                annotations: dict, spec: dict, logger):  # pylint: disable=too-many-arguments
-        def match_crd_to_rule(rule: dict, crd: dict):
-            return generate_monitor_name(rule) == crd['metadata']['name']
-
-        def match_crd_to_ingress(crd: dict):
-            return ('ownerReferences' in crd['metadata']
-                    and crd['metadata']['ownerReferences'][0]['name'] == ingress_name)
-
-        def generate_monitor_name(rule: dict):
-            host = rule['host']
-            port = rule['port'] if 'port' in rule else ''
-            path = rule['path'] if 'path' in rule else ''
-
-            sha = hashlib.sha256()
-            sha.update(f"{ingress_name}{host}{path}{port}".encode())
-            digest = sha.hexdigest()[:8]
-            return f"{host}-{digest}"
-
+        self.__reconcile(name, namespace, annotations, spec, logger, patch)
+
+    def on_resume_direct(self, name: str, namespace: str, annotations: dict, spec: dict, logger,  # pylint: disable=too-many-arguments
+                         patch=None):
+        """Verify the monitors of an ingress in direct mode against the bulk-loaded inventory"""
+        self.__reconcile(name, namespace, annotations, spec, logger, patch)
+
+    def on_delete(self, name: str, namespace: str, annotations: dict, logger):
+        """Delete the UptimeRobot monitors of an ingress in direct mode"""
+        logger.info(f"Deleting monitors of ingress {name}")
+        for monitor, entry in direct_monitors(annotations).items():
+            self.delete_object(namespace, journal_name(name, monitor), entry['id'], logger,
+                               forget=True)
+
+    def __reconcile(self, ingress_name: str, namespace: str, annotations: dict, spec: dict,  # pylint: disable=too-many-arguments
+                    logger, patch):
         if self.config.DISABLE_INGRESS_HANDLING:
             logger.debug('handling of Ingress resources has been disabled')
             return
 
-        monitor_prefix = f'{self.crd.group()}/monitor.'
-        monitor_spec = {k.replace(monitor_prefix, ''): v
-                        for k, v in annotations.items() if k.startswith(monitor_prefix)}
-
-        if 'type' not in monitor_spec:
-            logger.info(
-                f"Type not specified. Defaulting to {self.config.DEFAULT_MONITOR_TYPE}")
-            monitor_spec['type'] = self.config.DEFAULT_MONITOR_TYPE
-
-        rules = []
-        for rule in spec['rules']:
-            if 'host' not in rule:
-                continue
+        monitor_specs = ingress_monitor_specs(self.config, ingress_name, annotations, spec, logger)
+        if self.config.INGRESS_DIRECT_MODE:
+            if MONITORS_ANNOTATION not in annotations:
+                # switched from UptimeRobotMonitor objects, their monitors are replaced
+                self.__create_or_update_crds(ingress_name, namespace, {}, logger)
+            monitors = self.__sync_monitors(ingress_name, namespace, monitor_specs,
+                                            direct_monitors(annotations), logger)
+            if patch is not None:
+                patch.metadata.annotations[MONITORS_ANNOTATION] = json.dumps(monitors,
+                                                                             sort_keys=True)
+            return
 
-            host = rule['host']
+        if MONITORS_ANNOTATION in annotations:
+            # switched from direct mode, the UptimeRobotMonitor objects replace the monitors
+            self.on_delete(ingress_name, namespace, annotations, logger)
+            if patch is not None:
+                patch.metadata.annotations[MONITORS_ANNOTATION] = None
+        self.__create_or_update_crds(ingress_name, namespace, monitor_specs, logger)
+
+    def __sync_monitors(self, ingress_name: str, namespace: str, monitor_specs: dict,  # pylint: disable=too-many-arguments
+                        current: dict, logger) -> dict:
+        """Create, edit and delete the UptimeRobot monitors of an ingress in direct mode,
+        returns the ID and request hash of its monitors afterwards"""
+        uptime_robot = self.uptime_robot(namespace)
+        uptime_robot.load_inventory(MONITOR)
+        monitors = {}
+        for name, spec in monitor_specs.items():
+            spec = MonitorV1Beta1.validate_spec(with_defaults(self.config, spec, logger))
+            request = self.build_request(name, spec)
+            resolve_refs(namespace, request, self.ids)
+            digest = dedup_key(request, uptime_robot.hash_secret)
+
+            uid = current.get(name, {}).get('id')
+            record = None if uid is None else uptime_robot.inventory.get(MONITOR, uid)
+            if uid is not None and record is None and uptime_robot.inventory.is_restored(MONITOR):
+                record = uptime_robot.refresh_object(MONITOR, uid)
+            drifted = set() if record is None else {
+                k for k in self.crd.drift_fields()
+                if k in request and str(record.get(k)) != str(request[k])}
+
+            if record is None:
+                if uid is not None:
+                    logger.info(f'monitor {uid} does not exist anymore, recreating it')
+                uid = self.create_object(namespace, journal_name(ingress_name, name), request,
+                                         logger)
+            elif plan_update(self.crd, request, drifted) == RECREATE:
+                logger.info(f'monitor {uid} cannot be edited to match {name}, recreating it')
+                self.delete_object(namespace, journal_name(ingress_name, name), uid, logger)
+                uid = self.create_object(namespace, journal_name(ingress_name, name), request,
+                                         logger)
+            elif drifted or current[name].get('hash') != digest:
+                uid = uptime_robot.update_monitor(edit_request(self.crd, request), uid, logger)
+            monitors[name] = {'id': str(uid), 'hash': digest}
+
+        for name, entry in current.items():
+            if name not in monitors:
+                logger.info(f'deleting obsolete monitor {entry["id"]} for {name}')
+                self.delete_object(namespace, journal_name(ingress_name, name), entry['id'],
+                                   logger, forget=True)
+        return monitors
 
-            # Filter out wildcard, unqualified, and excluded domains
-            if (host.startswith('*')
-                or '.' not in host
-                    or host.endswith(self.config.EXCLUDED_DOMAINS)):
-                if host is not None:
-                    logger.info(
-                        f'Excluding rule for {host} as wildcard, unqualified, or excluded.')
-            else:
-                rules.append(rule)
-        crds = self.k8s.list_resource(namespace) 
+    def __create_or_update_crds(self, ingress_name: str, namespace: str,
+                                monitor_specs: dict, logger):
+        crds = self.k8s.list_resource(namespace)
         for crd in crds:
-            if (match_crd_to_ingress(crd)
-                    and not any(match_crd_to_rule(rule, crd) for rule in rules)):
+            if owned_by(ingress_name, crd) and crd['metadata']['name'] not in monitor_specs:
                 self.k8s.delete_resource(namespace, crd['metadata']['name'])
                 logger.info('deleted obsolete UptimeRobotMonitor object')
 
-        for rule in rules:
-            host = rule['host']
-
-            format_url(monitor_spec, host)
-
-            name = generate_monitor_name(rule)
-            body = MonitorV1Beta1.validate_spec(monitor_spec)
-
-            if any(match_crd_to_rule(rule, crd) for crd in crds):
+        existing = {crd['metadata']['name'] for crd in crds}
+        for name, body in monitor_specs.items():
+            if name in existing:
                 self.k8s.update_resource(namespace, name, body, True)
-                logger.info(f'Updated monitor for URL {host}: {body}')
+                logger.info(f'Updated monitor for URL {body["url"]}')
+                logger.debug(f'Spec of monitor {name}: {body}')
             else:
                 self.k8s.create_resource(namespace, name, body, True)
-                logger.info(f'Created monitor for URL {host}: {body}')
+                logger.info(f'Created monitor for URL {body["url"]}')
+                logger.debug(f'Spec of monitor {name}: {body}')
+
+
+def direct_monitors(annotations: dict) -> dict[str, dict]:
+    """Retrieve the monitors an ingress manages in direct mode by monitor name"""
+    return json.loads(annotations.get(MONITORS_ANNOTATION) or '{}')
+
+
+def only_monitors_annotation_changed(diff) -> bool:
+    """Check if the diff of an ingress update only consists of the annotation this handler
+    writes itself in direct mode, which must not start another update cycle"""
+    annotations_path = ('metadata', 'annotations')
+    for _, path, old, new in diff:
+        path = tuple(path)
+        if path == annotations_path + (MONITORS_ANNOTATION,):
+            continue
+        if path == annotations_path:
+            old, new = dict(old or {}), dict(new or {})
+            old.pop(MONITORS_ANNOTATION, None)
+            new.pop(MONITORS_ANNOTATION, None)
+            if old == new:
+                continue
+        return False
+    return True
+
+
+def journal_name(ingress_name: str, monitor: str) -> str:
+    """Name the changes of a monitor of an ingress in direct mode are journaled under. It cannot
+    clash with the UptimeRobotMonitor object of the same name, which may still be deleted."""
+    return f'{ingress_name}/{monitor}'
+
+
+def owned_by(ingress_name: str, crd: dict) -> bool:
+    """Check if an UptimeRobotMonitor object has been created for an ingress"""
+    return ('ownerReferences' in crd['metadata']
+            and crd['metadata']['ownerReferences'][0]['name'] == ingress_name)
+
+
+def ingress_monitor_specs(config, ingress_name: str, annotations: dict, spec: dict,
+                          logger) -> dict[str, dict]:
+    """Build the specs of the UptimeRobotMonitors for the rules of an ingress by monitor name"""
+    def generate_monitor_name(rule: dict):
+        host = rule['host']
+        port = rule['port'] if 'port' in rule else ''
+        path = rule['path'] if 'path' in rule else ''
+
+        sha = hashlib.sha256()
+        sha.update(f"{ingress_name}{host}{path}{port}".encode())
+        digest = sha.hexdigest()[:8]
+        return f"{host}-{digest}"
+
+    monitor_prefix = f'{MonitorV1Beta1.group()}/monitor.'
+    monitor_spec = {k.replace(monitor_prefix, ''): v
+                    for k, v in annotations.items() if k.startswith(monitor_prefix)}
+
+    if 'type' not in monitor_spec:
+        logger.info(
+            f"Type not specified. Defaulting to {config.DEFAULT_MONITOR_TYPE}")
+        monitor_spec['type'] = config.DEFAULT_MONITOR_TYPE
+
+    monitor_specs = {}
+    for rule in spec['rules']:
+        if 'host' not in rule:
+            continue
+
+        host = rule['host']
+
+        # Filter out wildcard, unqualified, and excluded domains
+        if (host.startswith('*')
+            or '.' not in host
+                or host.endswith(config.EXCLUDED_DOMAINS)):
+            logger.debug(
+                f'Excluding rule for {host} as wildcard, unqualified, or excluded.')
+            continue
+
+        rule_spec = dict(monitor_spec)
+        format_url(rule_spec, host)
+        monitor_specs[generate_monitor_name(rule)] = MonitorV1Beta1.validate_spec(rule_spec)
+    return monitor_specs
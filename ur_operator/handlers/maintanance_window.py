@@ -1,45 +1,53 @@
 """Handler class for MaintenanceWindows"""
 import kopf
 
-from api import UptimeRobot
+from api import UptimeRobotPool
+from api.inventory import MWINDOW
 from crds import MaintenanceWindowV1Beta1
-from .common.handler_base import BaseHandler, type_changed
+from .common.handler_base import BaseHandler
+from .common.planner import RECREATE, changed_fields, edit_request, plan_update
 
 
 class MaintananceWindowHandler(BaseHandler):
     """Contains handler functions for MaintenanceWindows"""
 
-    def __init__(self, ur: UptimeRobot, create_event_name, update_event_name):
+    def __init__(self, ur: UptimeRobotPool, create_event_name, update_event_name):
         super().__init__(ur, MaintenanceWindowV1Beta1,
-                         create_event_name, update_event_name, 'mw_id')
+                         create_event_name, update_event_name, 'mw_id', MWINDOW)
         self.build_request = MaintenanceWindowV1Beta1.spec_to_request_dict
 
-    def on_create(self, name: str, spec: dict, logger):  # pylint: disable=missing-function-docstring
-        return {self.id_key: self.uptime_robot.create_mw(logger, self.build_request(name, spec))}
+    def on_create(self, namespace: str, name: str, spec: dict, logger, status=None):  # pylint: disable=missing-function-docstring
+        request = self.build_request(name, spec)
+        return self.status(self.create_object(namespace, name, request, logger, status), request)
 
-    def on_update(self, name: str, spec: dict, status: dict, logger, diff: dict):  # pylint: disable=missing-function-docstring disable=too-many-arguments
-        uid = self.get_identifier(status)
+    def on_update(self, namespace: str, name: str, spec: dict, status: dict, logger, diff: dict):  # pylint: disable=missing-function-docstring disable=too-many-arguments
+        uid = self.confirmed_identifier(namespace, name, status)
         update_payload = self.build_request(name, spec)
+        changed = changed_fields(self.crd, name, spec, diff)
 
-        if type_changed(diff):
+        if diff and not changed:
+            # e.g. only labels or annotations changed
+            return self.status(uid, update_payload)
+        if plan_update(self.crd, update_payload, changed) == RECREATE:
             logger.info(
                 'maintenance window type changed, need to delete and recreate')
-            self.uptime_robot.delete_mw(logger, uid)
-            uid = self.uptime_robot.create_mw(logger, update_payload)
+            self.delete_object(namespace, name, uid, logger)
+            uid = self.create_object(namespace, name, update_payload, logger)
         else:
-            # update does not accept type parameter
-            update_payload.pop('type', None)
-            uid = self.uptime_robot.update_mw(logger, uid, update_payload)
+            uid = self.uptime_robot(namespace).update_mw(
+                logger, uid, edit_request(self.crd, update_payload))
 
-        return {self.id_key: uid}
+        return self.status(uid, update_payload)
 
-    def on_delete(self, status: dict, logger):  # pylint: disable=missing-function-docstring
+    def on_delete(self, namespace: str, name: str, status: dict, logger):  # pylint: disable=missing-function-docstring
         uid = self.get_identifier(status)
         if uid == -1:
             raise kopf.PermanentError(
                 "was not able to determine the MW ID for deletion")
         try:
-            self.uptime_robot.delete_mw(logger, uid)
+            self.delete_object(namespace, name, uid, logger, forget=True)
+        except kopf.TemporaryError:
+            raise
         except Exception as error:
             raise kopf.PermanentError(
                 f"deleting MW failed: {error}") from error
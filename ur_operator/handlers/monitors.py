@@ -1,15 +1,40 @@
 """Handler class for UptimeRobotMonitors"""
+import threading
+from collections import defaultdict
+
 import kopf
-from api import UptimeRobot
-from crds import MonitorV1Beta1
-from .common.handler_base import BaseHandler, format_url, type_changed
+from api import UptimeRobotPool
+from api.inventory import MONITOR
+from api.records import MonitorRecord
+from crds import IngressV1, MonitorV1Beta1
+from server.alerts import ALERT_KEY
+from .common.dedup import DEDUP_KEY, dedup_key, normalize_url
+from .common.handler_base import SPEC_HASH_KEY, BaseHandler, format_url
+from .common.planner import RECREATE, changed_fields, edit_request, plan_update
+from .common.references import (REFS_KEY, REFS_ANNOTATION, indexed_identifier, lookup,
+                                resolve_refs)
 
 
 class MonitorHandler(BaseHandler):
-    """Contains handler functions for UptimeRobotMonitors"""
+    """Contains handler functions for UptimeRobotMonitors.
+    ids are the kopf indexes of UptimeRobot IDs by kind, keyed by namespace and name,
+    refs is the kopf index of the monitors referencing a resource,
+    shares is the kopf index of the records of monitors by dedup key."""
 
-    def __init__(self, ur: UptimeRobot, create_event_name, update_event_name):
-        super().__init__(ur, MonitorV1Beta1, create_event_name, update_event_name, 'monitor_id')
+    def __init__(self, ur: UptimeRobotPool, create_event_name, update_event_name,  # pylint: disable=too-many-arguments
+                 ids: dict, refs, shares=None):
+        super().__init__(ur, MonitorV1Beta1, create_event_name, update_event_name,
+                         'monitor_id', MONITOR)
+        self.ids = ids
+        self.refs = refs
+        self.shares = shares if shares is not None else {}
+        # shared monitors created by this process that may not be indexed yet
+        self.__created: dict[tuple[str, str], str] = {}
+        # monitors that let go of a shared monitor but are still indexed until they are gone,
+        # with the dedup key and ID they are indexed with
+        self.__released: dict[tuple[str, str], tuple[str | None, str]] = {}
+        self.__share_lock = threading.Lock()
+        self.__key_locks = defaultdict(threading.Lock)
 
     def __build_request_with_secrets(self, namespace: str, name: str, request_dict: dict):
         if 'http_auth_secret' in request_dict:
@@ -36,43 +61,208 @@ class MonitorHandler(BaseHandler):
         return self.build_request(name, request_dict)
 
     def __set_defaults(self, namespace: str, monitor_name: str, monitor_body: dict, logger):
-        updated_body = dict(monitor_body.items())
-        logger.info(f"Setting defaults for monitor {monitor_body}")
-        format_url(updated_body, updated_body['url'])
-        if 'type' not in updated_body:
-            logger.info(
-                f"Type not specified. Defaulting to {self.config.DEFAULT_MONITOR_TYPE}")
-            updated_body['type'] = self.config.DEFAULT_MONITOR_TYPE
-        if 'customHttpHeaders' not in updated_body and self.config.DEFAULT_HEADERS:
-            logger.info(
-                'CustomHttpHeaders not set on monitor. Using user-defined defaults.')
-            updated_body['customHttpHeaders'] = self.config.DEFAULT_HEADERS
+        updated_body = with_defaults(self.config, monitor_body, logger)
         k8s_body = MonitorV1Beta1.validate_spec(updated_body)
         logger.debug(f'Validated Monitor spec for set_defaults: {k8s_body}')
         self.k8s.update_resource(namespace, monitor_name, k8s_body, logger)
         return updated_body
 
-    def on_create(self, namespace: str, name: str, spec: dict, logger):  # pylint: disable=missing-function-docstring
-        logger.info(f"Monitor created: {name}: {spec}")
+    def __status(self, namespace: str, uid, request: dict, refs: dict):
+        status = {**self.status(uid, request), REFS_KEY: refs}
+        if self.config.DEDUPLICATE_MONITORS:
+            status[DEDUP_KEY] = self.__dedup_key(namespace, request)
+        return status
+
+    def __dedup_key(self, namespace: str, request: dict) -> str:
+        return dedup_key(request, self.uptime_robot(namespace).hash_secret)
+
+    def __stored_key(self, status: dict) -> str | None:
+        result = status.get(self.update_event_name) or status.get(self.create_event_name) or {}
+        return result.get(DEDUP_KEY)
+
+    def __holders(self, key: str | None, uid, namespace: str, name: str) -> list:
+        """Retrieve the other monitors sharing an UptimeRobot monitor"""
+        return [other.key for other in self.shares.get(key, [])
+                if other.uid == str(uid) and other.key != (namespace, name)
+                and other.key not in self.__released]
+
+    def __prune_released(self):
+        """Forget released monitors whose index entry of the shared monitor is gone"""
+        for monitor, (key, uid) in list(self.__released.items()):
+            if not any(other.key == monitor and other.uid == uid
+                       for other in self.shares.get(key, [])):
+                del self.__released[monitor]
+
+    def __shared_id(self, namespace: str, name: str, key: str):
+        """Find an existing UptimeRobot monitor of the same account with the same settings"""
+        uptime_robot = self.uptime_robot(namespace)
+        uptime_robot.load_inventory(MONITOR)
+        fingerprint = uptime_robot.fingerprint
+        candidates = [other.uid for other in self.shares.get(key, [])
+                      if other.key != (namespace, name)
+                      and self.uptime_robot(other.namespace).fingerprint == fingerprint]
+        created = self.__created.get((fingerprint, key))
+        for uid in ([created] if created else []) + candidates:
+            if uptime_robot.inventory.get(MONITOR, uid) is not None:
+                return str(uid)
+        return None
+
+    def __create_shared(self, namespace: str, name: str, request: dict, logger, status=None):  # pylint: disable=too-many-arguments
+        """Create the UptimeRobot monitor for a request unless an identical one exists already"""
+        key = self.__dedup_key(namespace, request)
+        with self.__share_lock:
+            self.__released.pop((namespace, name), None)
+            key_lock = self.__key_locks[key]
+        with key_lock:
+            uid = self.__shared_id(namespace, name, key)
+            if uid is not None:
+                logger.info(f'sharing monitor {uid} with the identical monitors using it')
+                return uid
+            uid = self.create_object(namespace, name, request, logger, status)
+            self.__created[(self.uptime_robot(namespace).fingerprint, key)] = str(uid)
+            return uid
+
+    def __release(self, namespace: str, name: str, uid, key: str | None, logger, forget=False):  # pylint: disable=too-many-arguments
+        """Let go of an UptimeRobot monitor, it is only deleted if no other monitor shares it"""
+        with self.__share_lock:
+            self.__prune_released()
+            holders = self.__holders(key, uid, namespace, name)
+            if holders:
+                self.__released[(namespace, name)] = (key, str(uid))
+        if not holders:
+            self.delete_object(namespace, name, uid, logger, forget)
+            return
+        logger.info(f'monitor {uid} is still used by {len(holders)} other monitors, keeping it')
+        if forget:
+            self.uptime_robots.journal.forget(self.kind, namespace, name)
+
+    def __update_shared(self, namespace: str, name: str, request: dict, status: dict, uid,  # pylint: disable=too-many-arguments
+                        logger):
+        """Update a monitor without changing the UptimeRobot monitor other monitors share.
+        Returns the ID the monitor uses afterwards, None if it can be updated as usual."""
+        key, old_key = self.__dedup_key(namespace, request), self.__stored_key(status)
+        if key == old_key:
+            # nothing that is sent to UptimeRobot changed
+            return uid
+
+        if self.config.DEDUPLICATE_MONITORS:
+            with self.__share_lock:
+                key_lock = self.__key_locks[key]
+            with key_lock:
+                target = self.__shared_id(namespace, name, key)
+            if target is not None and target != str(uid):
+                logger.info(f'monitor is now identical to monitor {target}, sharing it')
+                self.__release(namespace, name, uid, old_key, logger)
+                return target
+
+        with self.__share_lock:
+            shared = bool(self.__holders(old_key, uid, namespace, name))
+        if not shared:
+            return None
+        logger.info(f'monitor {uid} is shared with other monitors, creating a separate one')
+        self.__release(namespace, name, uid, old_key, logger)
+        if self.config.DEDUPLICATE_MONITORS:
+            return self.__create_shared(namespace, name, request, logger)
+        return self.create_object(namespace, name, request, logger)
+
+    def on_create(self, namespace: str, name: str, spec: dict, logger, status=None):  # pylint: disable=missing-function-docstring
+        logger.info(f"Monitor created: {name}")
+        logger.debug(f"Spec of monitor {name}: {spec}")
         spec = self.__set_defaults(namespace, name, spec, logger)
         spec = self.__build_request_with_secrets(namespace, name, spec)
-        return {self.id_key: self.uptime_robot.create_monitor(name, spec, logger)}
+        refs = resolve_refs(namespace, spec, self.ids)
+        if self.config.DEDUPLICATE_MONITORS:
+            uid = self.__create_shared(namespace, name, spec, logger, status)
+        else:
+            uid = self.create_object(namespace, name, spec, logger, status)
+        return self.__status(namespace, uid, spec, refs)
 
     def on_update(self, namespace: str, name: str, spec: dict, status: dict, diff, logger):  # pylint: disable=missing-function-docstring
         logger.info(f"Monitor updated: {name}")
         spec = self.__set_defaults(namespace, name, spec, logger)
-        spec = self.__build_request_with_secrets(namespace, name, spec)
-        uid = self.get_identifier(status)
-        if type_changed(diff):
+        changed = changed_fields(self.crd, name, spec, diff)
+        request = self.__build_request_with_secrets(namespace, name, spec)
+        refs = resolve_refs(namespace, request, self.ids)
+        uid = self.confirmed_identifier(namespace, name, status)
+        shared_uid = self.__update_shared(namespace, name, request, status, uid, logger)
+        if shared_uid is not None:
+            return self.__status(namespace, shared_uid, request, refs)
+        if plan_update(self.crd, request, changed) == RECREATE:
             logger.info('monitor type changed, need to delete and recreate')
-            self.uptime_robot.delete_monitor(logger, uid)
-            return {self.id_key: self.uptime_robot.create_monitor(name, spec, logger)}
-        return {self.id_key: self.uptime_robot.update_monitor(spec, uid, logger)}
+            self.delete_object(namespace, name, uid, logger)
+            return self.__status(namespace, self.create_object(namespace, name, request, logger),
+                                 request, refs)
+        uid = self.uptime_robot(namespace).update_monitor(
+            edit_request(self.crd, request), uid, logger)
+        return self.__status(namespace, uid, request, refs)
+
+    def on_reference_changed(self, kind: str, namespace: str, name: str, logger):
+        """Re-reconcile the monitors referencing a resource whose UptimeRobot ID
+        differs from the one they were last reconciled with"""
+        uid = lookup(self.ids[kind], (namespace, name))
+        if uid is None:
+            return
+        for monitor, resolved in self.refs.get((namespace, kind, name), []):
+            if resolved == uid:
+                continue
+            logger.info(f'{kind} {name} changed its ID to {uid}, updating monitor {monitor}')
+            self.k8s.annotate_resource(namespace, monitor,
+                                       {REFS_ANNOTATION: f'{kind}/{name}={uid}'})
+
+    def journaled_orphan(self, namespace: str, name: str) -> bool:
+        """Check if the objects journaled for a monitor are orphaned. Monitors of Ingresses in
+        direct mode are journaled as <ingress>/<monitor> and orphaned with their Ingress.
+        Deduplicated monitors may be shared with other monitors and are never orphaned."""
+        ingress, direct, _ = name.partition('/')
+        if direct:
+            return self.k8s.ingress_terminating(namespace, ingress)
+        if self.config.DEDUPLICATE_MONITORS:
+            return False
+        return super().journaled_orphan(namespace, name)
 
-    def on_delete(self, status: dict, logger):  # pylint: disable=missing-function-docstring
+    def on_delete(self, namespace: str, name: str, status: dict, logger):  # pylint: disable=missing-function-docstring
         try:
             identifier = self.get_identifier(status)
-            self.uptime_robot.delete_monitor(logger, identifier)
+            self.__release(namespace, name, identifier, self.__stored_key(status), logger,
+                           forget=True)
+        except kopf.TemporaryError:
+            raise
         except Exception as error:
             raise kopf.PermanentError(
                 f"deleting monitor failed: {error}") from error
+
+
+def with_defaults(config, monitor_body: dict, logger) -> dict:
+    """Fill in the configured defaults for the type and custom HTTP headers of a monitor spec
+    and prefix its URL according to its type. When monitors are deduplicated the URL is
+    normalized and the friendly name defaults to it."""
+    updated_body = dict(monitor_body.items())
+    logger.debug(f"Setting defaults for monitor {monitor_body}")
+    if 'type' not in updated_body:
+        logger.info(
+            f"Type not specified. Defaulting to {config.DEFAULT_MONITOR_TYPE}")
+        updated_body['type'] = config.DEFAULT_MONITOR_TYPE
+    format_url(updated_body, updated_body['url'])
+    if config.DEDUPLICATE_MONITORS:
+        # identical monitors of different resources have to send identical requests to be shared
+        updated_body['url'] = normalize_url(updated_body['url'])
+        if 'friendlyName' not in updated_body:
+            updated_body['friendlyName'] = updated_body['url'] + updated_body.get('path', '')
+    if 'customHttpHeaders' not in updated_body and config.DEFAULT_HEADERS:
+        logger.info(
+            'CustomHttpHeaders not set on monitor. Using user-defined defaults.')
+        updated_body['customHttpHeaders'] = config.DEFAULT_HEADERS
+    return updated_body
+
+
+def indexed_record(namespace: str, name: str, meta: dict, spec: dict, status: dict,  # pylint: disable=too-many-arguments
+                   event_names: tuple[str, str]) -> MonitorRecord:
+    """Build the record the indexes of the operator keep of a monitor"""
+    result = status.get(event_names[1]) or status.get(event_names[0]) or {}
+    alert = status.get(ALERT_KEY) or {}
+    ingress = next((owner['name'] for owner in meta.get('ownerReferences') or []
+                    if owner.get('kind') == IngressV1.kind()), None)
+    return MonitorRecord(namespace, name, ingress,
+                         indexed_identifier(status, event_names, 'monitor_id'),
+                         result.get(SPEC_HASH_KEY), spec.get('url'),
+                         alert.get('state'), alert.get('lastChange'))
@@ -1,17 +1,85 @@
 """Handler class for PublicStatusPages"""
+import hashlib
+
 import kopf
 
-from api import UptimeRobot
-from crds import PspV1Beta1
+from api import UptimeRobotPool
+from api.debouncer import Debouncer
+from api.inventory import PSP
+from crds import PspV1Beta1, GROUP
 from .common.handler_base import BaseHandler
+from .common.selectors import matches_selector
+
+SELECTED_KEY = 'selected_monitors'
+SELECTED_ANNOTATION = f'{GROUP}/selected-monitors'
 
 
 class PSPHandler(BaseHandler):
-    """Contains handler functions for PublicStatusPages"""
+    """Contains handler functions for PublicStatusPages.
+    monitors is the kopf index of the name, labels and ID of monitors by namespace,
+    selectors is the kopf index of the name, selector and selected monitor IDs
+    of status pages with a monitorSelector by namespace."""
 
-    def __init__(self, ur: UptimeRobot, create_event_name, update_event_name):
-        super().__init__(ur, PspV1Beta1, create_event_name, update_event_name, 'psp_id')
+    def __init__(self, ur: UptimeRobotPool, create_event_name, update_event_name,  # pylint: disable=too-many-arguments
+                 monitors, selectors):
+        super().__init__(ur, PspV1Beta1, create_event_name, update_event_name, 'psp_id', PSP)
         self.build_request_base = PspV1Beta1.spec_to_request_dict
+        self.monitors = monitors
+        self.selectors = selectors
+        self.debouncer = Debouncer(self.__reselect, self.config.PSP_DEBOUNCE)
+
+    def __select(self, namespace: str, selector: dict) -> list[str]:
+        return sorted({uid for _, labels, uid in self.monitors.get(namespace, [])
+                       if matches_selector(selector, labels)}, key=int)
+
+    def __build_request_with_monitors(self, namespace: str, name: str, spec: dict,
+                                      selected: list[str] | None = None):
+        request = self.__build_request_with_secrets(namespace, name, spec)
+        selector = request.pop('monitor_selector', None)
+        if selector is None:
+            if not request.get('monitors'):
+                raise kopf.PermanentError('either monitors or monitorSelector is required')
+            return request, None
+
+        if selected is None:
+            selected = self.__select(namespace, selector)
+        monitors = [request['monitors']] if request.get('monitors') else []
+        if not monitors + selected:
+            raise kopf.TemporaryError('monitorSelector matches no monitor with an ID yet', delay=60)
+        request['monitors'] = '-'.join(monitors + selected)
+        return request, selected
+
+    def __status(self, uid, request: dict, selected: list[str] | None):
+        status = self.status(uid, request)
+        if selected is not None:
+            status[SELECTED_KEY] = selected
+        return status
+
+    def on_monitor_changed(self, namespace: str, labels: dict, uid: str | None, deleted: bool):
+        """Schedule an update of the status pages whose selection of a monitor changed,
+        changes within the debounce window result in a single update per page"""
+        if uid is None:
+            return
+        for name, selector, selected in self.selectors.get(namespace, []):
+            member = uid in (selected or [])
+            if member != (not deleted and matches_selector(selector, labels)):
+                self.debouncer.trigger((namespace, name))
+
+    def reselect_all(self):
+        """Schedule an update of all status pages selecting monitors, e.g. after changes of
+        monitors could not be handled while the operator was starting"""
+        for namespace in list(self.selectors):
+            for name, _, _ in self.selectors.get(namespace, []):
+                self.debouncer.trigger((namespace, name))
+
+    def __reselect(self, key):
+        namespace, name = key
+        for psp, selector, _ in self.selectors.get(namespace, []):
+            if psp == name:
+                selected = '-'.join(self.__select(namespace, selector))
+                # changing the annotation makes kopf run the update handler
+                self.k8s.annotate_resource(namespace, name, {
+                    SELECTED_ANNOTATION: hashlib.sha256(selected.encode()).hexdigest()[:16]})
 
     def __build_request_with_secrets(self, namespace, name, spec: dict):
         if 'password_secret' in spec:
@@ -21,28 +89,41 @@ class PSPHandler(BaseHandler):
             spec.pop('password_secret')
         return self.build_request(name, spec)
 
-    def on_create(self, namespace: str, name: str, spec: dict, logger):  # pylint: disable=missing-function-docstring
-        spec = self.__build_request_with_secrets(namespace, name, spec)
-        return {self.id_key: self.uptime_robot.create_psp(logger, spec)}
+    def on_create(self, namespace: str, name: str, spec: dict, logger, status=None):  # pylint: disable=missing-function-docstring
+        request, selected = self.__build_request_with_monitors(namespace, name, spec)
+        return self.__status(self.create_object(namespace, name, request, logger, status),
+                             request, selected)
 
-    def on_update(self, namespace: str, name: str, spec: dict, status: dict, logger):  # pylint: disable=missing-function-docstring disable=too-many-arguments
-        uid = self.get_identifier(status)
+    def on_update(self, namespace: str, name: str, spec: dict, status: dict, logger, diff):  # pylint: disable=missing-function-docstring disable=too-many-arguments
+        uid = self.confirmed_identifier(namespace, name, status)
         if uid == -1:
             raise kopf.PermanentError(
                 "was not able to determine the PSP ID for update")
 
-        spec = self.__build_request_with_secrets(namespace, name, spec)
-        uid = self.uptime_robot.update_psp(logger, uid, spec)
+        # changes of the selected monitors arrive as a change of the selection annotation,
+        # a change of other fields of the spec keeps the stored selection
+        result = status.get(self.update_event_name) or status.get(self.create_event_name) or {}
+        kept = (result.get(SELECTED_KEY) or None
+                if diff and not any(selection_changed(path) for _, path, _, _ in diff) else None)
+        request, selected = self.__build_request_with_monitors(namespace, name, spec, kept)
+        uid = self.uptime_robot(namespace).update_psp(logger, uid, request)
 
-        return {self.id_key: uid}
+        return self.__status(uid, request, selected)
 
-    def on_delete(self, status: dict, logger):  # pylint: disable=missing-function-docstring
+    def on_delete(self, namespace: str, name: str, status: dict, logger):  # pylint: disable=missing-function-docstring
         identifier = self.get_identifier(status)
         if identifier == -1:
             raise kopf.PermanentError(
                 "was not able to determine the PSP ID for deletion")
         try:
-            self.uptime_robot.delete_psp(logger, identifier)
+            self.delete_object(namespace, name, identifier, logger, forget=True)
+        except kopf.TemporaryError:
+            raise
         except Exception as error:
             raise kopf.PermanentError(
                 f"deleting PSP failed: {error}") from error
+
+
+def selection_changed(path) -> bool:
+    """Check if a field of a status page diff may change the monitors it selects"""
+    return len(path) < 2 or path[0] != 'spec' or path[1] == 'monitorSelector'
@@ -0,0 +1,209 @@
+"""Offline plan of the changes the operator would make in UptimeRobot.
+Lists all resources and Ingresses and compares them with a bulk listing of the UptimeRobot
+objects, without changing anything. Run with `python ur_operator/plan.py`."""
+import argparse
+import logging
+import sys
+from collections import Counter
+
+import kopf
+from kubernetes.client import ApiClient, CustomObjectsApi, NetworkingV1Api
+from config import Config
+from crds import BaseCrd, MonitorV1Beta1, AlertContactV1Beta1, MaintenanceWindowV1Beta1, PspV1Beta1
+from api import UptimeRobotPool
+from api.inventory import MONITOR, MWINDOW, ALERT_CONTACT, PSP
+from handlers.common.handler_base import SPEC_HASH_KEY, spec_hash
+from handlers.common.planner import EDIT, RECREATE, plan_update
+from handlers.common.references import indexed_identifier
+from handlers.ingress import MONITORS_ANNOTATION, direct_monitors, ingress_monitor_specs, owned_by
+from handlers.monitors import with_defaults
+
+CREATE = 'create'
+DELETE = 'delete'
+# UptimeRobot API calls needed per action
+COSTS = {CREATE: 1, EDIT: 1, RECREATE: 2, DELETE: 1}
+PAGE_SIZE = 100
+
+# kind in the inventory, status key of the ID and suffix of the kopf handler names in handlers.py
+RESOURCES = {
+    MonitorV1Beta1: (MONITOR, 'monitor_id', 'mon'),
+    MaintenanceWindowV1Beta1: (MWINDOW, 'mw_id', 'mw'),
+    AlertContactV1Beta1: (ALERT_CONTACT, 'ac_id', 'ac'),
+    PspV1Beta1: (PSP, 'psp_id', 'psp')
+}
+
+LOGGER = logging.getLogger('plan')
+
+
+def paginate(list_fn, **kwargs):
+    """Iterate over the items of a Kubernetes LIST page by page"""
+    token = None
+    while True:
+        resp = list_fn(limit=PAGE_SIZE, _continue=token, **kwargs)
+        if not isinstance(resp, dict):
+            resp = ApiClient().sanitize_for_serialization(resp)
+        yield from resp['items']
+        token = resp['metadata'].get('continue')
+        if not token:
+            return
+
+
+class Planner:
+    """Compares resources with the UptimeRobot objects of their accounts
+    and writes a line per planned change to out"""
+
+    def __init__(self, config: Config, out):
+        self.config = config
+        self.out = out
+        # planning changes nothing, it must not create or touch the journal of the operator
+        self.uptime_robots = UptimeRobotPool(config, journaled=False)
+        self.custom_objects_api = CustomObjectsApi()
+        self.networking_api = NetworkingV1Api()
+        self.counts = Counter()
+        self.__seen: dict[str, set[str]] = {}
+
+    def __report(self, action: str, crd: type[BaseCrd], namespace: str, name: str, detail=''):
+        self.counts[action] += 1
+        print(f'{action.upper():<9} {crd.kind()} {namespace}/{name}{detail} '
+              f'[{COSTS[action]} API call{"s" if COSTS[action] > 1 else ""}]',
+              file=self.out, flush=True)
+
+    def __list(self, crd: type[BaseCrd], namespace: str | None):
+        if namespace:
+            return paginate(self.custom_objects_api.list_namespaced_custom_object,
+                            group=crd.group(), version=crd.version(),
+                            plural=crd.plural(), namespace=namespace)
+        return paginate(self.custom_objects_api.list_cluster_custom_object,
+                        group=crd.group(), version=crd.version(), plural=crd.plural())
+
+    def __desired_request(self, crd: type[BaseCrd], name: str, spec: dict) -> dict:
+        if crd is MonitorV1Beta1:
+            spec = with_defaults(self.config, spec, LOGGER)
+        request = crd.spec_to_request_dict(name, spec)
+        request.pop('monitor_selector', None)
+        return request
+
+    def plan_resource(self, crd: type[BaseCrd], namespace: str, name: str,
+                      spec: dict, status: dict):
+        """Report the change the operator would make for a single resource"""
+        kind, id_key, suffix = RESOURCES[crd]
+        try:
+            request = self.__desired_request(crd, name, spec)
+        except (KeyError, ValueError) as error:
+            print(f'INVALID   {crd.kind()} {namespace}/{name}: {error!r}',
+                  file=self.out, flush=True)
+            return
+
+        uptime_robot = self.uptime_robots.for_namespace(namespace)
+        uptime_robot.load_inventory(kind, restore=False)
+        uid = indexed_identifier(status, (f'on_create_{suffix}', f'on_update_{suffix}'), id_key)
+        record = None if uid is None else uptime_robot.inventory.get(kind, uid)
+        if record is None:
+            self.__report(CREATE, crd, namespace, name)
+            return
+        self.__seen.setdefault(uptime_robot.fingerprint, set()).add(f'{kind}/{uid}')
+
+        drifted = {k for k in crd.drift_fields()
+                   if k in request and str(record.get(k)) != str(request[k])}
+        results = [status.get(f'on_update_{suffix}'), status.get(f'on_create_{suffix}')]
+        applied_hash = next((r.get(SPEC_HASH_KEY) for r in results if r), None)
+        if drifted:
+            action = plan_update(crd, request, drifted)
+            self.__report(action, crd, namespace, name, f' ({uid}): {", ".join(sorted(drifted))}')
+        elif applied_hash not in (None, spec_hash(crd, request)):
+            self.__report(EDIT, crd, namespace, name, f' ({uid}): spec changed')
+
+    def plan_ingresses(self, monitors: list[dict], namespace: str | None) -> dict:
+        """Report the monitors created and deleted for Ingresses, returns the
+        specs the existing monitors of Ingresses would be updated with"""
+        existing = {(m['metadata']['namespace'], m['metadata']['name']): m for m in monitors}
+        ingresses = (paginate(self.networking_api.list_namespaced_ingress, namespace=namespace)
+                     if namespace else
+                     paginate(self.networking_api.list_ingress_for_all_namespaces))
+
+        overrides = {}
+        for ingress in ingresses:
+            ingress_namespace = ingress['metadata']['namespace']
+            ingress_name = ingress['metadata']['name']
+            annotations = ingress['metadata'].get('annotations') or {}
+            specs = ingress_monitor_specs(self.config, ingress_name, annotations,
+                                          ingress['spec'], LOGGER)
+            if self.config.INGRESS_DIRECT_MODE:
+                self.__plan_direct(ingress_namespace, ingress_name, annotations, specs)
+                if MONITORS_ANNOTATION in annotations:
+                    continue
+                # the UptimeRobotMonitor objects of the ingress are replaced
+                specs = {}
+
+            for name, spec in specs.items():
+                if (ingress_namespace, name) in existing:
+                    overrides[(ingress_namespace, name)] = spec
+                else:
+                    self.__report(CREATE, MonitorV1Beta1, ingress_namespace, name,
+                                  f' for ingress {ingress_name}')
+            for (monitor_namespace, name), monitor in existing.items():
+                if (monitor_namespace == ingress_namespace and owned_by(ingress_name, monitor)
+                        and name not in specs):
+                    self.__report(DELETE, MonitorV1Beta1, monitor_namespace, name,
+                                  f' of ingress {ingress_name}')
+        return overrides
+
+    def __plan_direct(self, namespace: str, ingress_name: str, annotations: dict, specs: dict):
+        """Report the monitors an ingress in direct mode creates, edits and deletes"""
+        current = direct_monitors(annotations)
+        for name, spec in specs.items():
+            if name in current:
+                self.plan_resource(MonitorV1Beta1, namespace, name, spec,
+                                   {'on_create_mon': {'monitor_id': current[name]['id']}})
+            else:
+                self.__report(CREATE, MonitorV1Beta1, namespace, name,
+                              f' for ingress {ingress_name}')
+        for name in current.keys() - specs.keys():
+            self.__report(DELETE, MonitorV1Beta1, namespace, name, f' of ingress {ingress_name}')
+
+    def run(self, namespace: str | None = None):
+        """Plan the changes for all resources, optionally only the ones of a namespace"""
+        for crd in RESOURCES:
+            objects = self.__list(crd, namespace)
+            overrides = {}
+            if crd is MonitorV1Beta1 and not self.config.DISABLE_INGRESS_HANDLING:
+                objects = list(objects)
+                overrides = self.plan_ingresses(objects, namespace)
+
+            for obj in objects:
+                key = (obj['metadata']['namespace'], obj['metadata']['name'])
+                try:
+                    self.plan_resource(crd, *key, overrides.get(key, obj.get('spec') or {}),
+                                       obj.get('status') or {})
+                except kopf.TemporaryError as error:
+                    print(f'SKIPPED   {crd.kind()} {key[0]}/{key[1]}: {error}',
+                          file=self.out, flush=True)
+
+        if namespace is None:
+            for uptime_robot in self.uptime_robots.clients():
+                seen = self.__seen.get(uptime_robot.fingerprint, set())
+                for kind, _, _ in RESOURCES.values():
+                    unmanaged = {f'{kind}/{uid}' for uid in uptime_robot.inventory.ids(kind)} - seen
+                    if unmanaged:
+                        print(f'# {len(unmanaged)} {kind} objects of account '
+                              f'{uptime_robot.fingerprint} are not managed by any resource',
+                              file=self.out, flush=True)
+
+        calls = sum(COSTS[action] * count for action, count in self.counts.items())
+        summary = ', '.join(f'{count} to {action}' for action, count in sorted(self.counts.items()))
+        print(f'# {summary or "no changes"}, {calls} UptimeRobot API calls',
+              file=self.out, flush=True)
+
+
+def main():  # pylint: disable=missing-function-docstring
+    parser = argparse.ArgumentParser(
+        description='Show the changes the operator would make in UptimeRobot without making them')
+    parser.add_argument('-n', '--namespace', help='only plan the resources of this namespace')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    Planner(Config(), sys.stdout).run(args.namespace)
+
+
+if __name__ == '__main__':
+    main()
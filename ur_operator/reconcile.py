@@ -0,0 +1,280 @@
+"""Batch reconciliation of all resources without a long-running operator.
+Lists all Ingresses and resources page by page, reconciles them with the same handlers the
+operator uses against a bulk listing of the UptimeRobot objects, writes their statuses and
+exits, e.g. as a Kubernetes CronJob. Run with `python ur_operator/reconcile.py --once`."""
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import kopf
+from kubernetes.client import CustomObjectsApi, NetworkingV1Api
+from config import Config
+from crds import BaseCrd, MonitorV1Beta1, AlertContactV1Beta1, MaintenanceWindowV1Beta1, PspV1Beta1
+from api import UptimeRobotPool
+from api.inventory import ALERT_CONTACT, MWINDOW
+from api.k8s import register_crds
+from handlers import MonitorHandler, AlertContactHandler
+from handlers import MaintananceWindowHandler, PSPHandler, IngressHandler
+from handlers.common.dedup import DEDUP_KEY
+from handlers.common.references import indexed_identifier, indexed_refs, lookup
+from handlers.common.selectors import matches_selector
+from handlers.monitors import indexed_record, with_defaults
+from handlers.public_status_page import SELECTED_KEY
+from plan import RESOURCES, paginate
+
+# the same bookkeeping kopf uses, so a cluster can switch between batch mode and the operator
+SETTINGS = kopf.OperatorSettings()
+FINALIZER = SETTINGS.persistence.finalizer
+DIFFBASE = SETTINGS.persistence.diffbase_storage
+
+LOGGER = logging.getLogger('reconcile')
+
+
+class ObjectLogger(logging.LoggerAdapter):
+    """Prefixes log messages with the resource they are about, like kopf does"""
+
+    def process(self, msg, kwargs):
+        return f'[{self.extra["resource"]}] {msg}', kwargs
+
+
+def bounded_map(fn, items, concurrency: int):
+    """Call fn for all items with at most concurrency calls at a time and yield the results
+    as they complete. Items are only consumed as calls complete, so a paginated listing is
+    never held in memory completely."""
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+            pending.add(executor.submit(fn, item))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def spec_diff(old: dict, new: dict) -> list[tuple]:
+    """Build a kopf diff of the top-level fields of two specs"""
+    diff = []
+    for key in sorted(old.keys() | new.keys()):
+        if key not in new:
+            diff.append(('remove', ('spec', key), old[key], None))
+        elif key not in old:
+            diff.append(('add', ('spec', key), None, new[key]))
+        elif old[key] != new[key]:
+            diff.append(('change', ('spec', key), old[key], new[key]))
+    return diff
+
+
+class BatchReconciler:
+    """Reconciles all resources once with the handlers of the operator. Resources are
+    reconciled in the order they reference each other: AlertContacts and MaintenanceWindows,
+    Ingresses, monitors, and status pages last."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.uptime_robots = UptimeRobotPool(config)
+        self.custom_objects_api = CustomObjectsApi()
+        self.networking_api = NetworkingV1Api()
+        # plain dicts in place of the kopf indexes of the operator, filled in phase by phase
+        self.ids = {ALERT_CONTACT: {}, MWINDOW: {}}
+        self.monitors: dict[str, list] = {}
+        self.shares: dict[str, list] = {}
+        self.failed: list[str] = []
+        self.__lock = threading.Lock()
+
+        def event_names(crd):
+            suffix = RESOURCES[crd][2]
+            return f'on_create_{suffix}', f'on_update_{suffix}'
+
+        self.handlers = {
+            AlertContactV1Beta1: AlertContactHandler(
+                self.uptime_robots, *event_names(AlertContactV1Beta1)),
+            MaintenanceWindowV1Beta1: MaintananceWindowHandler(
+                self.uptime_robots, *event_names(MaintenanceWindowV1Beta1)),
+            MonitorV1Beta1: MonitorHandler(
+                self.uptime_robots, *event_names(MonitorV1Beta1), self.ids, {}, self.shares),
+            PspV1Beta1: PSPHandler(
+                self.uptime_robots, *event_names(PspV1Beta1), self.monitors, {})
+        }
+        self.ingress_handler = IngressHandler(self.uptime_robots, 'on_create_ingress',
+                                              'on_update_ingress', self.ids)
+
+    def __fail(self, resource: str, logger, error):
+        logger.error(f'reconciling failed: {error}')
+        with self.__lock:
+            self.failed.append(resource)
+
+    def __stale(self, crd: type[BaseCrd], namespace: str, name: str, spec: dict,
+                status: dict) -> bool:
+        """Check if the references of a resource were resolved to other IDs than the current
+        ones, which the operator notices through its indexes"""
+        handler = self.handlers[crd]
+        events = (handler.create_event_name, handler.update_event_name)
+        if crd is MonitorV1Beta1:
+            return any(lookup(self.ids[kind], (ref_namespace, ref)) != resolved
+                       for (ref_namespace, kind, ref), (_, resolved)
+                       in indexed_refs(namespace, name, spec, status, events).items())
+        if crd is PspV1Beta1 and 'monitorSelector' in spec:
+            result = status.get(handler.update_event_name) or status.get(
+                handler.create_event_name) or {}
+            selected = sorted({uid for _, labels, uid in self.monitors.get(namespace, [])
+                               if matches_selector(spec['monitorSelector'], labels)}, key=int)
+            return result.get(SELECTED_KEY) != selected
+        return False
+
+    def reconcile(self, crd: type[BaseCrd], obj: dict):
+        """Reconcile a single resource and write its status, returns its namespace, name,
+        labels and UptimeRobot ID afterwards"""
+        handler = self.handlers[crd]
+        metadata = obj['metadata']
+        namespace, name = metadata['namespace'], metadata['name']
+        logger = ObjectLogger(LOGGER, {'resource': f'{namespace}/{name}'})
+        body = kopf.Body(obj)
+        spec = dict(obj.get('spec') or {})
+        status = dict(obj.get('status') or {})
+        events = (handler.create_event_name, handler.update_event_name)
+        uid = indexed_identifier(status, events, handler.id_key)
+        finalizers = list(metadata.get('finalizers') or [])
+        patch = kopf.Patch()
+
+        try:
+            if metadata.get('deletionTimestamp'):
+                if FINALIZER in finalizers:
+                    if uid is not None:
+                        handler.on_delete(namespace, name, status, logger)
+                    patch.metadata['finalizers'] = [f for f in finalizers if f != FINALIZER]
+                    handler.k8s.patch_resource(namespace, name, dict(patch))
+                return namespace, name, {}, None
+
+            essence = DIFFBASE.build(body=body)
+            if crd is MonitorV1Beta1:
+                # the monitor handler writes the defaults into the spec
+                essence['spec'] = MonitorV1Beta1.validate_spec(
+                    with_defaults(self.config, spec, logger))
+            old = DIFFBASE.fetch(body=body)
+
+            if uid is None:
+                patch.status[handler.create_event_name] = handler.on_create(
+                    namespace, name, spec, logger, status)
+            elif ((old is not None and old.get('spec') != essence['spec'])
+                  or self.__stale(crd, namespace, name, spec, status)):
+                patch.status[handler.update_event_name] = handler.on_update(
+                    namespace, name, spec, status, logger=logger,
+                    diff=spec_diff(dict((old or {}).get('spec') or spec), spec))
+            else:
+                handler.on_resume(namespace, name, spec, status, patch, logger)
+
+            if FINALIZER not in finalizers:
+                patch.metadata['finalizers'] = finalizers + [FINALIZER]
+            DIFFBASE.store(body=body, patch=patch, essence=essence)
+            handler.k8s.patch_resource(namespace, name, dict(patch))
+        except Exception as error:  # pylint: disable=broad-except
+            # kopf would retry the resource, the next pass does
+            self.__fail(f'{crd.kind()} {namespace}/{name}', logger, error)
+            return namespace, name, dict(metadata.get('labels') or {}), uid
+
+        status.update(patch.get('status') or {})
+        return (namespace, name, dict(metadata.get('labels') or {}),
+                indexed_identifier(status, events, handler.id_key))
+
+    def reconcile_ingress(self, ingress: dict):
+        """Create, update and delete the monitors of an Ingress"""
+        metadata = ingress['metadata']
+        namespace, name = metadata['namespace'], metadata['name']
+        annotations = metadata.get('annotations') or {}
+        logger = ObjectLogger(LOGGER, {'resource': f'{namespace}/{name}'})
+        finalizers = list(metadata.get('finalizers') or [])
+        patch = kopf.Patch()
+        try:
+            if metadata.get('deletionTimestamp'):
+                if FINALIZER in finalizers:
+                    self.ingress_handler.on_delete(name, namespace, annotations, logger)
+                    patch.metadata['finalizers'] = [f for f in finalizers if f != FINALIZER]
+            else:
+                self.ingress_handler.on_update(name, namespace, annotations, ingress['spec'],
+                                               logger, patch)
+                if self.config.INGRESS_DIRECT_MODE and FINALIZER not in finalizers:
+                    # in direct mode the monitors of deleted ingresses are deleted by the next run
+                    patch.metadata['finalizers'] = finalizers + [FINALIZER]
+            if patch:
+                self.networking_api.patch_namespaced_ingress(name, namespace, dict(patch))
+        except Exception as error:  # pylint: disable=broad-except
+            self.__fail(f'Ingress {namespace}/{name}', logger, error)
+
+    def __list(self, crd: type[BaseCrd]):
+        return paginate(self.custom_objects_api.list_cluster_custom_object,
+                        group=crd.group(), version=crd.version(), plural=crd.plural())
+
+    def run(self):
+        """Reconcile all resources once, returns the resources that failed"""
+        by_kind = {handler.kind: handler for handler in self.handlers.values()}
+        self.uptime_robots.replay_journal(LOGGER, lambda kind, namespace, name:
+                                          by_kind[kind].journaled_orphan(namespace, name))
+        concurrency = self.config.BATCH_CONCURRENCY
+
+        for crd, kind in ((AlertContactV1Beta1, ALERT_CONTACT),
+                          (MaintenanceWindowV1Beta1, MWINDOW)):
+            results = bounded_map(lambda obj, crd=crd: self.reconcile(crd, obj),
+                                  self.__list(crd), concurrency)
+            for namespace, name, _, uid in results:
+                if uid is not None:
+                    self.ids[kind][(namespace, name)] = [uid]
+
+        # ingresses in direct mode reference AlertContacts and MaintenanceWindows as well
+        if not self.config.DISABLE_INGRESS_HANDLING:
+            ingresses = paginate(self.networking_api.list_ingress_for_all_namespaces)
+            for _ in bounded_map(self.reconcile_ingress, ingresses, concurrency):
+                pass
+
+        # monitors sharing an UptimeRobot monitor must know about each other before any of
+        # them is deleted, so their statuses are listed upfront
+        handler = self.handlers[MonitorV1Beta1]
+        for obj in self.__list(MonitorV1Beta1):
+            status = obj.get('status') or {}
+            result = (status.get(handler.update_event_name)
+                      or status.get(handler.create_event_name) or {})
+            if DEDUP_KEY in result and handler.id_key in result:
+                self.shares.setdefault(result[DEDUP_KEY], []).append(indexed_record(
+                    obj['metadata']['namespace'], obj['metadata']['name'], obj['metadata'],
+                    obj.get('spec') or {}, status,
+                    (handler.create_event_name, handler.update_event_name)))
+
+        results = bounded_map(lambda obj: self.reconcile(MonitorV1Beta1, obj),
+                              self.__list(MonitorV1Beta1), concurrency)
+        for namespace, name, labels, uid in results:
+            if uid is not None:
+                self.monitors.setdefault(namespace, []).append((name, labels, uid))
+
+        for _ in bounded_map(lambda obj: self.reconcile(PspV1Beta1, obj),
+                             self.__list(PspV1Beta1), concurrency):
+            pass
+
+        if self.uptime_robots.snapshot is not None:
+            self.uptime_robots.snapshot.save(self.uptime_robots.clients())
+        return self.failed
+
+
+def main():  # pylint: disable=missing-function-docstring
+    parser = argparse.ArgumentParser(
+        description='Reconcile all resources with UptimeRobot without a long-running operator')
+    parser.add_argument('--once', action='store_true',
+                        help='exit after a single pass, e.g. in a CronJob')
+    parser.add_argument('--interval', type=float, default=300,
+                        help='seconds between two passes unless --once is given')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    register_crds(LOGGER)
+    while True:
+        failed = BatchReconciler(Config()).run()
+        LOGGER.info(f'reconciliation finished, {len(failed)} resources failed')
+        if args.once:
+            sys.exit(1 if failed else 0)
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
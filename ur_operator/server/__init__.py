@@ -0,0 +1,5 @@
+"""HTTP endpoints the operator serves besides the ones of kopf"""
+from .alerts import AlertReceiver, AlertServer
+from .query import MonitorQuery, QueryServer
+
+__all__ = ['AlertReceiver', 'AlertServer', 'MonitorQuery', 'QueryServer']
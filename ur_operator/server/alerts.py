@@ -0,0 +1,144 @@
+"""Receiver for the alerts UptimeRobot pushes to a web-hook alert contact. The state of a
+monitor is written into the status of its UptimeRobotMonitors as it changes, without polling."""
+import hmac
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from api.debouncer import Debouncer
+
+# status key the latest alert of a monitor is stored under
+ALERT_KEY = 'alert'
+# *alertType* of the web-hook
+ALERT_STATES = {'1': 'DOWN', '2': 'UP', '98': 'STARTED', '99': 'PAUSED'}
+MAX_BODY = 64 * 1024
+
+
+class AlertReceiver:
+    """Applies alerts to the status of the UptimeRobotMonitors using the alerting monitor.
+    monitor_ids is the kopf index of the records of monitors by UptimeRobot ID.
+    Alerts for the same monitor within window seconds are coalesced into a single patch
+    with the latest of them."""
+
+    def __init__(self, k8s, monitor_ids, window: float):
+        self.k8s = k8s
+        self.monitor_ids = monitor_ids
+        self.__latest: dict[tuple[str, str], dict] = {}
+        self.__lock = threading.Lock()
+        self.__debouncer = Debouncer(self.__flush, window)
+
+    @staticmethod
+    def alert(params: dict) -> dict:
+        """Translate the parameters of a web-hook call into the alert stored in the status"""
+        try:
+            changed_at = datetime.fromtimestamp(int(params['alertDateTime']), timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            changed_at = datetime.now(timezone.utc)
+        return {
+            'state': (ALERT_STATES.get(str(params.get('alertType')))
+                      or str(params.get('alertTypeFriendlyName') or 'UNKNOWN').upper()),
+            'lastChange': changed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'reason': str(params.get('alertDetails') or '')
+        }
+
+    def receive(self, params: dict) -> int:
+        """Apply an alert to the monitors using the UptimeRobot monitor it was sent for,
+        returns their number"""
+        uid = str(params.get('monitorID') or '')
+        if not uid:
+            raise ValueError('monitorID is missing')
+        alert = self.alert(params)
+
+        owners = self.monitor_ids.get(uid, [])
+        for record in owners:
+            # alerts may arrive out of order, also after a newer one has already been written
+            if record.alerted_at is not None and record.alerted_at > alert['lastChange']:
+                continue
+            with self.__lock:
+                latest = self.__latest.get(record.key)
+                if latest is None or latest['lastChange'] <= alert['lastChange']:
+                    self.__latest[record.key] = alert
+            self.__debouncer.trigger(record.key)
+        if not owners:
+            logging.debug(f'ignoring alert for unknown monitor {uid}')
+        return len(owners)
+
+    def __flush(self, key: tuple[str, str]):
+        with self.__lock:
+            alert = self.__latest.pop(key, None)
+        if alert is not None:
+            self.k8s.patch_resource(*key, {'status': {ALERT_KEY: alert}})
+
+
+class AlertServer:
+    """Serves the web-hook of UptimeRobot alerts at /alerts in a background thread.
+    UptimeRobot sends the alert as query parameters or, with "Send as JSON" enabled, as a JSON
+    body. Only calls carrying the token as token query parameter are accepted."""
+
+    def __init__(self, receiver: AlertReceiver, token: str, host: str, port: int):
+        if not token:
+            raise ValueError('the alert webhook requires a token')
+        self.receiver = receiver
+
+        class Handler(BaseHTTPRequestHandler):  # pylint: disable=missing-class-docstring
+            def do_GET(self):  # pylint: disable=invalid-name,missing-function-docstring
+                self.__handle({})
+
+            def do_POST(self):  # pylint: disable=invalid-name,missing-function-docstring
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY:
+                    self.__respond(413, {'error': 'alert too large'})
+                    return
+                data = self.rfile.read(length).decode(errors='replace')
+                try:
+                    if 'json' in (self.headers.get('Content-Type') or ''):
+                        body = json.loads(data or '{}')
+                    else:
+                        body = {k: v[-1] for k, v in parse_qs(data).items()}
+                except ValueError:
+                    self.__respond(400, {'error': 'invalid body'})
+                    return
+                self.__handle(body if isinstance(body, dict) else {})
+
+            def __handle(self, body: dict):
+                url = urlparse(self.path)
+                if url.path.rstrip('/') != '/alerts':
+                    self.__respond(404, {'error': 'not found'})
+                    return
+                params = {**{k: v[-1] for k, v in parse_qs(url.query).items()}, **body}
+                if not hmac.compare_digest(str(params.get('token', '')), token):
+                    self.__respond(403, {'error': 'invalid token'})
+                    return
+                try:
+                    self.__respond(200, {'monitors': receiver.receive(params)})
+                except ValueError as error:
+                    self.__respond(400, {'error': str(error)})
+
+            def __respond(self, code: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                logging.debug(f'alert webhook: {format % args}')
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.__thread = None
+
+    def start(self):
+        """Serve requests in a background thread"""
+        self.__thread = threading.Thread(target=self.server.serve_forever,
+                                         name='alert-webhook', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop serving requests"""
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,160 @@
+"""Read-only HTTP API over the monitors the operator knows, answered from its kopf index
+and the cached UptimeRobot inventory instead of calling the UptimeRobot API per reader"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import kopf
+from kubernetes.client.rest import ApiException
+from requests.exceptions import RequestException
+
+from api import UptimeRobotPool
+from api.inventory import MONITOR
+
+# status of a monitor as reported by getMonitors
+STATUSES = {'0': 'PAUSED', '1': 'NOT_CHECKED_YET', '2': 'UP', '8': 'SEEMS_DOWN', '9': 'DOWN'}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# marks namespaces and accounts whose inventory failed to load in the set of a request
+FAILED = 'failed'
+
+
+class MonitorQuery:
+    """Filters and paginates the monitors of the operator. records is the kopf index of the
+    records of monitors by namespace. Each account's inventory
+    is listed at most once every max_age seconds, however many readers there are."""
+
+    def __init__(self, ur: UptimeRobotPool, records, max_age: float):
+        self.uptime_robots = ur
+        self.records = records
+        self.max_age = max_age
+
+    def __inventory_record(self, namespace: str, uid: str | None, loaded: set) -> dict:
+        if uid is None or (FAILED, namespace) in loaded:
+            return {}
+        fingerprint = None
+        try:
+            uptime_robot = self.uptime_robots.for_namespace(namespace)
+            fingerprint = uptime_robot.fingerprint
+            if (FAILED, fingerprint) in loaded:
+                return {}
+            if fingerprint not in loaded:
+                uptime_robot.load_inventory(MONITOR, max_age=self.max_age)
+                loaded.add(fingerprint)
+        except (kopf.TemporaryError, RequestException, ApiException) as error:
+            # e.g. an unreadable API key secret, UptimeRobot or the deadline of a call failing,
+            # the other monitors of the namespace and account are not retried by this request
+            logging.warning(f'monitors of namespace {namespace} cannot be queried: {error}')
+            loaded.add((FAILED, namespace))
+            if fingerprint is not None:
+                loaded.add((FAILED, fingerprint))
+            return {}
+        return uptime_robot.inventory.get(MONITOR, uid) or {}
+
+    def query(self, namespace: str | None = None, ingress: str | None = None,  # pylint: disable=too-many-arguments
+              uid: str | None = None, status: str | None = None,
+              limit: int = DEFAULT_LIMIT, after: str | None = None) -> dict:
+        """Retrieve a page of monitors ordered by namespace and name. A page ends with a
+        continue token that is passed as after to retrieve the next one."""
+        namespaces = [namespace] if namespace else sorted(self.records)
+        after_key = tuple(after.partition('/')[::2]) if after else None
+        loaded: set = set()
+        items = []
+        for monitor_namespace in namespaces:
+            for monitor in sorted(self.records.get(monitor_namespace, []),
+                                  key=lambda monitor: monitor.name):
+                if ((after_key is not None and monitor.key <= after_key)
+                        or (ingress is not None and monitor.owner != ingress)
+                        or (uid is not None and monitor.uid != uid)):
+                    continue
+
+                record = self.__inventory_record(monitor_namespace, monitor.uid, loaded)
+                monitor_status = STATUSES.get(str(record.get('status')), 'UNKNOWN')
+                if monitor.uid is None:
+                    monitor_status = 'PENDING'
+                if status is not None and monitor_status != status:
+                    continue
+
+                if len(items) == limit:
+                    last = items[-1]
+                    return {'items': items, 'continue': f'{last["namespace"]}/{last["name"]}'}
+                items.append({
+                    'namespace': monitor_namespace,
+                    'name': monitor.name,
+                    'ingress': monitor.owner,
+                    'id': monitor.uid,
+                    'friendlyName': record.get('friendly_name'),
+                    'url': record.get('url', monitor.url),
+                    'status': monitor_status
+                })
+        return {'items': items, 'continue': None}
+
+
+class QueryServer:
+    """Serves GET /monitors with the query parameters namespace, ingress, id, status, limit
+    and continue in a background thread. If a metrics function is given, its Prometheus text
+    is served at GET /metrics."""
+
+    def __init__(self, query: MonitorQuery, host: str, port: int, metrics=None):
+        self.query = query
+
+        class Handler(BaseHTTPRequestHandler):  # pylint: disable=missing-class-docstring
+            def do_GET(self):  # pylint: disable=invalid-name,missing-function-docstring
+                url = urlparse(self.path)
+                if url.path.rstrip('/') == '/metrics' and metrics is not None:
+                    data = metrics().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                if url.path.rstrip('/') != '/monitors':
+                    self.__respond(404, {'error': 'not found'})
+                    return
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    limit = int(params.get('limit', DEFAULT_LIMIT))
+                    if not 0 < limit <= MAX_LIMIT:
+                        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+                except ValueError as error:
+                    self.__respond(400, {'error': str(error)})
+                    return
+                try:
+                    page = query.query(
+                        namespace=params.get('namespace'), ingress=params.get('ingress'),
+                        uid=params.get('id'), status=params.get('status'),
+                        limit=limit, after=params.get('continue'))
+                except Exception as error:  # pylint: disable=broad-except
+                    logging.exception(f'failed to query monitors: {error}')
+                    self.__respond(503, {'error': 'monitors cannot be queried right now'})
+                    return
+                self.__respond(200, page)
+
+            def __respond(self, code: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                logging.debug(f'query API: {format % args}')
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.__thread = None
+
+    def start(self):
+        """Serve requests in a background thread"""
+        self.__thread = threading.Thread(target=self.server.serve_forever,
+                                         name='query-api', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop serving requests"""
+        self.server.shutdown()
+        self.server.server_close()